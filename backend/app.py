@@ -1,50 +1,36 @@
 import os
-import json
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from etest_routes import etest_bp
+from task_routes import tasks_bp
+from request_profiler import init_profiling
+from dataset import get_dataset
 
 app = Flask(__name__)
 CORS(app)
 
 # Register the etest blueprint
 app.register_blueprint(etest_bp)
+app.register_blueprint(tasks_bp)
+
+# opt-in request profiling; a no-op unless ETEST_PROFILE_TOKEN is set
+init_profiling(app)
 
 DEFAULT_JSON_PATH = os.environ.get(
     "ETEST_JSON_PATH",
     "/etestnew/SPECS/usr/aquq/etest_app/output.json"
 )
 
-_JSON_CACHE = {"path": None, "mtime": None, "data": None, "filtered": None}
-
 def _load_json_data(path):
-    """Load + cache JSON, keep only devices with non-empty mods."""
-    global _JSON_CACHE
-    try:
-        st = os.stat(path)
-    except FileNotFoundError:
+    """
+    Cached dataset (output.json or sharded folder) plus the names of devices
+    with a non-empty mod list.
+    """
+    dataset = get_dataset(path)
+    if dataset is None:
         return None, None
-
-    if (
-        _JSON_CACHE["path"] != path
-        or _JSON_CACHE["mtime"] != st.st_mtime
-        or _JSON_CACHE["data"] is None
-    ):
-        with open(path, "r") as f:
-            raw = json.load(f)
-        # Filter: device must have a non-empty mod list
-        filtered = {
-            k: v
-            for k, v in raw.items()
-            if isinstance(v, dict)
-            and isinstance(v.get("mod"), list)
-            and len(v["mod"]) > 0
-        }
-        _JSON_CACHE.update(
-            {"path": path, "mtime": st.st_mtime, "data": raw, "filtered": filtered}
-        )
-
-    return _JSON_CACHE["data"], _JSON_CACHE["filtered"]
+    with_mods = [name for name in dataset if (dataset.meta(name) or {}).get("mod_count", 0) > 0]
+    return dataset, with_mods
 
 def _get_default_json_path():
     return os.environ.get("ETEST_JSON_PATH", DEFAULT_JSON_PATH)
@@ -60,13 +46,13 @@ def etest_json():
     }
     """
     path = request.args.get("path", _get_default_json_path())
-    raw, filtered = _load_json_data(path)
-    if raw is None:
+    dataset, with_mods = _load_json_data(path)
+    if dataset is None:
         return jsonify({"error": "file_not_found", "path": path}), 404
     return jsonify({
         "path": path,
-        "devices": sorted(filtered.keys()),
-        "count": len(filtered),
+        "devices": sorted(with_mods),
+        "count": len(with_mods),
     })
 
 @app.get("/api/etest/mods")
@@ -80,15 +66,16 @@ def etest_mods():
         return jsonify({"error": "missing_device_param"}), 400
 
     path = request.args.get("path", _get_default_json_path())
-    raw, filtered = _load_json_data(path)
-    if raw is None:
+    dataset = get_dataset(path)
+    if dataset is None:
         return jsonify({"error": "file_not_found", "path": path}), 404
 
-    entry = filtered.get(device)
-    if not entry:
+    # only this device's shard is read when the dataset is sharded
+    meta = dataset.meta(device)
+    if not meta or meta["mod_count"] == 0:
         return jsonify({"device": device, "mods": []})
 
-    return jsonify({"device": device, "mods": entry.get("mod", [])})
+    return jsonify({"device": device, "mods": dataset[device].get("mod", [])})
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", "8080"))
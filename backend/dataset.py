@@ -0,0 +1,259 @@
+# backend/dataset.py
+"""
+Dataset access shared by app.py and etest_routes.py.
+
+A dataset is either the monolithic output.json or a sharded folder written by
+helpler/device_dic.py --sharded (manifest.json + devices/<device>.json). Both
+are exposed as read-only {device: record} mappings and cached per path until
+the file (or manifest) on disk changes. Records are held as CompactRecord
+(see records.py); the parsed JSON is dropped as soon as it is converted.
+
+Every dataset carries device_hashes ({device: content hash}), so two
+versions can be compared device by device (diff_hashes). The last
+HISTORY_SIZE versions loaded for each path are remembered with their hashes,
+so changes_since() can tell a client what changed after the version it has.
+
+get_dataset() is safe under a threaded server: when a file changes, exactly
+one thread parses the new version while the others keep serving the previous
+one (or wait for it, if there is none yet).
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import deque
+from collections.abc import Mapping
+from typing import Optional
+from records import CompactRecord, compact_record
+
+# sharded layout written by helpler/json_store.py; test_module_deps.py checks both sides agree
+MANIFEST_NAME = "manifest.json"
+SHARD_FORMAT = 1
+HISTORY_SIZE = int(os.environ.get("ETEST_DATASET_HISTORY", "16"))  # versions kept per path for changes_since()
+
+
+def record_hash(record) -> str:
+    """Content hash of one parsed device record (key order does not matter)."""
+    blob = json.dumps(record, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(blob.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def diff_hashes(old: dict, new: dict):
+    """(added, removed, modified) device names between two device_hashes maps, each sorted."""
+    added = sorted(name for name in new if name not in old)
+    removed = sorted(name for name in old if name not in new)
+    modified = sorted(name for name, h in new.items() if name in old and old[name] != h)
+    return added, removed, modified
+
+
+def _mod_count(record) -> int:
+    if isinstance(record, CompactRecord):
+        return record.mod_count
+    mods = record.get("mod") if isinstance(record, dict) else None
+    return len(mods) if isinstance(mods, list) else 0
+
+
+class JsonDataset(Mapping):
+    """Whole output.json parsed in memory."""
+
+    kind = "json"
+
+    def __init__(self, path: str, data: dict, version: str, device_hashes: dict):
+        self.path = path
+        self.version = version
+        self.device_hashes = device_hashes
+        self._data = data
+
+    def meta(self, name: str) -> Optional[dict]:
+        record = self._data.get(name)
+        if record is None:
+            return None
+        prb = record.get("prb") if isinstance(record, Mapping) else None
+        return {"prb": prb, "mod_count": _mod_count(record)}
+
+    def __getitem__(self, name):
+        return self._data[name]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, name):
+        return name in self._data
+
+
+class ShardedDataset(Mapping):
+    """
+    Sharded folder: the manifest (names, mod counts, prb, hashes) is read
+    eagerly, each device shard only when that device is first accessed.
+    """
+
+    kind = "sharded"
+
+    def __init__(self, folder: str, manifest: dict, previous: Optional["ShardedDataset"] = None):
+        self.path = folder
+        self.version = manifest.get("version")
+        self._entries = manifest.get("devices", {})
+        self.device_hashes = {name: (entry or {}).get("sha256") for name, entry in self._entries.items()}
+        self._records = {}
+        if previous is not None:
+            # carry over already-read shards whose content did not change
+            for name, record in dict(previous._records).items():  # may grow in another thread
+                old = previous._entries.get(name) or {}
+                new = self._entries.get(name) or {}
+                if old.get("sha256") and old.get("sha256") == new.get("sha256"):
+                    self._records[name] = record
+
+    def meta(self, name: str) -> Optional[dict]:
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        return {"prb": entry.get("prb"), "mod_count": entry.get("mod_count", 0)}
+
+    def __getitem__(self, name):
+        record = self._records.get(name)
+        if record is not None:
+            return record
+        entry = self._entries[name]
+        with open(os.path.join(self.path, entry["file"]), "r", encoding="utf-8") as f:
+            record = compact_record(json.load(f))
+        self._records[name] = record
+        return record
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+
+def _locate(path: str):
+    """Return (kind, file_to_stat, folder_or_path)."""
+    if os.path.basename(path) == MANIFEST_NAME:
+        folder = os.path.dirname(path)
+        return "sharded", path, folder
+    if os.path.isdir(path):
+        return "sharded", os.path.join(path, MANIFEST_NAME), path
+    return "json", path, path
+
+
+def _load(kind: str, target: str, previous):
+    if kind == "sharded":
+        with open(os.path.join(target, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if not isinstance(manifest, dict) or manifest.get("format") != SHARD_FORMAT:
+            raise ValueError(f"Unsupported dataset manifest in: {target}")
+        prev = previous if isinstance(previous, ShardedDataset) else None
+        return ShardedDataset(target, manifest, prev)
+
+    with open(target, "rb") as f:
+        raw = f.read()
+    version = hashlib.sha256(raw).hexdigest()[:16]
+    data = json.loads(raw)
+    del raw
+    if not isinstance(data, dict):
+        raise ValueError(f"Top-level JSON must be an object: {target}")
+    hashes = {}
+    for name, record in data.items():
+        hashes[name] = record_hash(record)
+        data[name] = compact_record(record)  # replacing values while iterating is safe
+    return JsonDataset(target, data, version, hashes)
+
+
+class _Slot:
+    """Cache entry for one path; every field is guarded by cond."""
+
+    __slots__ = ("cond", "sig", "dataset", "loading", "history")
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.sig = None
+        self.dataset = None
+        self.loading = False  # a thread is parsing a new version
+        self.history = deque(maxlen=HISTORY_SIZE)  # (version, device_hashes), oldest first
+
+
+_CACHE = {}  # path -> _Slot
+_CACHE_LOCK = threading.Lock()
+
+
+def _slot(path: str) -> _Slot:
+    with _CACHE_LOCK:
+        slot = _CACHE.get(path)
+        if slot is None:
+            slot = _CACHE[path] = _Slot()
+        return slot
+
+
+def get_dataset(path: str):
+    """
+    Return the cached dataset for path, reloading when the file changed.
+    None if nothing exists at path.
+
+    Loads are single-flight: while one thread parses a new version, other
+    callers get the previous dataset, or block until the load finishes when
+    there is no previous one.
+    """
+    kind, stat_path, target = _locate(path)
+    try:
+        st = os.stat(stat_path)
+    except FileNotFoundError:
+        return None
+    # files are replaced atomically (temp file + rename), so a new
+    # inode/size/mtime always means a complete new file, never a torn one.
+    sig = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    slot = _slot(path)
+    with slot.cond:
+        while True:
+            if slot.sig == sig:
+                return slot.dataset
+            if not slot.loading:
+                break
+            if slot.dataset is not None:
+                return slot.dataset  # stale but complete; the reload is under way
+            slot.cond.wait()
+        slot.loading = True
+        previous = slot.dataset
+
+    try:
+        dataset = _load(kind, target, previous)
+    except BaseException:
+        with slot.cond:
+            slot.loading = False
+            slot.cond.notify_all()
+        raise
+
+    with slot.cond:
+        slot.sig = sig
+        slot.dataset = dataset
+        slot.loading = False
+        if not slot.history or slot.history[-1][0] != dataset.version:
+            slot.history.append((dataset.version, dataset.device_hashes))
+        slot.cond.notify_all()
+    return dataset
+
+
+def changes_since(path: str, since: str):
+    """
+    (dataset, diff) for the dataset at path, where diff is (added, removed,
+    modified) device names relative to version since, or None when since is
+    not in this path's history (the caller needs a full resync).
+    dataset is None if nothing exists at path.
+    """
+    dataset = get_dataset(path)
+    if dataset is None:
+        return None, None
+    if since == dataset.version:
+        return dataset, ([], [], [])
+    slot = _slot(path)
+    with slot.cond:
+        old = next((hashes for version, hashes in slot.history if version == since), None)
+    if old is None:
+        return dataset, None
+    return dataset, diff_hashes(old, dataset.device_hashes)
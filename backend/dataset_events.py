@@ -0,0 +1,207 @@
+# backend/dataset_events.py
+"""
+Change notifications for /api/etest/events (server-sent events).
+
+One DatasetWatcher per dataset path polls get_dataset() every
+ETEST_EVENTS_POLL seconds while at least one client listens. When the
+version changes it publishes {version, previous, changed, added, removed,
+modified, devices, timestamp}; the counts come from the datasets'
+per-device content hashes, and are null when there is no earlier readable
+version to compare with (the first load failed). Each SSE connection only
+waits on the watcher's condition, so any number of listeners costs one
+stat() per poll interval.
+
+At most ETEST_EVENTS_MAX_CLIENTS streams are open at once per process; a
+": ping" comment is sent after ETEST_EVENTS_HEARTBEAT idle seconds so
+proxies keep the connection and dead clients are noticed.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Iterator, Optional
+
+from dataset import get_dataset, diff_hashes
+
+POLL_SECONDS = float(os.environ.get("ETEST_EVENTS_POLL", "2"))
+HEARTBEAT_SECONDS = float(os.environ.get("ETEST_EVENTS_HEARTBEAT", "15"))
+MAX_CLIENTS = int(os.environ.get("ETEST_EVENTS_MAX_CLIENTS", "50"))
+RETRY_MS = 5000  # reconnect delay suggested to EventSource clients
+
+
+class TooManyListeners(Exception):
+    pass
+
+
+def _snapshot(path: str):
+    """
+    (version, device_hashes) of the dataset at path, (None, {}) if there is
+    none, (None, None) if it could not be loaded.
+    """
+    try:
+        dataset = get_dataset(path)
+    except Exception:
+        logging.exception("dataset at %s could not be loaded", path)
+        return None, None
+    if dataset is None:
+        return None, {}
+    return dataset.version, dict(dataset.device_hashes)
+
+
+class DatasetWatcher:
+    def __init__(self, path: str, poll: float = POLL_SECONDS):
+        self.path = path
+        self.poll = poll
+        self.cond = threading.Condition()
+        self.seq = 0          # bumped for every published event
+        self.event = None     # last published event
+        self.listeners = 0
+        self._thread = None
+        self._version, self._hashes = _snapshot(path)
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._version
+
+    def check(self) -> Optional[dict]:
+        """Publish and return an event if the dataset version changed since the last check."""
+        version, hashes = _snapshot(self.path)
+        if hashes is None or version == self._version:
+            return None  # unreadable right now (the last good hashes stay the baseline), or unchanged
+        if self._hashes is None:
+            # never loaded before: a diff against nothing would report every device as added
+            added = removed = modified = changed = None
+        else:
+            added, removed, modified = (len(names) for names in diff_hashes(self._hashes, hashes))
+            changed = added + removed + modified
+        event = {
+            "version": version,
+            "previous": self._version,
+            "changed": changed,
+            "added": added,
+            "removed": removed,
+            "modified": modified,
+            "devices": len(hashes),
+            "timestamp": time.time(),
+        }
+        self._version, self._hashes = version, hashes
+        with self.cond:
+            self.seq += 1
+            self.event = event
+            self.cond.notify_all()
+        return event
+
+    def _run(self) -> None:
+        while True:
+            with self.cond:
+                if not self.listeners:
+                    self._thread = None
+                    return
+            try:
+                self.check()
+            except Exception:
+                logging.exception("dataset watcher for %s failed", self.path)
+            time.sleep(self.poll)
+
+    def _attach(self) -> None:
+        # caller holds cond
+        self.listeners += 1
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="etest-dataset-watch", daemon=True)
+            self._thread.start()
+
+    def _detach(self) -> None:
+        with self.cond:
+            self.listeners -= 1
+
+    def stream(self, heartbeat: float = HEARTBEAT_SECONDS) -> Iterator[str]:
+        """SSE text for one client: a hello event, then one "dataset" event per change."""
+        with self.cond:
+            seq = self.seq
+        hello = {"version": self._version, "path": self.path, "timestamp": time.time()}
+        yield f"retry: {RETRY_MS}\nevent: hello\ndata: {json.dumps(hello)}\n\n"
+        while True:
+            with self.cond:
+                if self.seq == seq:
+                    self.cond.wait(heartbeat)
+                if self.seq == seq:
+                    event = None
+                else:
+                    seq, event = self.seq, self.event
+            if event is None:
+                yield ": ping\n\n"
+            else:
+                yield f"id: {seq}\nevent: dataset\ndata: {json.dumps(event)}\n\n"
+
+
+class _Stream:
+    """
+    Response iterable for one listener. The WSGI server calls close() when the
+    client goes away (or if the body was never started), which frees the slot.
+    """
+
+    def __init__(self, watcher: DatasetWatcher):
+        self._watcher = watcher
+        self._gen = watcher.stream()
+        self._closed = False
+
+    def __iter__(self):
+        return self._gen
+
+    def close(self) -> None:
+        global _open
+        if self._closed:
+            return
+        self._closed = True
+        self._gen.close()
+        watcher = self._watcher
+        watcher._detach()
+        with _lock:
+            _open -= 1
+            with watcher.cond:
+                if not watcher.listeners and _watchers.get(watcher.path) is watcher:
+                    del _watchers[watcher.path]  # nobody listens; do not keep one per typed path
+
+
+_watchers = {}  # path -> DatasetWatcher
+_lock = threading.Lock()
+_open = 0
+
+
+def open_stream(path: str) -> _Stream:
+    """
+    Register a listener for the dataset at path and return its SSE body.
+    Raises TooManyListeners when MAX_CLIENTS streams are already open.
+    """
+    with _lock:
+        _check_capacity()
+        watcher = _watchers.get(path)
+        if watcher is not None:
+            return _Stream(_attach(watcher))
+    # the first snapshot may parse the whole dataset: take it without holding _lock,
+    # so other streams can open and close meanwhile
+    fresh = DatasetWatcher(path)
+    with _lock:
+        _check_capacity()  # checked before inserting, so a refused listener leaves no idle watcher behind
+        return _Stream(_attach(_watchers.setdefault(path, fresh)))
+
+
+def _check_capacity() -> None:
+    # caller holds _lock
+    if _open >= MAX_CLIENTS:
+        raise TooManyListeners(f"too many event listeners ({MAX_CLIENTS})")
+
+
+def _attach(watcher: DatasetWatcher) -> DatasetWatcher:
+    # caller holds _lock
+    global _open
+    with watcher.cond:
+        watcher._attach()
+    _open += 1
+    return watcher
+
+
+def listener_count() -> int:
+    with _lock:
+        return _open
@@ -0,0 +1,331 @@
+# backend/device_index.py
+"""
+Columnar attribute table over a dataset's devices, for /api/etest/query.
+
+Built once per dataset version (on the first query) and kept per dataset
+path until the version changes:
+
+- string columns (name, prb, flatLocation): a hash index value -> row ids
+  and the sorted distinct values, so "eq"/"in" are dict lookups and glob
+  patterns ("c9fd_46*") only test the values sharing the literal prefix;
+- numeric columns (stepX_um, stepY_um, flatAngle_deg, mod_count,
+  die_count): values sorted once, so comparisons and ranges are two
+  binary searches;
+- mod: an inverted index mod name -> row ids over the sorted distinct mod
+  names, queried the same way as a string column.
+
+Every condition yields a sorted array of row ids; "and"/"or"/"not" combine
+them with NumPy set operations, so a query costs index lookups plus the
+size of the matches, not a scan over every record.
+
+Filter grammar (JSON):
+    {"and": [cond, ...]} | {"or": [cond, ...]} | {"not": cond}
+    {"field": "prb", "op": "eq", "value": "E12A"}
+ops: eq, ne, in, lt, le, gt, ge, between ([lo, hi], inclusive), like (glob
+pattern, string columns and mod), has (mod: exact name).
+"""
+import bisect
+import fnmatch
+import threading
+from collections.abc import Mapping
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from records import CompactRecord
+
+STRING_FIELDS = ("name", "prb", "flatLocation")
+NUMERIC_FIELDS = ("stepX_um", "stepY_um", "flatAngle_deg", "mod_count", "die_count")
+FIELDS = STRING_FIELDS + NUMERIC_FIELDS
+MAX_LIMIT = 10000
+_WILDCARDS = "*?["
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+
+class QueryError(Exception):
+    """Malformed query; answered with 400."""
+
+
+class _StringColumn:
+    def __init__(self, rows: Dict[str, list]):
+        """rows: value -> ascending row ids."""
+        self.index = {v: np.array(r, dtype=np.int64) for v, r in rows.items()}
+        self.sorted = sorted(self.index)
+
+    @classmethod
+    def from_values(cls, values: List[Optional[str]]) -> "_StringColumn":
+        rows: Dict[str, list] = {}
+        for i, v in enumerate(values):
+            if v is not None:
+                rows.setdefault(v, []).append(i)
+        return cls(rows)
+
+    def eq(self, value) -> np.ndarray:
+        return self.index.get(value, _EMPTY)
+
+    def like(self, pattern: str) -> np.ndarray:
+        if not any(ch in pattern for ch in _WILDCARDS):
+            return self.eq(pattern)
+        cut = min(pattern.find(ch) for ch in _WILDCARDS if ch in pattern)
+        prefix = pattern[:cut]
+        lo = bisect.bisect_left(self.sorted, prefix)
+        hi = bisect.bisect_left(self.sorted, prefix + "\U0010ffff") if prefix else len(self.sorted)
+        hits = [self.index[v] for v in self.sorted[lo:hi] if fnmatch.fnmatchcase(v, pattern)]
+        return np.unique(np.concatenate(hits)) if hits else _EMPTY
+
+    def cmp(self, op: str, value) -> np.ndarray:
+        if not isinstance(value, str):
+            raise QueryError(f"{op} on a string field needs a string value")
+        values = self.sorted
+        if op == "lt":
+            sel = values[:bisect.bisect_left(values, value)]
+        elif op == "le":
+            sel = values[:bisect.bisect_right(values, value)]
+        elif op == "gt":
+            sel = values[bisect.bisect_right(values, value):]
+        else:
+            sel = values[bisect.bisect_left(values, value):]
+        hits = [self.index[v] for v in sel]
+        return np.unique(np.concatenate(hits)) if hits else _EMPTY
+
+    def sort_keys(self, values: List[Optional[str]]):
+        rank = {v: i for i, v in enumerate(self.sorted)}
+        return np.array([rank.get(v, len(rank)) for v in values], dtype=np.int64)  # nulls last
+
+
+class _NumericColumn:
+    def __init__(self, values: List[Optional[float]]):
+        self.values = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        present = np.flatnonzero(~np.isnan(self.values))
+        order = present[np.argsort(self.values[present], kind="stable")]
+        self.order = order
+        self.sorted = self.values[order]
+
+    def _slice(self, lo: int, hi: int) -> np.ndarray:
+        return np.sort(self.order[lo:hi])
+
+    def range(self, low=None, high=None, low_open=False, high_open=False) -> np.ndarray:
+        lo = 0 if low is None else np.searchsorted(self.sorted, low, "right" if low_open else "left")
+        hi = len(self.sorted) if high is None else np.searchsorted(self.sorted, high, "left" if high_open else "right")
+        return self._slice(int(lo), int(hi)) if hi > lo else _EMPTY
+
+    def eq(self, value) -> np.ndarray:
+        return self.range(value, value)
+
+
+class DeviceIndex:
+    def __init__(self, dataset):
+        self.version = getattr(dataset, "version", None)
+        names: List[str] = []
+        strings = {f: [] for f in STRING_FIELDS}
+        numbers = {f: [] for f in NUMERIC_FIELDS}
+        mod_rows: Dict[str, list] = {}
+
+        for row, (name, record) in enumerate(dataset.items()):
+            if not isinstance(record, Mapping):
+                record = {}
+            wafer = record.get("wafer")
+            wafer = wafer if isinstance(wafer, Mapping) else {}
+            mods = record.get("mod") or []
+            waf = record.packed_waf() if isinstance(record, CompactRecord) else None
+            die_count = len(waf) // 2 if waf is not None else len(record.get("waf") or [])
+
+            names.append(name)
+            strings["name"].append(name)
+            strings["prb"].append(_str_or_none(record.get("prb")))
+            strings["flatLocation"].append(_str_or_none(wafer.get("flatLocation")))
+            numbers["stepX_um"].append(_num_or_none(wafer.get("stepX_um")))
+            numbers["stepY_um"].append(_num_or_none(wafer.get("stepY_um")))
+            numbers["flatAngle_deg"].append(_num_or_none(wafer.get("flatAngle_deg")))
+            numbers["mod_count"].append(len(mods))
+            numbers["die_count"].append(die_count)
+            for m in mods:
+                mod = m.get("name") if isinstance(m, Mapping) else m
+                if isinstance(mod, str):
+                    rows = mod_rows.setdefault(mod, [])
+                    if not rows or rows[-1] != row:
+                        rows.append(row)
+
+        self.names = names
+        self.raw = {f: strings[f] for f in STRING_FIELDS}
+        self.raw.update(numbers)
+        self.strings = {f: _StringColumn.from_values(strings[f]) for f in STRING_FIELDS}
+        self.numbers = {f: _NumericColumn(numbers[f]) for f in NUMERIC_FIELDS}
+        self.mods = _StringColumn(mod_rows)
+        self.all = np.arange(len(names), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.names)
+
+    # ---------- filters ----------
+
+    def evaluate(self, node) -> np.ndarray:
+        if node is None:
+            return self.all
+        if not isinstance(node, dict):
+            raise QueryError("each filter must be an object")
+        if "and" in node or "or" in node:
+            key = "and" if "and" in node else "or"
+            parts = node[key]
+            if not isinstance(parts, list):
+                raise QueryError(f"{key} must be an array")
+            if not parts:
+                return self.all if key == "and" else _EMPTY
+            # cheapest first, so intersections shrink quickly
+            results = sorted((self.evaluate(p) for p in parts), key=len)
+            out = results[0]
+            for r in results[1:]:
+                out = np.intersect1d(out, r, assume_unique=True) if key == "and" else np.union1d(out, r)
+            return out
+        if "not" in node:
+            return np.setdiff1d(self.all, self.evaluate(node["not"]), assume_unique=True)
+        return self._condition(node.get("field"), node.get("op", "eq"), node.get("value"))
+
+    def _condition(self, field, op, value) -> np.ndarray:
+        if field == "mod":
+            if op in ("has", "eq"):
+                return self.mods.eq(_string(value, op))
+            if op == "like":
+                return self._like(self.mods, value)
+            if op == "in":
+                return self._in(self.mods, value)
+            raise QueryError(f"unsupported op for mod: {op}")
+        if field in self.strings:
+            column = self.strings[field]
+            if op == "eq":
+                return column.eq(_string(value, op))
+            if op == "ne":
+                return np.setdiff1d(self.all, column.eq(_string(value, op)), assume_unique=True)
+            if op == "in":
+                return self._in(column, value)
+            if op == "like":
+                return self._like(column, value)
+            if op in ("lt", "le", "gt", "ge"):
+                return column.cmp(op, value)
+            raise QueryError(f"unsupported op for {field}: {op}")
+        if field in self.numbers:
+            column = self.numbers[field]
+            if op == "between":
+                if not isinstance(value, list) or len(value) != 2:
+                    raise QueryError("between needs [low, high]")
+                return column.range(_number(value[0], True), _number(value[1], True))
+            if op == "in":
+                if not isinstance(value, list):
+                    raise QueryError("in needs an array")
+                parts = [column.eq(_number(v)) for v in value]
+                return np.unique(np.concatenate(parts)) if parts else _EMPTY
+            v = _number(value)
+            if op == "eq":
+                return column.eq(v)
+            if op == "ne":
+                return np.setdiff1d(self.all, column.eq(v), assume_unique=True)
+            if op == "lt":
+                return column.range(high=v, high_open=True)
+            if op == "le":
+                return column.range(high=v)
+            if op == "gt":
+                return column.range(low=v, low_open=True)
+            if op == "ge":
+                return column.range(low=v)
+            raise QueryError(f"unsupported op for {field}: {op}")
+        raise QueryError(f"unknown field: {field} (one of: {', '.join(FIELDS + ('mod',))})")
+
+    @staticmethod
+    def _like(column: _StringColumn, value) -> np.ndarray:
+        if not isinstance(value, str):
+            raise QueryError("like needs a string pattern")
+        return column.like(value)
+
+    @staticmethod
+    def _in(column: _StringColumn, value) -> np.ndarray:
+        if not isinstance(value, list):
+            raise QueryError("in needs an array")
+        parts = [column.eq(_string(v, "in")) for v in value]
+        return np.unique(np.concatenate(parts)) if parts else _EMPTY
+
+    # ---------- sort / rows ----------
+
+    def sort(self, ids: np.ndarray, spec) -> np.ndarray:
+        """spec: "field", {"field", "order": "asc"|"desc"} or a list of those; default name order."""
+        if spec is None:
+            spec = ["name"]
+        if not isinstance(spec, list):
+            spec = [spec]
+        keys = []
+        for item in spec:
+            field, order = (item, "asc") if isinstance(item, str) else (
+                (item.get("field"), item.get("order", "asc")) if isinstance(item, dict) else (None, None))
+            if field not in FIELDS:
+                raise QueryError(f"cannot sort by: {field}")
+            if order not in ("asc", "desc"):
+                raise QueryError("sort order must be asc or desc")
+            if field in self.numbers:
+                k = self.numbers[field].values[ids]
+                k = np.where(np.isnan(k), np.inf, -k if order == "desc" else k)  # nulls last
+            else:
+                k = self.strings[field].sort_keys([self.raw[field][i] for i in ids.tolist()])
+                if order == "desc":
+                    k = np.where(k == len(self.strings[field].sorted), np.iinfo(np.int64).max, -k)
+            keys.append(k)
+        if not len(ids):
+            return ids
+        return ids[np.lexsort(keys[::-1])]
+
+    def row(self, i: int) -> dict:
+        out = {"name": self.names[i]}
+        for f in FIELDS[1:]:
+            v = self.raw[f][i]
+            out[f] = int(v) if isinstance(v, float) and v.is_integer() else v
+        return out
+
+
+def _str_or_none(v) -> Optional[str]:
+    return v if isinstance(v, str) and v != "" else None
+
+
+def _num_or_none(v) -> Optional[float]:
+    return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else None
+
+
+def _string(v, op: str) -> Optional[str]:
+    if v is not None and not isinstance(v, str):
+        raise QueryError(f"{op} needs a string value, got: {v!r}")
+    return v
+
+
+def _number(v, allow_none: bool = False):
+    if v is None and allow_none:
+        return None
+    if not isinstance(v, (int, float)) or isinstance(v, bool):
+        raise QueryError(f"expected a number, got: {v!r}")
+    return float(v)
+
+
+_indexes = {}  # dataset path -> DeviceIndex of its current version
+_lock = threading.Lock()
+
+
+def get_index(dataset) -> DeviceIndex:
+    """DeviceIndex for dataset, built on first use (one build per dataset version)."""
+    with _lock:
+        index = _indexes.get(dataset.path)
+        if index is None or index.version != dataset.version:
+            index = _indexes[dataset.path] = DeviceIndex(dataset)
+        return index
+
+
+def run_query(dataset, where=None, sort=None, limit: int = 100, offset: int = 0) -> dict:
+    if not isinstance(limit, int) or isinstance(limit, bool) or not 0 <= limit <= MAX_LIMIT:
+        raise QueryError(f"limit must be an integer between 0 and {MAX_LIMIT}")
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        raise QueryError("offset must be a non-negative integer")
+    index = get_index(dataset)
+    ids = index.evaluate(where)
+    ids = index.sort(ids, sort)
+    page = ids[offset:offset + limit]
+    return {
+        "version": index.version,
+        "total": int(len(ids)),
+        "count": int(len(page)),
+        "devices": [index.row(i) for i in page.tolist()],
+    }
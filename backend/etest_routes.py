@@ -1,15 +1,26 @@
 # backend/etest_routes.py
-from flask import Blueprint, request, jsonify, current_app
-import json
+from flask import Blueprint, Response, request, jsonify, current_app, send_file
 import os
 from typing import Optional
 import logging
+from collections.abc import Mapping
+from dataset import changes_since, get_dataset
+from records import plain
+from tpl_service import TplError, build_tpl, mod_families
+from probe_path import ProbePathError, plan_probe_path
+from dataset_events import TooManyListeners, open_stream
+from device_index import QueryError, run_query
+from module_deps import ModuleGraphError, describe_module
+from result_cache import ByteLRU
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
 etest_bp = Blueprint("etest", __name__, url_prefix="/api/etest")
 
+# finished /device-mods response bodies, keyed by (dataset path, version, selection)
+_device_mods_cache = ByteLRU(int(os.environ.get("ETEST_DEVICE_MODS_CACHE_BYTES", str(32 << 20))))
+
 def _resolve_json_path(arg_path: Optional[str]) -> str:
     """
     Resolve JSON path priority:
@@ -25,11 +36,12 @@ def _resolve_json_path(arg_path: Optional[str]) -> str:
     default_path = "/etestnew/SPECS/usr/aquq/etest_app/output.json"
     return default_path
 
-def _load_json(path: str) -> dict:
-    if not os.path.exists(path):
+def _load_json(path: str):
+    """Cached {device: record} mapping for output.json or a sharded dataset folder."""
+    dataset = get_dataset(path)
+    if dataset is None:
         raise FileNotFoundError(f"JSON file not found at: {path}")
-    with open(path, "r") as f:
-        return json.load(f)
+    return dataset
 
 @etest_bp.route("/devices", methods=["GET"])
 def list_devices():
@@ -37,7 +49,8 @@ def list_devices():
     Returns all device keys with their 'prb' value.
     Query params:
       - json_path (optional)
-    Response: {"devices":[{"name":"DEVICEKEY","prb":"E12A" or null}, ...]}
+    Response: {"devices":[{"name":"DEVICEKEY","prb":"E12A" or null}, ...], "version": "..."}
+    (version is what /changes?since= expects)
     """
     json_path = request.args.get("json_path")
     resolved = _resolve_json_path(json_path)
@@ -55,7 +68,7 @@ def list_devices():
 
     # Sort for nice UX
     devices.sort(key=lambda d: d["name"])
-    return jsonify({"devices": devices, "json_path": resolved})
+    return jsonify({"devices": devices, "json_path": resolved, "version": data.version})
 
 @etest_bp.route("/device-mods", methods=["POST"])
 def device_mods():
@@ -70,6 +83,8 @@ def device_mods():
             "mods": [{"name":"c9fd_998b","x": 14000, "y": 12625, "devices":["DEVKEY1","DEVKEY2"]}, ...],
       "selected_count": 2
     }
+    The selection is treated as a set (order and repeats do not matter), and
+    finished responses are cached per dataset version (X-Cache: hit|miss).
     """
     payload = request.get_json(silent=True) or {}
     selected = payload.get("devices") or []
@@ -84,6 +99,21 @@ def device_mods():
     except Exception as e:
         return jsonify({"error": str(e), "json_path": resolved}), 400
 
+    selected = sorted(set(selected))
+    key = tuple(selected)
+    body = _device_mods_cache.get(resolved, data.version, key)
+    if body is None:
+        body = jsonify(_aggregate_device_mods(data, selected)).get_data()
+        _device_mods_cache.put(resolved, data.version, key, body)
+        state = "miss"
+    else:
+        state = "hit"
+    response = current_app.response_class(body, mimetype="application/json")
+    response.headers["X-Cache"] = state
+    return response
+
+def _aggregate_device_mods(data, selected):
+    """Response body of /device-mods for a sorted, de-duplicated selection."""
     # Build reverse index: mod -> set(devices) and capture coordinates
     mod_sources = {}
     mod_coords = {}  # first-seen coords across all selected devices
@@ -144,9 +174,238 @@ def device_mods():
         wafer_meta[dev] = meta
     logging.debug("Selected Devices: %s", selected)
     logging.debug("Wafers Data: %s", wafers)
-    return jsonify({
+    return {
         "mods": mods_list,
         "wafers": wafers,
         "waferMeta": wafer_meta,
         "selected_count": len(selected)
+    }
+
+@etest_bp.route("/tpl", methods=["POST"])
+def generate_tpl():
+    """
+    Body: {
+      "device": "DEVKEY",
+      "mods": ["c9fd_998b", ...],              # optional subset of the device's mods
+      "json_path": "/custom/path/output.json"  # optional
+    }
+    Streams the generated <device>.tpl as a download. Plans are cached by
+    content, so an unchanged device is answered from the cache
+    (X-Tpl-Cache: hit|miss, ETag = cache key).
+    """
+    payload = request.get_json(silent=True) or {}
+    device = payload.get("device")
+    mods = payload.get("mods")
+    resolved = _resolve_json_path(payload.get("json_path"))
+
+    if not isinstance(device, str) or not device:
+        return jsonify({"error": "device must be a non-empty string"}), 400
+    if mods is not None and (not isinstance(mods, list) or not all(isinstance(x, str) for x in mods)):
+        return jsonify({"error": "mods must be an array of strings"}), 400
+
+    try:
+        data = _load_json(resolved)
+    except Exception as e:
+        return jsonify({"error": str(e), "json_path": resolved}), 400
+    record = data.get(device)
+    if not isinstance(record, Mapping):
+        return jsonify({"error": f"unknown device: {device}", "json_path": resolved}), 404
+
+    try:
+        path, key, hit = build_tpl(device, plain(record), mods)
+    except TplError as e:
+        return jsonify({"error": str(e), "device": device}), e.status
+
+    response = send_file(path, mimetype="text/plain", as_attachment=True,
+                         download_name=f"{device}.tpl", etag=key, conditional=True)
+    response.headers["X-Tpl-Cache"] = "hit" if hit else "miss"
+    return response
+
+@etest_bp.route("/probe-path", methods=["POST"])
+def probe_path():
+    """
+    Body: {
+      "device": "DEVKEY",
+      "dies": ["4,5", "4,6", ...],             # optional subset of the device's dies
+      "order": "best",                         # best | file | serpentine | nn_2opt
+      "metric": "euclidean",                   # euclidean | chebyshev | manhattan
+      "json_path": "/custom/path/output.json"  # optional
+    }
+    Wafer-absolute probe sites (µm) in visiting order, with the stage travel
+    of every order and the saving against file order.
+    Response: {"device", "order", "travel_um": {...}, "saved_um", "saved_pct",
+               "sites": [{"die":"4,5","mod":"c9fd_998b","x":..,"y":..}, ...], ...}
+    """
+    payload = request.get_json(silent=True) or {}
+    device = payload.get("device")
+    dies = payload.get("dies")
+    resolved = _resolve_json_path(payload.get("json_path"))
+
+    if not isinstance(device, str) or not device:
+        return jsonify({"error": "device must be a non-empty string"}), 400
+    if dies is not None and (not isinstance(dies, list) or not all(isinstance(x, str) for x in dies)):
+        return jsonify({"error": "dies must be an array of \"c,r\" strings"}), 400
+
+    try:
+        data = _load_json(resolved)
+    except Exception as e:
+        return jsonify({"error": str(e), "json_path": resolved}), 400
+    record = data.get(device)
+    if not isinstance(record, Mapping):
+        return jsonify({"error": f"unknown device: {device}", "json_path": resolved}), 404
+
+    try:
+        result = plan_probe_path(record, dies, payload.get("order") or "best",
+                                 payload.get("metric") or "euclidean")
+    except ProbePathError as e:
+        return jsonify({"error": str(e), "device": device}), e.status
+    result["device"] = device
+    return jsonify(result)
+
+@etest_bp.route("/events", methods=["GET"])
+def dataset_events():
+    """
+    Server-sent events for the dataset at json_path (optional query param).
+      event: hello    data: {"version", "path", "timestamp"}   (on connect)
+      event: dataset  data: {"version", "previous", "changed", "added", "removed",
+                             "modified", "devices", "timestamp"}   (on every new version;
+                             the counts are null if no earlier version could be read)
+    plus ": ping" comments as heartbeat. 503 when too many clients listen.
+    """
+    resolved = _resolve_json_path(request.args.get("json_path"))
+    try:
+        body = open_stream(resolved)
+    except TooManyListeners as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+    return Response(body, mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@etest_bp.route("/changes", methods=["GET"])
+def dataset_changes():
+    """
+    Devices changed since a dataset version the client already has.
+    Query params:
+      - since (required): "version" from /devices or an /events message
+      - json_path (optional)
+    Response: {"version", "since", "full_resync": false,
+               "added": {name: record}, "modified": {name: record}, "removed": [name, ...]}
+    If since is no longer in the server's history: {"version", "since", "full_resync": true}
+    and the client should reload /devices.
+    """
+    since = request.args.get("since")
+    resolved = _resolve_json_path(request.args.get("json_path"))
+    if not since:
+        return jsonify({"error": "missing since param"}), 400
+    try:
+        data, diff = changes_since(resolved, since)
+    except Exception as e:
+        return jsonify({"error": str(e), "json_path": resolved}), 400
+    if data is None:
+        return jsonify({"error": f"JSON file not found at: {resolved}", "json_path": resolved}), 400
+    if diff is None:
+        return jsonify({"version": data.version, "since": since, "full_resync": True})
+
+    added, removed, modified = diff
+    return jsonify({
+        "version": data.version,
+        "since": since,
+        "full_resync": False,
+        "added": {name: plain(data[name]) for name in added},
+        "modified": {name: plain(data[name]) for name in modified},
+        "removed": removed,
     })
+
+@etest_bp.route("/query", methods=["POST"])
+def query_devices():
+    """
+    Body: {
+      "where": {"and": [{"field": "prb", "op": "eq", "value": "E12A"},
+                        {"field": "stepX_um", "op": "between", "value": [20000, 30000]},
+                        {"field": "mod", "op": "like", "value": "c9fd_46*"}]},
+      "sort": [{"field": "mod_count", "order": "desc"}],   # optional, default name
+      "limit": 100, "offset": 0,                            # optional
+      "json_path": "/custom/path/output.json"               # optional
+    }
+    Fields: name, prb, flatLocation, stepX_um, stepY_um, flatAngle_deg, mod_count,
+    die_count, mod. See device_index.py for the operators.
+    Response: {"version", "total", "count", "devices": [{"name", "prb", ...}, ...]}
+    """
+    payload = request.get_json(silent=True) or {}
+    resolved = _resolve_json_path(payload.get("json_path"))
+    try:
+        data = _load_json(resolved)
+    except Exception as e:
+        return jsonify({"error": str(e), "json_path": resolved}), 400
+    try:
+        result = run_query(data, payload.get("where"), payload.get("sort"),
+                           payload.get("limit", 100), payload.get("offset", 0))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+@etest_bp.route("/modules/<path:name>", methods=["GET"])
+def module_dependencies(name):
+    """
+    Dependency info for one module, from the graph helpler/module_graph.py stores
+    next to the dataset (the workbook itself is never read here).
+    Query params:
+      - json_path (optional)
+    Response: {"name", "in_catalog", "colon", "cyclic",
+               "depends": [...], "depends_all": [...],        # direct / transitive
+               "dependents": [...], "dependents_all": [...],
+               "devices": [device, ...], "graph_version", "version"}
+    in_catalog/colon are null when no graph has been built for the dataset yet.
+    """
+    resolved = _resolve_json_path(request.args.get("json_path"))
+    try:
+        data = _load_json(resolved)
+    except Exception as e:
+        return jsonify({"error": str(e), "json_path": resolved}), 400
+    try:
+        return jsonify(describe_module(data, name))
+    except ModuleGraphError as e:
+        return jsonify({"error": str(e)}), e.status
+
+@etest_bp.route("/mods/families", methods=["GET"])
+def mod_variant_families():
+    """
+    c9fd variant families (mods differing only in the last character), from the
+    same index the .tpl generator resolves mods with; no folder scan per request.
+    Query params:
+      - base (optional, repeatable): only these families, e.g. base=c9fd_4004
+      - prefix (optional): only families whose base starts with this
+      - include_unused=1 (optional): also families that only exist as tst files
+      - json_path (optional)
+    Response: {"version", "tst_folder", "count", "missing": [base, ...],
+               "families": [{"base", "tst_files": [...], "devices": [...],
+                             "variants": [{"name", "tst", "devices", "sites": [{"device", "x", "y"}]}]}]}
+    """
+    resolved = _resolve_json_path(request.args.get("json_path"))
+    try:
+        data = _load_json(resolved)
+    except Exception as e:
+        return jsonify({"error": str(e), "json_path": resolved}), 400
+    try:
+        index = mod_families(data)
+    except Exception as e:
+        logging.exception("mod family index failed")
+        return jsonify({"error": str(e)}), 500
+
+    wanted = request.args.getlist("base")
+    if wanted:
+        bases = [b for b in dict.fromkeys(wanted) if b in index]
+        missing = [b for b in dict.fromkeys(wanted) if b not in index]
+    else:
+        bases = index.bases(include_unused=request.args.get("include_unused") in ("1", "true"))
+        missing = []
+    prefix = request.args.get("prefix")
+    if prefix:
+        bases = [b for b in bases if b.startswith(prefix)]
+    families = [index.family(b) for b in bases]
+    return jsonify({"version": index.version, "tst_folder": index.tst_folder, "count": len(families),
+                    "missing": missing, "families": families})
+
+@etest_bp.route("/stats", methods=["GET"])
+def etest_stats():
+    """Cache counters: {"device_mods": {"entries", "bytes", "budget_bytes", "hits", "misses", "hit_rate", ...}}"""
+    return jsonify({"device_mods": _device_mods_cache.stats()})
@@ -0,0 +1,210 @@
+# backend/module_deps.py
+"""
+Module dependency graph for /api/etest/modules/<name>.
+
+helpler/module_graph.py precomputes the catalog's dependency edges (the
+rule device_dic.order_modules() sorts by) and stores them next to the
+dataset: output.json.modgraph.json, or module_graph.json inside a sharded
+dataset folder. The file is loaded once per change (mtime/size) and turned
+into:
+
+- adjacency: module id -> direct dependencies / direct dependents;
+- closures: module id -> every module reachable along dependencies /
+  dependents, as bitsets over the sorted module names. Cycles are collapsed
+  into strongly connected components first, so each component's closure is
+  computed once from the components below it.
+
+Devices using a module come from the dataset's DeviceIndex, so a request is
+a few dict lookups plus the size of the answer.
+"""
+import os
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from dataset import MANIFEST_NAME
+from device_index import get_index
+
+# same values as helpler/module_graph.py; test_module_deps.py checks both sides agree
+GRAPH_FORMAT = 1
+GRAPH_SUFFIX = ".modgraph.json"
+GRAPH_NAME = "module_graph.json"
+
+
+class ModuleGraphError(Exception):
+    def __init__(self, message: str, status: int = 500):
+        super().__init__(message)
+        self.status = status
+
+
+def graph_path(dataset_path: str) -> str:
+    """Same layout as helpler/module_graph.graph_path()."""
+    if os.path.basename(dataset_path) == MANIFEST_NAME:
+        dataset_path = os.path.dirname(dataset_path)
+    if os.path.isdir(dataset_path):
+        return os.path.join(dataset_path, GRAPH_NAME)
+    return dataset_path + GRAPH_SUFFIX
+
+
+def _components(succ: List[Tuple[int, ...]]) -> List[List[int]]:
+    """Tarjan's SCCs, iteratively; components come out dependencies-first."""
+    n = len(succ)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack: List[int] = []
+    out: List[List[int]] = []
+    counter = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, i = work[-1]
+            if i == 0:
+                index[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                on_stack[v] = True
+            if i < len(succ[v]):
+                work[-1] = (v, i + 1)
+                w = succ[v][i]
+                if index[w] == -1:
+                    work.append((w, 0))
+                elif on_stack[w]:
+                    low[v] = min(low[v], index[w])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[v])
+            if low[v] == index[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component.append(w)
+                    if w == v:
+                        break
+                out.append(component)
+    return out
+
+
+def _closure(succ: List[Tuple[int, ...]]) -> List[int]:
+    """Bitset of every node reachable from each node (itself only if it lies on a cycle)."""
+    comp_of = [0] * len(succ)
+    reach: List[int] = []
+    for c, members in enumerate(_components(succ)):
+        bits = 0
+        for v in members:
+            comp_of[v] = c
+            bits |= 1 << v
+        below = 0
+        cyclic = len(members) > 1
+        for v in members:
+            for w in succ[v]:
+                d = comp_of[w]  # successors are in this or an earlier component
+                if d == c:
+                    cyclic = True
+                else:
+                    below |= reach[d] | (1 << w)
+        reach.append(below | (bits if cyclic else 0))
+    return [reach[comp_of[v]] for v in range(len(succ))]
+
+
+class ModuleGraph:
+    def __init__(self, doc: dict):
+        modules = doc.get("modules")
+        if doc.get("format") != GRAPH_FORMAT or not isinstance(modules, dict):
+            raise ModuleGraphError(f"unsupported module graph format: {doc.get('format')!r}")
+        self.version: Optional[str] = doc.get("version")
+        self.built_at: Optional[str] = doc.get("built_at")
+        self.names: List[str] = sorted(modules)
+        self.ids: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        self.colon = [bool(modules[name].get("colon")) for name in self.names]
+
+        depends = [tuple(sorted(self.ids[d] for d in modules[name].get("depends", ()) if d in self.ids))
+                   for name in self.names]
+        dependents: List[list] = [[] for _ in self.names]
+        for i, deps in enumerate(depends):
+            for d in deps:
+                dependents[d].append(i)
+        self.depends = depends
+        self.dependents = [tuple(r) for r in dependents]
+        self.depends_all = _closure(self.depends)
+        self.dependents_all = _closure(self.dependents)
+
+    def _decode(self, bits: int, skip: int) -> List[str]:
+        out = []
+        while bits:
+            low = bits & -bits
+            i = low.bit_length() - 1
+            if i != skip:
+                out.append(self.names[i])
+            bits ^= low
+        return out
+
+    def describe(self, name: str) -> Optional[dict]:
+        i = self.ids.get(name)
+        if i is None:
+            return None
+        return {
+            "colon": self.colon[i],
+            "depends": [self.names[d] for d in self.depends[i]],
+            "dependents": [self.names[d] for d in self.dependents[i]],
+            "depends_all": self._decode(self.depends_all[i], i),
+            "dependents_all": self._decode(self.dependents_all[i], i),
+            "cyclic": bool(self.depends_all[i] >> i & 1),
+        }
+
+
+_graphs = {}  # graph file path -> ((mtime_ns, size), ModuleGraph)
+_lock = threading.Lock()
+
+
+def get_graph(dataset_path: str) -> Optional[ModuleGraph]:
+    """Cached ModuleGraph stored next to dataset_path, None if it was never built."""
+    path = graph_path(dataset_path)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    sig = (st.st_mtime_ns, st.st_size)
+    with _lock:
+        cached = _graphs.get(path)
+        if cached is not None and cached[0] == sig:
+            return cached[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ModuleGraphError(f"module graph {path} could not be read: {e}") from e
+        graph = ModuleGraph(doc)
+        _graphs[path] = (sig, graph)
+        return graph
+
+
+def describe_module(dataset, name: str) -> dict:
+    """
+    {"name", "in_catalog", "colon", "depends", "depends_all", "dependents",
+     "dependents_all", "cyclic", "devices", "graph_version", "version"}
+    Raises ModuleGraphError(404) when neither the graph nor the dataset knows name.
+    """
+    graph = get_graph(dataset.path)
+    index = get_index(dataset)
+    rows = index.mods.index.get(name)
+    devices = [index.names[i] for i in rows.tolist()] if rows is not None else []
+    info = graph.describe(name) if graph is not None else None
+    if info is None and not devices:
+        raise ModuleGraphError(f"unknown module: {name}", 404)
+    if info is None:
+        info = {"colon": None, "depends": [], "dependents": [], "depends_all": [],
+                "dependents_all": [], "cyclic": False}
+    info.update({
+        "name": name,
+        "in_catalog": name in graph.ids if graph is not None else None,
+        "devices": sorted(devices),
+        "graph_version": graph.version if graph is not None else None,
+        "version": index.version,
+    })
+    return info
@@ -0,0 +1,274 @@
+# backend/probe_path.py
+"""
+Wafer-absolute probe sites and visiting order for a device.
+
+A record gives the die grid (waf: ["c,r", ...]), the die pitch
+(wafer.stepX_um / stepY_um), the grid centre (wafer.centerDie: x, y,
+offsetX_um, offsetY_um, as written by helpler/device_dic.py) and die-local
+mod coordinates (mod: [{"name", "x", "y"}, ...], relative to the die centre).
+The absolute position of mod m on die (c, r) is
+
+    X = (c - centerDie.x) * stepX_um + offsetX_um + m.x
+    Y = (r - centerDie.y) * stepY_um + offsetY_um + m.y
+
+with Y growing with the row number, like the grid itself. The whole
+(dies x mods) table is one NumPy broadcast.
+
+The prober steps die by die and probes every mod of a die before moving on,
+so orders are built per die: the die tour ("file", "serpentine" or
+"nn_2opt") times one shared mod order inside the die (nearest neighbour +
+2-opt over the mod positions), walked forwards or backwards on each die,
+whichever starts closer to where the previous die ended.
+"""
+from collections.abc import Mapping
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from records import NULL_COORD, CompactRecord
+
+ORDERS = ("file", "serpentine", "nn_2opt")
+METRICS = ("euclidean", "chebyshev", "manhattan")
+MAX_TWO_OPT_PASSES = 50
+
+
+class ProbePathError(Exception):
+    """Probe path cannot be computed for this request; status is the HTTP code to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+# ---------- record -> arrays ----------
+
+def _waf_grid(record) -> np.ndarray:
+    """(D, 2) int array of die (column, row), in file order."""
+    packed = record.packed_waf() if isinstance(record, CompactRecord) else None
+    if packed is not None:
+        return np.frombuffer(packed, dtype=np.int32).reshape(-1, 2).astype(np.int64)
+    cells = []
+    for cr in record.get("waf") or []:
+        c, sep, r = str(cr).partition(",")
+        try:
+            cells.append((int(c), int(r)))
+        except ValueError:
+            continue  # not a "c,r" entry
+    return np.array(cells, dtype=np.int64).reshape(-1, 2)
+
+
+def _mod_table(record) -> Tuple[List[str], np.ndarray, List[str]]:
+    """(names, (M, 2) float array of die-local x/y, names skipped for missing coordinates)."""
+    packed = record.packed_mods() if isinstance(record, CompactRecord) else None
+    if packed is not None:
+        names, xs, ys = packed
+        xy = np.stack([np.frombuffer(xs, dtype=np.int32), np.frombuffer(ys, dtype=np.int32)], axis=1)
+        ok = (xy != NULL_COORD).all(axis=1)
+        kept = [n for n, k in zip(names, ok) if k]
+        skipped = [n for n, k in zip(names, ok) if not k]
+        return kept, xy[ok].astype(np.float64), skipped
+
+    kept, coords, skipped = [], [], []
+    for m in record.get("mod") or []:
+        if not isinstance(m, dict) or not m.get("name"):
+            continue
+        x, y = m.get("x"), m.get("y")
+        if isinstance(x, (int, float)) and isinstance(y, (int, float)) \
+                and not isinstance(x, bool) and not isinstance(y, bool):
+            kept.append(m["name"])
+            coords.append((x, y))
+        else:
+            skipped.append(m["name"])
+    return kept, np.array(coords, dtype=np.float64).reshape(-1, 2), skipped
+
+
+def _die_origins(record, grid: np.ndarray) -> np.ndarray:
+    """(D, 2) float array of die-centre positions in µm."""
+    wafer = record.get("wafer") or {}
+    step_x, step_y = wafer.get("stepX_um"), wafer.get("stepY_um")
+    center = wafer.get("centerDie")
+    if not step_x or not step_y or not isinstance(center, Mapping):
+        raise ProbePathError("device has no wafer step sizes / centerDie", 422)
+    step = np.array([step_x, step_y], dtype=np.float64)
+    centre = np.array([center.get("x") or 0, center.get("y") or 0], dtype=np.float64)
+    offset = np.array([center.get("offsetX_um") or 0, center.get("offsetY_um") or 0], dtype=np.float64)
+    return (grid - centre) * step + offset
+
+
+def absolute_sites(origins: np.ndarray, local: np.ndarray) -> np.ndarray:
+    """(D, M, 2) wafer-absolute positions of every mod on every die."""
+    return origins[:, None, :] + local[None, :, :]
+
+
+# ---------- distances ----------
+
+def _dist(a: np.ndarray, b: np.ndarray, metric: str) -> np.ndarray:
+    d = np.abs(a - b)
+    if metric == "chebyshev":
+        return d.max(axis=-1)
+    if metric == "manhattan":
+        return d.sum(axis=-1)
+    return np.hypot(d[..., 0], d[..., 1])
+
+
+def path_length(points: np.ndarray, metric: str = "euclidean") -> float:
+    """Total travel along points (N, 2) in the given order."""
+    if len(points) < 2:
+        return 0.0
+    return float(_dist(points[1:], points[:-1], metric).sum())
+
+
+# ---------- orders ----------
+
+def serpentine_order(grid: np.ndarray) -> np.ndarray:
+    """Row by row, alternating the column direction on every other row."""
+    if not len(grid):
+        return np.arange(0)
+    rows = np.unique(grid[:, 1])
+    row_index = np.searchsorted(rows, grid[:, 1])
+    col_key = np.where(row_index % 2 == 0, grid[:, 0], -grid[:, 0])
+    return np.lexsort((col_key, row_index))
+
+
+def nearest_neighbor_order(points: np.ndarray, start: int = 0, metric: str = "euclidean") -> np.ndarray:
+    n = len(points)
+    if n == 0:
+        return np.arange(0)
+    order = np.empty(n, dtype=np.int64)
+    visited = np.zeros(n, dtype=bool)
+    current = start
+    for i in range(n):
+        order[i] = current
+        visited[current] = True
+        if i == n - 1:
+            break
+        d = _dist(points, points[current], metric)
+        d[visited] = np.inf
+        current = int(d.argmin())
+    return order
+
+
+def two_opt(points: np.ndarray, order: np.ndarray, metric: str = "euclidean",
+            max_passes: int = MAX_TWO_OPT_PASSES) -> np.ndarray:
+    """
+    Improve an open path by segment reversals. For each i the gain of
+    reversing order[i+1..j] is evaluated for every j at once; the best one is
+    applied. Stops when a full pass finds no improvement.
+    """
+    order = np.array(order, dtype=np.int64)
+    n = len(order)
+    if n < 3:
+        return order
+    for _ in range(max_passes):
+        improved = False
+        for i in range(n - 2):
+            p = points[order]
+            a, b = p[i], p[i + 1]
+            js = np.arange(i + 2, n)
+            c = p[js]
+            before = _dist(a, b, metric) + np.where(js < n - 1, _dist(c, p[np.minimum(js + 1, n - 1)], metric), 0.0)
+            after = _dist(a, c, metric) + np.where(js < n - 1, _dist(b, p[np.minimum(js + 1, n - 1)], metric), 0.0)
+            gain = before - after
+            k = int(gain.argmax())
+            if gain[k] > 1e-9:
+                j = js[k]
+                order[i + 1:j + 1] = order[i + 1:j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def _tour(points: np.ndarray, metric: str) -> np.ndarray:
+    """Nearest neighbour from the first point, then 2-opt."""
+    return two_opt(points, nearest_neighbor_order(points, 0, metric), metric)
+
+
+def _expand(sites: np.ndarray, die_order: np.ndarray, mod_order: np.ndarray, metric: str):
+    """Flat (die, mod) index pairs: mod_order walked forwards or backwards per die."""
+    forward, backward = mod_order, mod_order[::-1]
+    dies, mods = [], []
+    last = None
+    for d in die_order:
+        seq = forward
+        if last is not None and len(mod_order) > 1:
+            if _dist(sites[d, backward[0]], last, metric) < _dist(sites[d, forward[0]], last, metric):
+                seq = backward
+        dies.append(np.full(len(seq), d, dtype=np.int64))
+        mods.append(seq)
+        last = sites[d, seq[-1]]
+    if not dies:
+        return np.arange(0), np.arange(0)
+    return np.concatenate(dies), np.concatenate(mods)
+
+
+def plan_probe_path(record, dies: Optional[List[str]] = None, order: str = "best",
+                    metric: str = "euclidean") -> dict:
+    """
+    Absolute sites of a device in the requested order ("file", "serpentine",
+    "nn_2opt" or "best"), with the travel of every order and the saving of
+    the chosen one against file order.
+    Raises ProbePathError when the record cannot be laid out.
+    """
+    if order != "best" and order not in ORDERS:
+        raise ProbePathError(f"order must be one of: best, {', '.join(ORDERS)}")
+    if metric not in METRICS:
+        raise ProbePathError(f"metric must be one of: {', '.join(METRICS)}")
+
+    grid = _waf_grid(record)
+    labels = [f"{c},{r}" for c, r in grid.tolist()]
+    if dies is not None:
+        index = {label: i for i, label in enumerate(labels)}
+        unknown = [d for d in dies if d not in index]
+        if unknown:
+            raise ProbePathError(f"dies not in device: {', '.join(unknown)}")
+        keep = np.array(sorted({index[d] for d in dies}), dtype=np.int64)
+        grid = grid[keep]
+        labels = [labels[i] for i in keep]
+    if not len(grid):
+        raise ProbePathError("device has no dies to probe", 422)
+
+    names, local, skipped = _mod_table(record)
+    if not names:
+        raise ProbePathError("device has no mods with x/y coordinates", 422)
+
+    origins = _die_origins(record, grid)
+    sites = absolute_sites(origins, local)
+
+    file_mods = np.arange(len(names))
+    mod_tour = _tour(local, metric)
+    die_orders = {
+        "file": (np.arange(len(grid)), file_mods),
+        "serpentine": (serpentine_order(grid), mod_tour),
+        "nn_2opt": (_tour(origins, metric), mod_tour),
+    }
+    paths = {}
+    travel = {}
+    for name, (die_order, mod_order) in die_orders.items():
+        if name == "file":
+            d_idx = np.repeat(die_order, len(names))
+            m_idx = np.tile(mod_order, len(die_order))
+        else:
+            d_idx, m_idx = _expand(sites, die_order, mod_order, metric)
+        paths[name] = (d_idx, m_idx)
+        travel[name] = path_length(sites[d_idx, m_idx], metric)
+
+    chosen = min(ORDERS, key=lambda k: travel[k]) if order == "best" else order
+    d_idx, m_idx = paths[chosen]
+    xy = sites[d_idx, m_idx]
+    baseline = travel["file"]
+    saved = baseline - travel[chosen]
+    return {
+        "order": chosen,
+        "metric": metric,
+        "units": "um",
+        "die_count": len(grid),
+        "mod_count": len(names),
+        "site_count": int(len(d_idx)),
+        "skipped_mods": skipped,
+        "travel_um": {k: round(v, 3) for k, v in travel.items()},
+        "saved_um": round(saved, 3),
+        "saved_pct": round(100.0 * saved / baseline, 2) if baseline else 0.0,
+        "sites": [{"die": labels[d], "mod": names[m], "x": round(float(x), 3), "y": round(float(y), 3)}
+                  for d, m, (x, y) in zip(d_idx.tolist(), m_idx.tolist(), xy.tolist())],
+    }
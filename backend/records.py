@@ -0,0 +1,164 @@
+# backend/records.py
+"""
+Compact in-memory form of dataset records.
+
+output.json records are {"prb", "mod": [{"name", "x", "y"}, ...], "waf": ["c,r", ...],
+"wafer": {...}}. Held as parsed JSON that is one dict per mod and one str per
+wafer coordinate. CompactRecord keeps the mod names interned in a tuple, the
+coordinates in array('i') and the wafer grid as a flat array('i') of
+column/row pairs; everything else (prb, wafer metadata) stays as parsed.
+
+A CompactRecord is a read-only Mapping: record["mod"] / record.get("waf")
+rebuild the original JSON values on the fly, so callers and responses are
+unchanged. Lists that do not fit the packed form (float or out-of-range
+coordinates, unusual keys) are kept as parsed, so nothing is ever lost.
+"""
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Any, Optional
+
+NULL_COORD = -2 ** 31        # array("i") marker for a null coordinate
+_I32_MIN = -2 ** 31 + 1
+_I32_MAX = 2 ** 31 - 1
+_MOD_KEYS = ("name", "x", "y")
+_KEY_ORDERS = {}             # one shared tuple per distinct record key order
+
+
+def _coord(v) -> Optional[int]:
+    if v is None:
+        return NULL_COORD
+    if type(v) is int and _I32_MIN <= v <= _I32_MAX:  # type() check: bools stay unpacked
+        return v
+    return None
+
+
+def _pack_mods(mods):
+    """(names, xs, ys) for [{"name","x","y"}, ...], (names, None, None) for a list of names, else None."""
+    if not isinstance(mods, list):
+        return None
+    if all(type(m) is str for m in mods):
+        return tuple(sys.intern(m) for m in mods), None, None
+    names = []
+    xs = array("i")
+    ys = array("i")
+    for m in mods:
+        if type(m) is not dict or tuple(m) != _MOD_KEYS or type(m["name"]) is not str:
+            return None
+        x = _coord(m["x"])
+        y = _coord(m["y"])
+        if x is None or y is None:
+            return None
+        names.append(sys.intern(m["name"]))
+        xs.append(x)
+        ys.append(y)
+    return tuple(names), xs, ys
+
+
+def _pack_waf(waf):
+    """Flat array('i') [c0, r0, c1, r1, ...] for ["c,r", ...] in canonical form, else None."""
+    if not isinstance(waf, list):
+        return None
+    packed = array("i")
+    for cr in waf:
+        if type(cr) is not str:
+            return None
+        c, sep, r = cr.partition(",")
+        try:
+            ci, ri = int(c), int(r)
+        except ValueError:
+            return None
+        if not sep or f"{ci},{ri}" != cr or _coord(ci) is None or _coord(ri) is None:
+            return None
+        packed.append(ci)
+        packed.append(ri)
+    return packed
+
+
+class CompactRecord(Mapping):
+    __slots__ = ("_keys", "_names", "_xs", "_ys", "_waf", "_other")
+
+    def __init__(self, record: dict):
+        keys = tuple(record)
+        self._keys = _KEY_ORDERS.setdefault(keys, keys)
+        other = dict(record)
+        self._names = self._xs = self._ys = self._waf = None
+
+        packed = _pack_mods(other.get("mod")) if "mod" in other else None
+        if packed is not None:
+            self._names, self._xs, self._ys = packed
+            del other["mod"]
+
+        waf = _pack_waf(other.get("waf")) if "waf" in other else None
+        if waf is not None:
+            self._waf = waf
+            del other["waf"]
+
+        self._other = other or None
+
+    # ---------- fast accessors (no JSON values built) ----------
+
+    @property
+    def mod_count(self) -> int:
+        if self._names is not None:
+            return len(self._names)
+        mods = self._other.get("mod") if self._other else None
+        return len(mods) if isinstance(mods, list) else 0
+
+    @property
+    def prb(self):
+        return self._other.get("prb") if self._other else None
+
+    def packed_mods(self):
+        """(names, xs, ys) with NULL_COORD for null coordinates, or None if mods are not packed with x/y."""
+        if self._xs is None:
+            return None
+        return self._names, self._xs, self._ys
+
+    def packed_waf(self):
+        """Flat array('i') [c0, r0, c1, r1, ...], or None if waf is not packed."""
+        return self._waf
+
+    # ---------- Mapping ----------
+
+    def _mods(self) -> list:
+        if self._xs is None:
+            return list(self._names)
+        null = NULL_COORD
+        return [{"name": n, "x": None if x == null else x, "y": None if y == null else y}
+                for n, x, y in zip(self._names, self._xs, self._ys)]
+
+    def _waf_list(self) -> list:
+        w = self._waf
+        return [f"{w[i]},{w[i + 1]}" for i in range(0, len(w), 2)]
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "mod" and self._names is not None:
+            return self._mods()
+        if key == "waf" and self._waf is not None:
+            return self._waf_list()
+        if self._other is not None and key in self._other:
+            return self._other[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def to_dict(self) -> dict:
+        return {key: self[key] for key in self._keys}
+
+
+def compact_record(record):
+    """CompactRecord for a dict record; anything else is returned unchanged."""
+    return CompactRecord(record) if type(record) is dict else record
+
+
+def plain(record):
+    """Plain dict (JSON-serializable) form of a dataset record."""
+    return record.to_dict() if isinstance(record, CompactRecord) else record
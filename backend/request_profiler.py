@@ -0,0 +1,224 @@
+# backend/request_profiler.py
+"""
+Opt-in profiling of single API requests in production.
+
+Only active when ETEST_PROFILE_TOKEN is set: init_profiling() then adds
+request hooks and the admin routes. Without the token nothing is
+registered, so an ordinary deployment pays nothing.
+
+A request is profiled when it carries the token (header X-Profile: <token>
+or query ?_profile=<token>) and passes the sampling rate
+ETEST_PROFILE_SAMPLE (0..1, default 1). The view then runs under cProfile
+while a sampler thread records its stack every ETEST_PROFILE_INTERVAL_MS.
+Three files are written to ETEST_PROFILE_DIR per request:
+
+    <id>.prof            pstats (python -m pstats, snakeviz, ...)
+    <id>.collapsed.txt   "frame;frame;frame count" lines (flamegraph.pl, speedscope)
+    <id>.json            route, method, path, query args, JSON body, status, duration
+
+Only the newest ETEST_PROFILE_KEEP profiles are kept.
+GET /api/admin/profiles lists them, and GET /api/admin/profiles/<id>/<kind>
+(kind: prof | collapsed | meta) downloads one. Both need the token.
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import random
+import pstats
+import cProfile
+import tempfile
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from flask import Blueprint, g, jsonify, request, send_file, abort
+
+PROFILE_TOKEN = os.environ.get("ETEST_PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("ETEST_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "etest_profiles"))
+SAMPLE_RATE = float(os.environ.get("ETEST_PROFILE_SAMPLE", "1"))
+INTERVAL = float(os.environ.get("ETEST_PROFILE_INTERVAL_MS", "1")) / 1000.0
+KEEP = int(os.environ.get("ETEST_PROFILE_KEEP", "50"))
+MAX_BODY = 64 << 10  # bytes of request body recorded in the .json
+
+_KINDS = {"prof": ".prof", "collapsed": ".collapsed.txt", "meta": ".json"}
+# one profiled request at a time: cProfile cannot run in two threads at once on newer Pythons
+_busy = threading.Lock()
+
+profiling_bp = Blueprint("profiling", __name__, url_prefix="/api/admin")
+
+
+def _token_ok(value: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and value is not None and hmac.compare_digest(value, PROFILE_TOKEN)
+
+
+def _admin_ok() -> bool:
+    return _token_ok(request.headers.get("X-Profile") or request.args.get("_profile"))
+
+
+class _StackSampler:
+    """Samples one thread's Python stack on a timer and counts collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="etest-profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _start():
+    if request.url_rule is None or request.blueprint == profiling_bp.name:
+        return  # unmatched URLs and the admin routes themselves are never profiled
+    if not _token_ok(request.headers.get("X-Profile") or request.args.get("_profile")):
+        return
+    if SAMPLE_RATE < 1 and random.random() >= SAMPLE_RATE:
+        return
+    if not _busy.acquire(blocking=False):
+        g._etest_profile_skipped = "busy"
+        return
+    sampler = _StackSampler(threading.get_ident(), INTERVAL)
+    profile = cProfile.Profile()
+    g._etest_profile = (profile, sampler, time.perf_counter())
+    sampler.start()
+    profile.enable()
+
+
+def _stop(status: int) -> str:
+    profile, sampler, t0 = g.pop("_etest_profile")
+    try:
+        profile.disable()
+        sampler.stop()
+        return _write(profile, sampler, time.perf_counter() - t0, status)
+    finally:
+        _busy.release()
+
+
+def _finish(response):
+    if "_etest_profile" not in g:
+        if g.pop("_etest_profile_skipped", None):
+            response.headers["X-Profile-Skipped"] = "busy"
+        return response
+    try:
+        response.headers["X-Profile-Id"] = _stop(response.status_code)
+    except OSError as e:
+        response.headers["X-Profile-Error"] = str(e)
+    return response
+
+
+def _teardown(exc):
+    # after_request is skipped when the view raised; still stop (and keep) the profile
+    if "_etest_profile" in g:
+        try:
+            _stop(500)
+        except OSError:
+            pass
+
+
+def _write(profile, sampler, elapsed: float, status: int) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    route = request.url_rule.rule if request.url_rule is not None else request.path
+    slug = "".join(ch if ch.isalnum() else "_" for ch in route).strip("_") or "root"
+    profile_id = f"{stamp}_{slug}"
+    base = os.path.join(PROFILE_DIR, profile_id)
+
+    pstats.Stats(profile).dump_stats(base + ".prof")
+    with open(base + ".collapsed.txt", "w", encoding="utf-8") as f:
+        f.write(sampler.collapsed())
+    body = request.get_data(cache=True)[:MAX_BODY].decode("utf-8", "replace")
+    meta = {
+        "id": profile_id,
+        "route": route,
+        "method": request.method,
+        "path": request.path,
+        "args": {k: v for k, v in request.args.items() if k != "_profile"},
+        "body": body,
+        "status": status,
+        "duration_ms": round(1000 * elapsed, 3),
+        "samples": sum(sampler.stacks.values()),
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    _prune()
+    return profile_id
+
+
+def _metas() -> list:
+    try:
+        names = sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith(".json")), reverse=True)
+    except FileNotFoundError:
+        return []
+    return [n[:-len(".json")] for n in names]
+
+
+def _prune() -> None:
+    for profile_id in _metas()[KEEP:]:
+        for suffix in _KINDS.values():
+            try:
+                os.unlink(os.path.join(PROFILE_DIR, profile_id + suffix))
+            except OSError:
+                pass
+
+
+@profiling_bp.route("/profiles", methods=["GET"])
+def list_profiles():
+    """Newest first: [{"id", "route", "method", "path", "args", "status", "duration_ms", ...}, ...]"""
+    if not _admin_ok():
+        abort(403)
+    profiles = []
+    for profile_id in _metas()[:KEEP]:
+        try:
+            with open(os.path.join(PROFILE_DIR, profile_id + ".json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta.pop("body", None)
+        profiles.append(meta)
+    return jsonify({"dir": PROFILE_DIR, "sample_rate": SAMPLE_RATE, "profiles": profiles})
+
+
+@profiling_bp.route("/profiles/<profile_id>/<kind>", methods=["GET"])
+def get_profile(profile_id, kind):
+    if not _admin_ok():
+        abort(403)
+    suffix = _KINDS.get(kind)
+    if suffix is None or profile_id not in _metas():
+        abort(404)
+    return send_file(os.path.join(PROFILE_DIR, profile_id + suffix), as_attachment=kind != "meta",
+                     download_name=profile_id + suffix)
+
+
+def init_profiling(app) -> bool:
+    """Register the hooks and admin routes if ETEST_PROFILE_TOKEN is set; returns whether it did."""
+    if not PROFILE_TOKEN:
+        return False
+    app.before_request(_start)
+    app.after_request(_finish)
+    app.teardown_request(_teardown)
+    app.register_blueprint(profiling_bp)
+    return True
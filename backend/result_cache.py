@@ -0,0 +1,78 @@
+# backend/result_cache.py
+"""
+Byte-budgeted LRU cache for finished response bodies.
+
+Entries live in a scope (e.g. a dataset path) and are tagged with the
+scope's version. The first get/put that sees a new version for a scope
+drops every entry of the older version, so results never outlive the
+dataset they were computed from and stale bodies do not wait for LRU
+eviction to free their memory.
+"""
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class ByteLRU:
+    def __init__(self, budget: int):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (scope, version, key) -> bytes, oldest first
+        self._versions = {}            # scope -> current version
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _sync_version(self, scope: Hashable, version: Hashable) -> None:
+        # caller holds _lock
+        if self._versions.get(scope, version) != version:
+            for k in [k for k in self._entries if k[0] == scope]:
+                self._bytes -= len(self._entries.pop(k))
+        self._versions[scope] = version
+
+    def get(self, scope: Hashable, version: Hashable, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            self._sync_version(scope, version)
+            body = self._entries.get((scope, version, key))
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((scope, version, key))
+            self.hits += 1
+            return body
+
+    def put(self, scope: Hashable, version: Hashable, key: Hashable, body: bytes) -> None:
+        if len(body) > self.budget:
+            return  # would evict everything else and still not fit
+        with self._lock:
+            self._sync_version(scope, version)
+            full_key = (scope, version, key)
+            old = self._entries.pop(full_key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[full_key] = body
+            self._bytes += len(body)
+            while self._bytes > self.budget:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "budget_bytes": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,79 @@
+# backend/task_routes.py
+"""
+/api/run-python, /api/run-c/<task> and job polling, on top of task_runner.
+
+Both run endpoints wait for the result by default (what the frontend task
+pages expect). With "async": true they answer 202 with a job id right away;
+GET /api/jobs/<job_id> returns the job until it is finished.
+"""
+from flask import Blueprint, request, jsonify
+from task_runner import TaskError, get_runner
+
+tasks_bp = Blueprint("tasks", __name__, url_prefix="/api")
+
+# extra seconds a synchronous request waits past the task timeout (queueing)
+SYNC_SLACK = 30.0
+
+_STATUS_CODES = {"timeout": 504, "error": 500}
+
+
+def _run(kind: str, task: str, params, payload: dict):
+    runner = get_runner()
+    try:
+        job = runner.submit(kind, task, params, payload.get("timeout"), payload.get("cache", True) is not False)
+    except TaskError as e:
+        return jsonify({"error": str(e), "task": task}), e.status
+
+    if payload.get("async"):
+        body = job.to_dict()
+        body["poll"] = f"/api/jobs/{job.id}"
+        return jsonify(body), 200 if job.finished is not None else 202
+
+    if not runner.wait(job, job.timeout + SYNC_SLACK):
+        body = job.to_dict()
+        body["poll"] = f"/api/jobs/{job.id}"
+        return jsonify(body), 202
+    return jsonify(job.to_dict()), _STATUS_CODES.get(job.status, 200)
+
+
+@tasks_bp.route("/run-python", methods=["POST"])
+def run_python():
+    """
+    Body: {"task": "hello", "params": {...}, "async": false, "timeout": 10, "cache": true}
+    Response: {"job_id", "task", "status": done|failed|timeout|error, "returncode",
+               "stdout", "stderr", "cached", "duration_ms"}
+    """
+    payload = request.get_json(silent=True) or {}
+    task = payload.get("task")
+    params = payload.get("params") or {}
+    if not isinstance(task, str) or not task:
+        return jsonify({"error": "task must be a non-empty string"}), 400
+    if not isinstance(params, dict):
+        return jsonify({"error": "params must be an object"}), 400
+    return _run("python", task, params, payload)
+
+
+@tasks_bp.route("/run-c/<task>", methods=["POST"])
+def run_c(task):
+    """
+    Body: {"args": ["2", "3"], "async": false, "timeout": 10, "cache": true}
+    Response: same as /api/run-python.
+    """
+    payload = request.get_json(silent=True) or {}
+    args = payload.get("args") or []
+    if not isinstance(args, list) or not all(isinstance(a, (str, int, float)) and not isinstance(a, bool) for a in args):
+        return jsonify({"error": "args must be an array of strings or numbers"}), 400
+    return _run("c", task, [str(a) for a in args], payload)
+
+
+@tasks_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = get_runner().get(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job", "job_id": job_id}), 404
+    return jsonify(job.to_dict())
+
+
+@tasks_bp.route("/tasks/stats", methods=["GET"])
+def task_stats():
+    return jsonify(get_runner().stats())
@@ -0,0 +1,428 @@
+# backend/task_runner.py
+"""
+Bounded execution of the allowlisted tasks behind /api/run-python and
+/api/run-c/<task>.
+
+- Python tasks (tasks/<name>.py) run inside long-lived worker processes. A
+  task module is imported once per worker and its main() called with
+  sys.argv = [path, json(params)], so a request costs a pipe round trip
+  instead of a new interpreter. A worker that exceeds the timeout is killed
+  and replaced.
+- C tasks (bin/<name>) run as a subprocess with a timeout.
+- At most ETEST_TASK_WORKERS jobs run at once and at most ETEST_TASK_QUEUE
+  wait; anything beyond that is rejected (TaskError 503) instead of queued,
+  so a burst cannot exhaust the host.
+- Finished results are cached (LRU, ETEST_TASK_CACHE_SIZE) per
+  (kind, task, params); jobs are kept for polling until
+  ETEST_TASK_KEEP newer ones have finished.
+
+config/allowlist.json lists the runnable tasks per kind, either as names
+or as {"name": ..., "timeout": seconds}; it is re-read when it changes.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import threading
+import traceback
+import subprocess
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+TASKS_DIR = os.path.join(_HERE, "tasks")
+BIN_DIR = os.path.join(_HERE, "bin")
+ALLOWLIST_PATH = os.environ.get("ETEST_TASK_ALLOWLIST", os.path.join(_HERE, "config", "allowlist.json"))
+
+WORKERS = int(os.environ.get("ETEST_TASK_WORKERS", "2"))
+MAX_QUEUE = int(os.environ.get("ETEST_TASK_QUEUE", "16"))
+DEFAULT_TIMEOUT = float(os.environ.get("ETEST_TASK_TIMEOUT", "30"))
+CACHE_SIZE = int(os.environ.get("ETEST_TASK_CACHE_SIZE", "256"))
+KEEP_JOBS = int(os.environ.get("ETEST_TASK_KEEP", "1000"))
+MAX_OUTPUT = 1 << 20  # bytes of stdout/stderr kept per job
+
+KINDS = ("python", "c")
+
+
+class TaskError(Exception):
+    """Task cannot be run for this request; status is the HTTP code to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _clip(text: str) -> str:
+    return text if len(text) <= MAX_OUTPUT else text[:MAX_OUTPUT] + "\n[output truncated]\n"
+
+
+# ---------- allowlist ----------
+
+_allow_lock = threading.Lock()
+_allow_sig = None
+_allow = {}  # kind -> {name: timeout or None}
+
+
+def _parse_allowlist(raw) -> dict:
+    if not isinstance(raw, dict):
+        raise ValueError("expected an object with a list per task kind")
+    allow = {kind: {} for kind in KINDS}
+    for kind in KINDS:
+        entries = raw.get(kind, [])
+        if not isinstance(entries, list):
+            raise ValueError(f"{kind!r} must be a list")
+        for entry in entries:
+            if isinstance(entry, str) and entry:
+                allow[kind][entry] = None
+                continue
+            if not isinstance(entry, dict) or not isinstance(entry.get("name"), str) or not entry["name"]:
+                raise ValueError(f"{kind} entry {entry!r} is neither a task name nor an object with a \"name\"")
+            timeout = entry.get("timeout")
+            if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float))
+                                        or not 0 < timeout < float("inf")):
+                raise ValueError(f"{kind} task {entry['name']}: timeout must be a positive number of seconds, "
+                                 f"got {timeout!r}")
+            allow[kind][entry["name"]] = None if timeout is None else float(timeout)
+    return allow
+
+
+def _allowlist() -> dict:
+    """kind -> {name: timeout or None}; TaskError 500 if the file cannot be used."""
+    global _allow_sig, _allow
+    try:
+        st = os.stat(ALLOWLIST_PATH)
+        sig = (st.st_mtime_ns, st.st_size, st.st_ino)
+    except FileNotFoundError:
+        sig = None
+    with _allow_lock:
+        if sig != _allow_sig:
+            allow = {kind: {} for kind in KINDS}
+            if sig is not None:
+                try:
+                    with open(ALLOWLIST_PATH, "r", encoding="utf-8") as f:
+                        allow = _parse_allowlist(json.load(f))
+                except (OSError, ValueError) as e:
+                    raise TaskError(f"invalid task allowlist {ALLOWLIST_PATH}: {e}", 500) from e
+            _allow, _allow_sig = allow, sig
+        return _allow
+
+
+def _preload() -> list:
+    """Python tasks a new worker imports up front; none if the allowlist is broken."""
+    try:
+        return list(_allowlist().get("python", {}))
+    except TaskError:
+        return []
+
+
+def _task_timeout(kind: str, task: str, requested) -> float:
+    allowed = _allowlist().get(kind, {})
+    if task not in allowed:
+        raise TaskError(f"task not allowed: {task}", 403)
+    limit = allowed[task] or DEFAULT_TIMEOUT
+    if requested is None:
+        return limit
+    if not isinstance(requested, (int, float)) or isinstance(requested, bool) or requested <= 0:
+        raise TaskError("timeout must be a positive number of seconds")
+    return min(float(requested), limit)
+
+
+# ---------- python worker processes ----------
+
+def _worker_main(conn, tasks_dir: str, preload) -> None:
+    """Loop of a warm worker: receive (task, params), answer (returncode, stdout, stderr)."""
+    import io
+    import importlib.util
+    from contextlib import redirect_stdout, redirect_stderr
+
+    modules = {}  # task -> (mtime_ns, module)
+
+    def load(task):
+        path = os.path.join(tasks_dir, task + ".py")
+        mtime = os.stat(path).st_mtime_ns
+        cached = modules.get(task)
+        if cached is not None and cached[0] == mtime:
+            return path, cached[1]
+        spec = importlib.util.spec_from_file_location(f"etest_task_{task}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        modules[task] = (mtime, module)
+        return path, module
+
+    for task in preload:
+        try:
+            load(task)
+        except Exception:
+            pass  # reported when the task is actually run
+
+    while True:
+        try:
+            task, params = conn.recv()
+        except EOFError:
+            return
+        out, err = io.StringIO(), io.StringIO()
+        code = 0
+        argv = sys.argv
+        with redirect_stdout(out), redirect_stderr(err):
+            try:
+                path, module = load(task)
+                main = getattr(module, "main", None)
+                if main is None:
+                    raise RuntimeError(f"task {task} has no main()")
+                sys.argv = [path, json.dumps(params)]
+                result = main()
+                code = result if isinstance(result, int) else 0
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                if e.code is not None and not isinstance(e.code, int):
+                    print(e.code, file=sys.stderr)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.argv = argv
+        conn.send((code, out.getvalue(), err.getvalue()))
+
+
+class _PyWorker:
+    def __init__(self, ctx, preload):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, TASKS_DIR, list(preload)), daemon=True)
+        self.proc.start()
+        child.close()
+
+    def run(self, task: str, params, timeout: float):
+        """(returncode, stdout, stderr), or None on timeout (the worker is then dead)."""
+        self.conn.send((task, params))
+        if not self.conn.poll(timeout):
+            self.kill()
+            return None
+        return self.conn.recv()
+
+    def alive(self) -> bool:
+        return self.proc.is_alive()
+
+    def kill(self) -> None:
+        try:
+            self.proc.kill()
+            self.proc.join(1)
+        finally:
+            self.conn.close()
+
+
+class _PyPool:
+    """WORKERS warm interpreters; a worker is checked out for the length of one task."""
+
+    def __init__(self, size: int):
+        self._ctx = multiprocessing.get_context("spawn")  # never fork the threaded server
+        self._idle = queue.Queue()
+        preload = _preload()
+        for _ in range(size):
+            self._idle.put(_PyWorker(self._ctx, preload))
+
+    def run(self, task: str, params, timeout: float):
+        worker = self._idle.get()
+        try:
+            return worker.run(task, params, timeout)
+        except (EOFError, OSError, BrokenPipeError):
+            worker.kill()
+            return 1, "", f"worker for task {task} exited unexpectedly\n"
+        finally:
+            if not worker.alive():
+                worker = _PyWorker(self._ctx, _preload())
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                return
+
+
+def _run_c(task: str, args, timeout: float):
+    path = os.path.join(BIN_DIR, task)
+    if not os.path.isfile(path):
+        return 127, "", f"binary not found: bin/{task}\n"
+    try:
+        proc = subprocess.run([path, *args], capture_output=True, text=True, timeout=timeout,
+                              stdin=subprocess.DEVNULL, cwd=_HERE)
+    except subprocess.TimeoutExpired:
+        return None
+    except PermissionError:
+        return 126, "", f"binary not executable: bin/{task}\n"
+    return proc.returncode, proc.stdout, proc.stderr
+
+
+# ---------- jobs ----------
+
+class Job:
+    __slots__ = ("id", "kind", "task", "params", "timeout", "status", "cached",
+                 "returncode", "stdout", "stderr", "submitted", "started", "finished", "future")
+
+    def __init__(self, kind: str, task: str, params, timeout: float):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.task = task
+        self.params = params
+        self.timeout = timeout
+        self.status = "queued"
+        self.cached = False
+        self.returncode = None
+        self.stdout = ""
+        self.stderr = ""
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+
+    def to_dict(self) -> dict:
+        out = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "task": self.task,
+            "status": self.status,
+            "cached": self.cached,
+        }
+        if self.finished is not None:
+            out.update({
+                "returncode": self.returncode,
+                "stdout": self.stdout,
+                "stderr": self.stderr,
+                "duration_ms": round(1000 * (self.finished - (self.started or self.finished)), 1),
+            })
+        return out
+
+
+class TaskRunner:
+    def __init__(self, workers: int = WORKERS, max_queue: int = MAX_QUEUE, cache_size: int = CACHE_SIZE):
+        self._workers = workers
+        self._max_queue = max_queue
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self._py_lock = threading.Lock()  # held while the worker processes start
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="etest-task")
+        self._py = None
+        self._pending = 0
+        self._jobs = OrderedDict()    # job id -> Job, oldest first
+        self._results = OrderedDict()  # cache key -> (returncode, stdout, stderr)
+        self.hits = 0
+        self.misses = 0
+
+    def _python_pool(self) -> _PyPool:
+        with self._py_lock:
+            if self._py is None:
+                self._py = _PyPool(self._workers)
+            return self._py
+
+    @staticmethod
+    def _key(kind: str, task: str, params) -> str:
+        return json.dumps([kind, task, params], sort_keys=True, separators=(",", ":"))
+
+    def submit(self, kind: str, task: str, params, timeout=None, use_cache: bool = True) -> Job:
+        if kind not in KINDS:
+            raise TaskError(f"unknown task kind: {kind}", 404)
+        job = Job(kind, task, params, _task_timeout(kind, task, timeout))
+        key = self._key(kind, task, params)
+
+        with self._lock:
+            hit = self._results.get(key) if use_cache else None
+            if hit is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                job.returncode, job.stdout, job.stderr = hit
+                job.status, job.cached = "done", True
+                job.started = job.finished = time.time()
+                self._remember(job)
+                return job
+            if self._pending >= self._workers + self._max_queue:
+                raise TaskError("task queue is full, retry later", 503)
+            self._pending += 1
+            self.misses += 1
+            self._remember(job)
+        job.future = self._executor.submit(self._execute, job, key)
+        return job
+
+    def _remember(self, job: Job) -> None:
+        # caller holds _lock
+        self._jobs[job.id] = job
+        finished = [jid for jid, j in self._jobs.items() if j.finished is not None]
+        for jid in finished[:max(0, len(finished) - KEEP_JOBS)]:
+            del self._jobs[jid]
+
+    def _execute(self, job: Job, key: str) -> None:
+        job.status = "running"
+        job.started = time.time()
+        try:
+            if job.kind == "python":
+                result = self._python_pool().run(job.task, job.params, job.timeout)
+            else:
+                result = _run_c(job.task, job.params, job.timeout)
+            if result is None:
+                job.status = "timeout"
+                job.stderr = f"task exceeded {job.timeout:g}s\n"
+            else:
+                code, out, err = result
+                job.returncode, job.stdout, job.stderr = code, _clip(out), _clip(err)
+                job.status = "done" if code == 0 else "failed"
+        except Exception as e:
+            job.status = "error"
+            job.stderr = f"{type(e).__name__}: {e}\n"
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._pending -= 1
+                if job.status == "done":
+                    self._results[key] = (job.returncode, job.stdout, job.stderr)
+                    self._results.move_to_end(key)
+                    while len(self._results) > self._cache_size:
+                        self._results.popitem(last=False)
+
+    def wait(self, job: Job, timeout: Optional[float] = None) -> bool:
+        """Block until job is finished; False if timeout ran out first."""
+        if job.future is not None:
+            try:
+                job.future.exception(timeout)
+            except FutureTimeout:
+                return False
+        return True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self._workers,
+                "pending": self._pending,
+                "max_queue": self._max_queue,
+                "cache_entries": len(self._results),
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+                "jobs": len(self._jobs),
+            }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._py_lock:
+            if self._py is not None:
+                self._py.close()
+                self._py = None
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner() -> TaskRunner:
+    """Process-wide runner, created on first use."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = TaskRunner()
+        return _runner
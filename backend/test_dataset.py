@@ -0,0 +1,123 @@
+# backend/test_dataset.py
+"""get_dataset() single-flight cache under many threads."""
+import json
+import threading
+import time
+
+import pytest
+
+import dataset
+
+THREADS = 32
+
+
+def _write(path, devices: int) -> None:
+    path.write_text(json.dumps({f"DEV{i}": {"prb": "E12A", "mod": []} for i in range(devices)}), encoding="utf-8")
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Counts dataset._load calls; set gate (an Event) to hold loads until it is set."""
+    state = {"count": 0, "gate": None, "entered": threading.Event(), "fail": 0}
+    real_load = dataset._load
+
+    def counting_load(kind, target, previous):
+        state["count"] += 1
+        state["entered"].set()
+        if state["gate"] is not None:
+            assert state["gate"].wait(10)
+        if state["fail"]:
+            state["fail"] -= 1
+            raise ValueError("simulated parse failure")
+        return real_load(kind, target, previous)
+
+    monkeypatch.setattr(dataset, "_load", counting_load)
+    return state
+
+
+def _run_threads(target, n=THREADS):
+    results, errors = [None] * n, []
+    start = threading.Barrier(n)
+
+    def worker(i):
+        start.wait()
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return results, errors
+
+
+def test_cold_path_is_parsed_once(tmp_path, loads):
+    path = tmp_path / "output.json"
+    _write(path, 50)
+    loads["gate"] = threading.Event()
+    threading.Timer(0.2, loads["gate"].set).start()  # keep the load in flight while every thread arrives
+
+    results, errors = _run_threads(lambda: dataset.get_dataset(str(path)))
+
+    assert not errors
+    assert loads["count"] == 1
+    assert all(r is results[0] for r in results)
+    assert len(results[0]) == 50
+
+
+def test_readers_get_stale_dataset_during_reload(tmp_path, loads):
+    path = tmp_path / "output.json"
+    _write(path, 10)
+    old = dataset.get_dataset(str(path))
+    assert loads["count"] == 1
+
+    _write(path, 20)  # new size -> new signature
+    loads["gate"] = threading.Event()
+    loads["entered"].clear()
+    reloader = threading.Thread(target=dataset.get_dataset, args=(str(path),))
+    reloader.start()
+    assert loads["entered"].wait(5)
+
+    t0 = time.perf_counter()
+    results, errors = _run_threads(lambda: dataset.get_dataset(str(path)))
+    assert time.perf_counter() - t0 < 5  # nobody waited for the blocked reload
+    assert not errors
+    assert all(r is old for r in results)
+    assert loads["count"] == 2  # only the reloader parses
+
+    loads["gate"].set()
+    reloader.join(10)
+    new = dataset.get_dataset(str(path))
+    assert new is not old and len(new) == 20
+    assert loads["count"] == 2
+
+
+def test_failed_load_is_retried_and_not_cached(tmp_path, loads):
+    path = tmp_path / "output.json"
+    _write(path, 5)
+    loads["fail"] = 1
+    with pytest.raises(ValueError):
+        dataset.get_dataset(str(path))
+
+    data = dataset.get_dataset(str(path))
+    assert data is not None and len(data) == 5
+    assert loads["count"] == 2
+
+
+def test_waiters_retry_after_failed_cold_load(tmp_path, loads):
+    path = tmp_path / "output.json"
+    _write(path, 5)
+    loads["fail"] = 1
+    loads["gate"] = threading.Event()
+    threading.Timer(0.2, loads["gate"].set).start()
+
+    results, errors = _run_threads(lambda: dataset.get_dataset(str(path)))
+
+    assert len(errors) == 1 and isinstance(errors[0], ValueError)  # only the failed loader sees the error
+    loaded = [r for r in results if r is not None]
+    assert len(loaded) == THREADS - 1
+    assert all(r is loaded[0] for r in loaded)
+    assert loads["count"] == 2  # one failure, then one successful retry
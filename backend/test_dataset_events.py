@@ -0,0 +1,174 @@
+# backend/test_dataset_events.py
+"""/api/etest/events: watcher locking, change counts, the SSE stream and the client limit."""
+import json
+import os
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import dataset_events
+from etest_routes import etest_bp
+
+
+class _FakeDataset:
+    def __init__(self, version, device_hashes=None):
+        self.version = version
+        self.device_hashes = device_hashes or {}
+
+
+@pytest.fixture
+def slow_paths(monkeypatch):
+    """get_dataset() blocks for paths starting with "slow" until the returned Event is set."""
+    release = threading.Event()
+
+    def fake_get_dataset(path):
+        if path.startswith("slow"):
+            assert release.wait(10)
+        return _FakeDataset("v1")
+
+    monkeypatch.setattr(dataset_events, "get_dataset", fake_get_dataset)
+    yield release
+    release.set()
+
+
+def test_cold_watcher_does_not_block_other_streams(slow_paths):
+    fast = dataset_events.open_stream("fast.json")
+    opened = []
+    cold = threading.Thread(target=lambda: opened.append(dataset_events.open_stream("slow.json")))
+    cold.start()
+    time.sleep(0.1)  # the cold open is now inside its first snapshot
+
+    t0 = time.perf_counter()
+    other = dataset_events.open_stream("fast2.json")
+    fast.close()
+    other.close()
+    assert time.perf_counter() - t0 < 1
+
+    slow_paths.set()
+    cold.join(10)
+    assert len(opened) == 1
+    opened[0].close()
+    assert dataset_events.listener_count() == 0
+    assert not dataset_events._watchers
+
+
+def test_concurrent_cold_opens_share_one_watcher(slow_paths):
+    opened = []
+    threads = [threading.Thread(target=lambda: opened.append(dataset_events.open_stream("slow2.json")))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    slow_paths.set()
+    for t in threads:
+        t.join(10)
+
+    assert len(opened) == 8
+    watcher = dataset_events._watchers["slow2.json"]
+    assert all(s._watcher is watcher for s in opened)
+    assert watcher.listeners == 8
+    for s in opened:
+        s.close()
+    assert dataset_events.listener_count() == 0
+    assert "slow2.json" not in dataset_events._watchers
+
+
+def test_refused_listener_leaves_no_watcher(monkeypatch, slow_paths):
+    monkeypatch.setattr(dataset_events, "MAX_CLIENTS", 0)
+    with pytest.raises(dataset_events.TooManyListeners):
+        dataset_events.open_stream("fast3.json")
+    assert "fast3.json" not in dataset_events._watchers
+
+
+def test_failed_first_load_is_not_diffed_against_nothing(monkeypatch):
+    snapshots = [OSError("half written"), _FakeDataset("v1", {"A": "1", "B": "2"}),
+                 OSError("half written"), _FakeDataset("v2", {"A": "1", "B": "3", "C": "4"})]
+
+    def fake_get_dataset(path):
+        result = snapshots.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(dataset_events, "get_dataset", fake_get_dataset)
+    watcher = dataset_events.DatasetWatcher("flaky.json")
+    assert watcher.version is None
+
+    first = watcher.check()
+    assert first["version"] == "v1" and first["devices"] == 2
+    assert first["changed"] is None and first["added"] is None
+    assert watcher.check() is None  # unreadable again: nothing published, v1 stays the baseline
+    second = watcher.check()
+    assert (second["previous"], second["changed"], second["added"], second["modified"]) == ("v1", 2, 1, 1)
+
+
+def _write_atomic(path, records):
+    tmp = str(path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(records, f)
+    os.replace(tmp, path)
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(etest_bp)
+    return app.test_client()
+
+
+def _next_event(chunks):
+    """(event name, data) of the next SSE message, skipping heartbeats."""
+    while True:
+        chunk = next(chunks)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith(":"):
+            continue
+        fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+        return fields["event"], json.loads(fields["data"])
+
+
+def test_stream_says_hello_then_reports_an_atomic_replace(client, tmp_path):
+    path = tmp_path / "output.json"
+    _write_atomic(path, {"DEV_A": {"mod": ["m1"]}, "DEV_B": {"mod": []}})
+
+    r = client.get("/api/etest/events", query_string={"json_path": str(path)}, buffered=False)
+    assert r.status_code == 200
+    assert r.mimetype == "text/event-stream"
+    chunks = iter(r.response)
+    try:
+        name, hello = _next_event(chunks)
+        assert name == "hello"
+        assert hello["path"] == str(path) and hello["version"]
+
+        _write_atomic(path, {"DEV_A": {"mod": ["m1", "m2"]}, "DEV_B": {"mod": []}, "DEV_C": {"mod": []}})
+        name, event = _next_event(chunks)  # the watcher polls every ETEST_EVENTS_POLL seconds
+        assert name == "dataset"
+        assert event["previous"] == hello["version"] and event["version"] != hello["version"]
+        assert (event["changed"], event["added"], event["removed"], event["modified"]) == (2, 1, 0, 1)
+        assert event["devices"] == 3
+    finally:
+        r.close()
+    assert dataset_events.listener_count() == 0
+
+
+def test_client_limit_is_a_503(client, tmp_path, monkeypatch):
+    path = tmp_path / "output.json"
+    _write_atomic(path, {"DEV_A": {"mod": []}})
+    monkeypatch.setattr(dataset_events, "MAX_CLIENTS", 1)
+    query = {"json_path": str(path)}
+
+    first = client.get("/api/etest/events", query_string=query, buffered=False)
+    try:
+        assert first.status_code == 200
+        refused = client.get("/api/etest/events", query_string=query)
+        assert refused.status_code == 503
+        assert refused.headers["Retry-After"]
+        assert "too many event listeners" in refused.get_json()["error"]
+    finally:
+        first.close()
+    assert dataset_events.listener_count() == 0
+    second = client.get("/api/etest/events", query_string=query, buffered=False)
+    assert second.status_code == 200
+    second.close()
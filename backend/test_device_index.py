@@ -0,0 +1,68 @@
+# backend/test_device_index.py
+"""Malformed /api/etest/query values must be answered with 400, never 500."""
+import json
+
+import pytest
+from flask import Flask
+
+from device_index import QueryError, run_query
+from dataset import get_dataset
+from etest_routes import etest_bp
+
+RECORDS = {
+    "DEV_A": {"prb": "E12A", "mod": [{"name": "c9fd_1a", "x": 1, "y": 2}], "waf": [], "wafer": {"stepX_um": 100}},
+    "DEV_B": {"prb": "E12B", "mod": ["c9fd_2b"], "waf": [], "wafer": {"stepX_um": 200}},
+}
+
+BAD_CONDITIONS = [
+    {"field": "prb", "op": "eq", "value": [1]},
+    {"field": "prb", "op": "ne", "value": {"a": 1}},
+    {"field": "prb", "op": "eq", "value": 5},
+    {"field": "prb", "op": "in", "value": [[1]]},
+    {"field": "prb", "op": "in", "value": ["E12A", {"a": 1}]},
+    {"field": "prb", "op": "in", "value": "E12A"},
+    {"field": "mod", "op": "has", "value": {"name": "c9fd_1a"}},
+    {"field": "mod", "op": "eq", "value": ["c9fd_1a"]},
+    {"field": "mod", "op": "in", "value": [{"name": "c9fd_1a"}]},
+    {"field": "stepX_um", "op": "eq", "value": "100"},
+    {"field": "stepX_um", "op": "gt", "value": [100]},
+    {"field": "stepX_um", "op": "eq", "value": True},
+    {"field": "stepX_um", "op": "in", "value": [100, {"a": 1}]},
+    {"field": "stepX_um", "op": "between", "value": [100, "x"]},
+]
+
+
+@pytest.fixture
+def json_path(tmp_path):
+    path = tmp_path / "output.json"
+    path.write_text(json.dumps(RECORDS), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(etest_bp)
+    return app.test_client()
+
+
+@pytest.mark.parametrize("where", BAD_CONDITIONS)
+def test_bad_value_raises_query_error(json_path, where):
+    with pytest.raises(QueryError):
+        run_query(get_dataset(json_path), where)
+
+
+@pytest.mark.parametrize("where", BAD_CONDITIONS)
+def test_bad_value_is_a_400(client, json_path, where):
+    r = client.post("/api/etest/query", json={"where": where, "json_path": json_path})
+    assert r.status_code == 400
+    assert "error" in r.get_json()
+
+
+def test_valid_values_still_match(json_path):
+    data = get_dataset(json_path)
+    assert run_query(data, {"field": "prb", "op": "eq", "value": "E12A"})["total"] == 1
+    assert run_query(data, {"field": "prb", "op": "in", "value": ["E12A", None]})["total"] == 1
+    assert run_query(data, {"field": "prb", "op": "eq", "value": None})["total"] == 0
+    assert run_query(data, {"field": "mod", "op": "has", "value": "c9fd_2b"})["total"] == 1
+    assert run_query(data, {"field": "stepX_um", "op": "in", "value": [100, 200.0]})["total"] == 2
@@ -0,0 +1,185 @@
+# backend/test_module_deps.py
+"""
+describe_module() and /api/etest/modules/<name>, and the file layout shared
+with helpler (module_graph.py, json_store.py): both sides must agree on it.
+"""
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+import dataset
+import module_deps
+import tpl_service
+from etest_routes import etest_bp
+
+if tpl_service._helper_dir() not in sys.path:
+    sys.path.insert(0, tpl_service._helper_dir())
+import json_store  # noqa: E402  (helpler)
+import module_graph  # noqa: E402  (helpler)
+
+RECORDS = {
+    "DEV_A": {"prb": "E12A", "mod": ["a", "b", "x_only"]},
+    "DEV_B": {"prb": "E12B", "mod": ["c"]},
+    "DEV_C": {"prb": None, "mod": []},
+}
+
+# d -> a -> b <-> c, f -> f, e alone
+GRAPH = {
+    "a": {"colon": True, "depends": ["b"]},
+    "b": {"colon": True, "depends": ["c"]},
+    "c": {"colon": True, "depends": ["b"]},
+    "d": {"colon": True, "depends": ["a"]},
+    "e": {"colon": False, "depends": []},
+    "f": {"colon": True, "depends": ["f"]},
+}
+
+
+def _graph_doc(modules=GRAPH):
+    return {"format": module_graph.GRAPH_FORMAT, "version": "g1", "built_at": None, "modules": modules}
+
+
+@pytest.fixture
+def json_dataset(tmp_path):
+    path = str(tmp_path / "output.json")
+    json_store.write_json_atomic(path, RECORDS)
+    return path
+
+
+@pytest.fixture
+def sharded_dataset(tmp_path):
+    folder = str(tmp_path / "output.d")
+    json_store.write_sharded_dataset(folder, RECORDS)
+    return folder
+
+
+# ---------- layout shared with helpler ----------
+
+def test_constants_match_helpler():
+    assert module_deps.GRAPH_FORMAT == module_graph.GRAPH_FORMAT
+    assert module_deps.GRAPH_SUFFIX == module_graph.GRAPH_SUFFIX
+    assert module_deps.GRAPH_NAME == module_graph.GRAPH_NAME
+    assert dataset.MANIFEST_NAME == json_store.MANIFEST_NAME
+    assert dataset.SHARD_FORMAT == json_store.SHARD_FORMAT
+
+
+def test_graph_path_matches_helpler(json_dataset, sharded_dataset):
+    manifest = os.path.join(sharded_dataset, json_store.MANIFEST_NAME)
+    for path in (json_dataset, sharded_dataset, manifest):
+        assert module_deps.graph_path(path) == module_graph.graph_path(path)
+
+
+def test_helpler_sharded_dataset_reads_back(sharded_dataset):
+    loaded = dataset.get_dataset(sharded_dataset)
+    assert loaded.kind == "sharded"
+    assert loaded.version == json_store.read_manifest(sharded_dataset)["version"]
+    assert sorted(loaded) == sorted(RECORDS)
+    for name, record in RECORDS.items():
+        assert list(loaded[name]["mod"]) == record["mod"]
+        assert loaded.meta(name) == {"prb": record["prb"], "mod_count": len(record["mod"])}
+    assert all(loaded.device_hashes.values())
+
+
+@pytest.mark.parametrize("which", ["json_dataset", "sharded_dataset"])
+def test_helpler_graph_is_found_and_read(request, which):
+    path = request.getfixturevalue(which)
+    written = module_graph.write_module_graph(path, _graph_doc())
+    assert written == module_deps.graph_path(path)
+    graph = module_deps.get_graph(path)
+    assert graph.version == "g1" and graph.names == sorted(GRAPH)
+
+
+# ---------- describe_module ----------
+
+def _describe(path, name):
+    return module_deps.describe_module(dataset.get_dataset(path), name)
+
+
+def test_transitive_closure_runs_through_a_cycle(json_dataset):
+    module_graph.write_module_graph(json_dataset, _graph_doc())
+
+    d = _describe(json_dataset, "d")
+    assert (d["depends"], d["depends_all"], d["dependents_all"]) == (["a"], ["a", "b", "c"], [])
+    assert not d["cyclic"]
+
+    b = _describe(json_dataset, "b")
+    assert b["cyclic"]
+    assert b["depends_all"] == ["c"]  # never itself
+    assert b["dependents"] == ["a", "c"]
+    assert b["dependents_all"] == ["a", "c", "d"]
+    assert b["devices"] == ["DEV_A"]
+
+    c = _describe(json_dataset, "c")
+    assert c["cyclic"] and c["depends_all"] == ["b"] and c["devices"] == ["DEV_B"]
+    assert c["dependents_all"] == ["a", "b", "d"]
+
+
+def test_self_loop_and_isolated_modules(json_dataset):
+    module_graph.write_module_graph(json_dataset, _graph_doc())
+    f = _describe(json_dataset, "f")
+    assert f["cyclic"] and f["depends"] == ["f"] and f["depends_all"] == []
+    e = _describe(json_dataset, "e")
+    assert not e["cyclic"] and not e["colon"]
+    assert e["depends_all"] == e["dependents_all"] == e["devices"] == []
+    assert e["in_catalog"] and e["graph_version"] == "g1"
+
+
+def test_closures_match_a_plain_walk():
+    modules = {f"m{i}": {"depends": [f"m{(i * 7 + k) % 40}" for k in (1, 3) if i % 5]} for i in range(40)}
+    graph = module_deps.ModuleGraph(_graph_doc(modules))
+
+    def walk(start, edges):
+        seen, todo = set(), list(edges[start])
+        while todo:
+            m = todo.pop()
+            if m not in seen:
+                seen.add(m)
+                todo.extend(edges[m])
+        return seen
+
+    deps = {m: v["depends"] for m, v in modules.items()}
+    users = {m: [u for u, ds in deps.items() if m in ds] for m in deps}
+    for name in modules:
+        info = graph.describe(name)
+        reach = walk(name, deps)
+        assert info["cyclic"] == (name in reach)
+        assert info["depends_all"] == sorted(reach - {name})
+        assert info["dependents_all"] == sorted(walk(name, users) - {name})
+
+
+def test_dataset_module_missing_from_the_catalog(json_dataset):
+    module_graph.write_module_graph(json_dataset, _graph_doc())
+    info = _describe(json_dataset, "x_only")
+    assert info["in_catalog"] is False and info["colon"] is None
+    assert info["devices"] == ["DEV_A"]
+
+
+def test_without_a_graph_only_devices_are_known(json_dataset):
+    info = _describe(json_dataset, "a")
+    assert info["in_catalog"] is None and info["graph_version"] is None
+    assert info["devices"] == ["DEV_A"] and info["depends_all"] == []
+    with pytest.raises(module_deps.ModuleGraphError) as e:
+        _describe(json_dataset, "e")
+    assert e.value.status == 404
+
+
+def test_unsupported_graph_format_is_an_error(json_dataset):
+    module_graph.write_module_graph(json_dataset, dict(_graph_doc(), format=module_graph.GRAPH_FORMAT + 1))
+    with pytest.raises(module_deps.ModuleGraphError) as e:
+        _describe(json_dataset, "a")
+    assert e.value.status == 500
+
+
+def test_route(json_dataset):
+    module_graph.write_module_graph(json_dataset, _graph_doc())
+    app = Flask(__name__)
+    app.register_blueprint(etest_bp)
+    client = app.test_client()
+
+    r = client.get("/api/etest/modules/b", query_string={"json_path": json_dataset})
+    assert r.status_code == 200
+    assert r.get_json()["depends_all"] == ["c"]
+    r = client.get("/api/etest/modules/nope", query_string={"json_path": json_dataset})
+    assert r.status_code == 404
+    assert "unknown module" in r.get_json()["error"]
@@ -0,0 +1,147 @@
+# backend/test_task_runner.py
+"""TaskRunner and /api/run-python: cache, timeouts, queue limit, allowlist, async polling."""
+import json
+import time
+
+import pytest
+from flask import Flask
+
+import task_routes
+import task_runner
+from task_runner import TaskError, TaskRunner
+from task_routes import tasks_bp
+
+TASKS = {
+    "echo": "import sys\n\ndef main():\n    print(sys.argv[1])\n",
+    "nap": ("import json, sys, time\n\ndef main():\n"
+            "    time.sleep(json.loads(sys.argv[1]).get('seconds', 1))\n    print('awake')\n"),
+}
+
+
+def _write_allowlist(path, allow):
+    path.write_text(json.dumps(allow), encoding="utf-8")
+
+
+@pytest.fixture
+def tasks(tmp_path, monkeypatch):
+    """A tasks folder with echo and nap, both allowlisted; returns the allowlist path."""
+    tasks_dir = tmp_path / "tasks"
+    tasks_dir.mkdir()
+    for name, source in TASKS.items():
+        (tasks_dir / f"{name}.py").write_text(source, encoding="utf-8")
+    allowlist = tmp_path / "allowlist.json"
+    _write_allowlist(allowlist, {"python": list(TASKS), "c": []})
+    monkeypatch.setattr(task_runner, "TASKS_DIR", str(tasks_dir))
+    monkeypatch.setattr(task_runner, "ALLOWLIST_PATH", str(allowlist))
+    monkeypatch.setattr(task_runner, "_allow_sig", object())
+    return allowlist
+
+
+@pytest.fixture
+def runner(tasks):
+    r = TaskRunner(workers=1, max_queue=1, cache_size=8)
+    yield r
+    r.close()
+
+
+@pytest.fixture
+def client(runner, monkeypatch):
+    monkeypatch.setattr(task_routes, "get_runner", lambda: runner)
+    app = Flask(__name__)
+    app.register_blueprint(tasks_bp)
+    return app.test_client()
+
+
+def _worker_pid(runner):
+    (worker,) = list(runner._python_pool()._idle.queue)
+    return worker.proc.pid
+
+
+def test_second_identical_run_is_a_cache_hit(runner):
+    first = runner.submit("python", "echo", {"n": 1})
+    assert runner.wait(first, 30)
+    assert first.status == "done" and not first.cached
+    assert json.loads(first.stdout) == {"n": 1}
+
+    second = runner.submit("python", "echo", {"n": 1})
+    assert second.cached and second.status == "done"
+    assert second.stdout == first.stdout
+    assert runner.stats()["cache_hits"] == 1
+
+    other = runner.submit("python", "echo", {"n": 2})
+    assert not other.cached
+    assert runner.wait(other, 30)
+
+
+def test_timeout_kills_and_replaces_the_worker(runner):
+    pid = _worker_pid(runner)
+    job = runner.submit("python", "nap", {"seconds": 30}, timeout=0.5)
+    assert runner.wait(job, 30)
+    assert job.status == "timeout"
+    assert "exceeded" in job.stderr
+
+    assert _worker_pid(runner) != pid
+    after = runner.submit("python", "echo", {"after": "timeout"})
+    assert runner.wait(after, 30)
+    assert after.status == "done"
+
+
+def test_full_queue_is_a_503(client):
+    body = {"task": "nap", "params": {"seconds": 1}, "async": True, "cache": False}
+    assert client.post("/api/run-python", json=body).status_code == 202  # running
+    assert client.post("/api/run-python", json=body).status_code == 202  # queued
+    r = client.post("/api/run-python", json=body)
+    assert r.status_code == 503
+    assert "queue is full" in r.get_json()["error"]
+
+
+def test_task_not_on_the_allowlist_is_a_403(client):
+    r = client.post("/api/run-python", json={"task": "os_system"})
+    assert r.status_code == 403
+    assert client.post("/api/run-c/rm", json={}).status_code == 403
+
+
+def test_async_job_is_polled_until_done(client):
+    r = client.post("/api/run-python", json={"task": "nap", "params": {"seconds": 0.2}, "async": True})
+    assert r.status_code == 202
+    poll = r.get_json()["poll"]
+
+    deadline = time.monotonic() + 30
+    while True:
+        job = client.get(poll).get_json()
+        if job["status"] not in ("queued", "running"):
+            break
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert job["status"] == "done"
+    assert job["stdout"] == "awake\n"
+    assert client.get("/api/jobs/nope").status_code == 404
+
+
+@pytest.mark.parametrize("allow, message", [
+    ("{not json", "invalid task allowlist"),
+    ([], "expected an object"),
+    ({"python": "echo"}, "'python' must be a list"),
+    ({"python": [{"timeout": 5}]}, "neither a task name"),
+    ({"python": [{"name": "echo", "timeout": "fast"}]}, "timeout must be a positive number"),
+    ({"python": [{"name": "echo", "timeout": 0}]}, "timeout must be a positive number"),
+    ({"python": [{"name": "echo", "timeout": True}]}, "timeout must be a positive number"),
+])
+def test_broken_allowlist_is_a_clear_500(client, tasks, allow, message):
+    tasks.write_text(allow if isinstance(allow, str) else json.dumps(allow), encoding="utf-8")
+    r = client.post("/api/run-python", json={"task": "echo"})
+    assert r.status_code == 500
+    assert message in r.get_json()["error"]
+
+    with pytest.raises(TaskError) as e:
+        task_runner._task_timeout("python", "echo", None)
+    assert e.value.status == 500
+
+
+def test_allowlist_timeout_caps_the_request(tasks):
+    _write_allowlist(tasks, {"python": [{"name": "echo", "timeout": 2}]})
+    assert task_runner._task_timeout("python", "echo", None) == 2.0
+    assert task_runner._task_timeout("python", "echo", 1) == 1.0
+    assert task_runner._task_timeout("python", "echo", 10) == 2.0
+    with pytest.raises(TaskError):
+        task_runner._task_timeout("python", "echo", "soon")
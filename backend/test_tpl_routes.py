@@ -0,0 +1,156 @@
+# backend/test_tpl_routes.py
+"""
+POST /api/etest/tpl (cache hit/miss, ETag, the 400/404/422 answers) and
+GET /api/etest/mods/families, which reads the same generator's family index.
+"""
+import json
+import os
+
+import pytest
+from flask import Flask
+
+import tpl_service
+from etest_routes import etest_bp
+
+RECORDS = {
+    "DEV_A": {"prb": "E12A", "mod": [{"name": "c9fd_1a", "x": 1, "y": 2}, {"name": "m2", "x": 3, "y": 4}],
+              "waf": ["0,0"], "wafer": {}},
+    "DEV_NOMOD": {"prb": "E12A", "mod": ["m_missing"], "waf": [], "wafer": {}},
+}
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    tpl = tpl_service._tpl_module()
+    folders = {}
+    for name in ("tst", "die", "waf"):
+        folders[name] = tmp_path / name
+        folders[name].mkdir()
+    (folders["tst"] / "c9fd_1b.tst").write_text("BODY c9fd_1b\n")
+    (folders["tst"] / "m2.tst").write_text("BODY m2\n")
+    for device in RECORDS:
+        (folders["die"] / f"{device}.die").write_text("`c9fd_1a 1 2\n`m2 3 4\nDIE END\n")
+        (folders["waf"] / f"{device}.waf").write_text("WAFER\n")
+
+    monkeypatch.setattr(tpl, "tst_folder", str(folders["tst"]))
+    monkeypatch.setattr(tpl, "die_folder", str(folders["die"]))
+    monkeypatch.setattr(tpl, "wafer_folder", str(folders["waf"]))
+    monkeypatch.setattr(tpl_service, "_generator", None)
+    monkeypatch.setenv("ETEST_TPL_CACHE_DIR", str(tmp_path / "cache"))
+
+    json_path = tmp_path / "output.json"
+    json_path.write_text(json.dumps(RECORDS), encoding="utf-8")
+
+    app = Flask(__name__)
+    app.register_blueprint(etest_bp)
+    return {"client": app.test_client(), "json_path": str(json_path), "tst": folders["tst"]}
+
+
+def _post(env, **body):
+    body.setdefault("json_path", env["json_path"])
+    return env["client"].post("/api/etest/tpl", json=body)
+
+
+def test_miss_then_hit_with_stable_etag(env):
+    first = _post(env, device="DEV_A")
+    assert first.status_code == 200
+    assert first.headers["X-Tpl-Cache"] == "miss"
+    assert first.headers["ETag"]
+    text = first.get_data(as_text=True)
+    assert "#Test Plan\tDEV_A" in text and "BODY c9fd_1b" in text and "BODY m2" in text
+
+    second = _post(env, device="DEV_A")
+    assert second.status_code == 200
+    assert second.headers["X-Tpl-Cache"] == "hit"
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_etag_is_the_plan_cache_key(env):
+    etag = _post(env, device="DEV_A").headers["ETag"].strip('"')
+    assert len(etag) == 64 and int(etag, 16) >= 0
+    assert os.path.exists(os.path.join(tpl_service.cache_dir(), etag + ".tpl"))
+
+
+def test_edited_mod_file_is_a_new_plan(env):
+    etag = _post(env, device="DEV_A").headers["ETag"]
+    path = env["tst"] / "m2.tst"
+    path.write_text("BODY m2 edited\n")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    r = _post(env, device="DEV_A")
+    assert r.headers["X-Tpl-Cache"] == "miss"
+    assert r.headers["ETag"] != etag
+    assert "BODY m2 edited" in r.get_data(as_text=True)
+
+
+def test_mod_subset(env):
+    r = _post(env, device="DEV_A", mods=["m2"])
+    assert r.status_code == 200
+    assert "BODY c9fd_1b" not in r.get_data(as_text=True)
+    assert _post(env, device="DEV_A", mods=["nope"]).status_code == 400
+
+
+def test_unknown_device_is_a_404(env):
+    r = _post(env, device="NOPE")
+    assert r.status_code == 404
+    assert "unknown device" in r.get_json()["error"]
+
+
+def test_missing_mod_file_is_a_422(env):
+    r = _post(env, device="DEV_NOMOD")
+    assert r.status_code == 422
+    assert "m_missing" in r.get_json()["error"]
+
+
+@pytest.mark.parametrize("body", [{}, {"device": ""}, {"device": 5}, {"device": "DEV_A", "mods": "m2"},
+                                  {"device": "DEV_A", "mods": [1]}])
+def test_malformed_body_is_a_400(env, body):
+    assert _post(env, **body).status_code == 400
+
+
+def _families(env, **query):
+    query.setdefault("json_path", env["json_path"])
+    r = env["client"].get("/api/etest/mods/families", query_string=query)
+    assert r.status_code == 200
+    return r.get_json()
+
+
+def test_families_join_tst_files_and_devices(env):
+    body = _families(env)
+    assert body["count"] == 1 and body["missing"] == []
+    assert body["tst_folder"] == str(env["tst"]) and body["version"]
+    (family,) = body["families"]
+    assert family["base"] == "c9fd_1"
+    assert family["tst_files"] == ["c9fd_1b.tst"]
+    assert family["devices"] == ["DEV_A"]
+    assert family["variants"] == [
+        {"name": "c9fd_1a", "tst": False, "devices": ["DEV_A"], "sites": [{"device": "DEV_A", "x": 1, "y": 2}]},
+        {"name": "c9fd_1b", "tst": True, "devices": [], "sites": []},
+    ]
+
+
+def test_families_filters(env):
+    body = _families(env, base=["c9fd_1", "c9fd_9", "c9fd_1"])
+    assert [f["base"] for f in body["families"]] == ["c9fd_1"]
+    assert body["missing"] == ["c9fd_9"]
+    assert _families(env, prefix="c9fd_2")["count"] == 0
+
+
+def test_families_follow_the_tst_folder(env):
+    (env["tst"] / "c9fd_5q.tst").write_text("BODY c9fd_5q\n")
+    st = os.stat(env["tst"])
+    os.utime(env["tst"], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert [f["base"] for f in _families(env)["families"]] == ["c9fd_1"]
+    body = _families(env, include_unused="1")
+    assert [f["base"] for f in body["families"]] == ["c9fd_1", "c9fd_5"]
+    assert body["families"][1]["tst_files"] == ["c9fd_5q.tst"] and body["families"][1]["devices"] == []
+
+
+def test_families_for_a_new_dataset_version(env):
+    first = _families(env)
+    records = dict(RECORDS, DEV_B={"prb": "E12A", "mod": ["c9fd_1b"], "waf": [], "wafer": {}})
+    with open(env["json_path"], "w", encoding="utf-8") as f:
+        json.dump(records, f)
+    second = _families(env)
+    assert second["version"] != first["version"]
+    assert second["families"][0]["devices"] == ["DEV_A", "DEV_B"]
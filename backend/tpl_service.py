@@ -0,0 +1,178 @@
+# backend/tpl_service.py
+"""
+On-demand .tpl generation for the API, using the same code as the batch
+script helpler/tpl.py (imported from ETEST_HELPER_DIR, default ../helpler).
+
+Generated plans are cached on disk under a hash of everything that goes into
+them: the device record (after the optional mod subset), the stat signature
+of every mod/die/waf file used and the fingerprint of the mapping tables. A
+repeated request for an unchanged device is a few stat() calls and a file
+send.
+
+The generator's c9fd variant-family index is also what mod_families()
+returns for /api/etest/mods/families.
+"""
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import threading
+from typing import List, Optional, Tuple
+
+# Bump when the plan layout written by tpl.py changes so cached plans are regenerated.
+TPL_CACHE_FORMAT = 1
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_lock = threading.Lock()
+_generator = None
+_generator_sig = None
+
+
+class TplError(Exception):
+    """Plan cannot be generated for this request; status is the HTTP code to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _helper_dir() -> str:
+    return os.environ.get("ETEST_HELPER_DIR", os.path.join(os.path.dirname(_HERE), "helpler"))
+
+
+def _tpl_module():
+    helper_dir = _helper_dir()
+    if helper_dir not in sys.path:
+        sys.path.insert(0, helper_dir)
+    import tpl  # noqa: E402  (helpler/tpl.py, only importable once its folder is on sys.path)
+    return tpl
+
+
+def cache_dir() -> str:
+    return os.environ.get("ETEST_TPL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "etest_tpl_cache"))
+
+
+def _cache_limit() -> int:
+    return int(os.environ.get("ETEST_TPL_CACHE_MAX", "500"))
+
+
+def _file_sig(path: str) -> list:
+    st = os.stat(path)
+    return [path, st.st_mtime_ns, st.st_size]
+
+
+def _mapping_sig(tpl) -> tuple:
+    sig = []
+    for path in (tpl.type_typ_file, tpl.perimeter_perim_file, tpl.vlimit_vlim_file, tpl.dtime_time_file):
+        try:
+            sig.append(tuple(_file_sig(path)))
+        except FileNotFoundError:
+            sig.append(None)
+    return tuple(sig)
+
+
+def _get_generator(tpl):
+    """
+    Process-wide TplGenerator. It is rebuilt when a mapping table changes;
+    folder listings are refreshed when a folder's mtime changes.
+    """
+    global _generator, _generator_sig
+    sig = _mapping_sig(tpl)
+    if _generator is None or sig != _generator_sig:
+        _generator = tpl.TplGenerator()
+        _generator_sig = sig
+    else:
+        _generator.refresh_if_changed()
+    return _generator
+
+
+def _select_mods(record: dict, mods: Optional[List[str]], mod_names) -> dict:
+    if mods is None:
+        return record
+    wanted = set(mods)
+    available = set(mod_names(record.get("mod", [])))
+    unknown = sorted(wanted - available)
+    if unknown:
+        raise TplError(f"mods not in device: {', '.join(unknown)}")
+    subset = [m for m in record.get("mod", []) if (m.get("name") if isinstance(m, dict) else m) in wanted]
+    return dict(record, mod=subset)
+
+
+def _cache_key(device: str, record: dict, inputs: dict, fingerprint: str) -> str:
+    files = [_file_sig(p) for p in inputs["mod_files"]]
+    files.append(_file_sig(inputs["die_path"]))
+    files.append(_file_sig(inputs["wafer_path"]))
+    blob = json.dumps([TPL_CACHE_FORMAT, device, record, files, fingerprint],
+                      sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _prune(folder: str, keep: int) -> None:
+    try:
+        entries = [e for e in os.scandir(folder) if e.name.endswith(".tpl")]
+    except FileNotFoundError:
+        return
+    if len(entries) <= keep:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime_ns)
+    for entry in entries[:len(entries) - keep]:
+        try:
+            os.unlink(entry.path)
+        except OSError:
+            pass
+
+
+def build_tpl(device: str, record: dict, mods: Optional[List[str]] = None) -> Tuple[str, str, bool]:
+    """
+    Return (path of the cached .tpl, cache key, cache hit) for device,
+    optionally restricted to a subset of its mods.
+    Raises TplError if the plan cannot be built (missing mod/die/waf file ...).
+    """
+    tpl = _tpl_module()
+    record = _select_mods(record, mods, tpl.mod_names)
+
+    with _lock:
+        generator = _get_generator(tpl)
+        inputs, reason = generator.resolve(device, record)
+        if inputs is None:
+            raise TplError(reason, 422)
+        key = _cache_key(device, record, inputs, generator.rewriter.fingerprint)
+
+        folder = cache_dir()
+        path = os.path.join(folder, key + ".tpl")
+        if os.path.exists(path):
+            try:
+                os.utime(path)  # pruning drops the least recently used plans
+            except OSError:
+                pass
+            return path, key, True
+
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tpl-", suffix=".tmp", dir=folder)
+        os.close(fd)
+        try:
+            generator.stamp = tpl.plan_stamp()
+            generator.write(device, inputs, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        _prune(folder, _cache_limit())
+        return path, key, False
+
+
+def mod_families(dataset):
+    """
+    The generator's c9fd ModFamilyIndex (helpler/mod_families.py) with dataset's
+    devices attached. Shared with build_tpl(); the device records are only
+    scanned when the dataset version changes, and a new tst folder listing
+    only rebuilds the tst side.
+    """
+    tpl = _tpl_module()
+    with _lock:
+        generator = _get_generator(tpl)
+        return generator.index_devices(dataset, dataset.version)
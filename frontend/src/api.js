@@ -27,6 +27,20 @@ export async function searchDevices(name) {
   return res.json()
 }
 
+// Resolves to a Blob with the generated <device>.tpl; mods (optional) restricts the plan to a subset.
+export async function generateTpl(device, mods) {
+  const res = await fetch(`${API_BASE}/api/etest/tpl`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(mods ? { device, mods } : { device })
+  })
+  if (!res.ok) {
+    const err = await res.json().catch(() => ({}))
+    throw new Error(err.error || `HTTP ${res.status}`)
+  }
+  return res.blob()
+}
+
 export async function health() {
   const res = await fetch(`${API_BASE}/api/health`)
   return res.json()
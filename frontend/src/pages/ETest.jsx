@@ -5,12 +5,14 @@ const API_BASE = import.meta.env.VITE_API_URL || "http://localhost:8080";
 
 export default function ETest() {
   const [jsonPath, setJsonPath] = useState("/etestnew/SPECS/usr/aquq/etest_app/output.json");
+  const [loadedPath, setLoadedPath] = useState(null); // jsonPath the device list was loaded from
   const [devices, setDevices] = useState([]);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
   const [selected, setSelected] = useState({}); // deviceName -> boolean
   const [mods, setMods] = useState([]); // [{name, devices:[]}]
   const [filter, setFilter] = useState("");
+  const [update, setUpdate] = useState(null); // last "dataset" event since the devices were loaded
 
   const selectedList = useMemo(() => Object.keys(selected).filter(k => selected[k]), [selected]);
   const filteredMods = useMemo(() => {
@@ -29,6 +31,8 @@ export default function ETest() {
       const data = await res.json();
       if (!res.ok) throw new Error(data?.error || "Failed to load devices");
       setDevices(data.devices || []);
+      setLoadedPath(jsonPath);
+      setUpdate(null);
       // Clear previous selections/result when path changes
       setSelected({});
       setMods([]);
@@ -65,6 +69,23 @@ export default function ETest() {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
+  useEffect(() => {
+    // optional: the backend announces new dataset versions, so only reload when something changed
+    // keyed on the loaded path, not the input, so typing does not reopen the stream
+    if (typeof EventSource === "undefined" || loadedPath === null) return undefined;
+    const url = new URL(`${API_BASE}/api/etest/events`);
+    if (loadedPath) url.searchParams.set("json_path", loadedPath);
+    const source = new EventSource(url.toString());
+    source.addEventListener("dataset", (e) => {
+      try {
+        setUpdate(JSON.parse(e.data));
+      } catch {
+        // ignore malformed events
+      }
+    });
+    return () => source.close();
+  }, [loadedPath]);
+
   function toggleAll(on) {
     const next = {};
     devices.forEach(d => { next[d.name] = !!on; });
@@ -110,6 +131,11 @@ export default function ETest() {
           <button onClick={() => toggleAll(true)} disabled={!devices.length}>Select all</button>
           <button onClick={() => toggleAll(false)} disabled={!devices.length}>Clear</button>
         </div>
+        {update ? (
+          <div style={{ color: "#8a6d3b", marginTop: 8 }}>
+            Dataset updated{update.changed == null ? "" : ` (${update.changed} device${update.changed === 1 ? "" : "s"} changed)`} — reload to see it.
+          </div>
+        ) : null}
         {error ? <div style={{ color: "crimson", marginTop: 8 }}>Error: {error}</div> : null}
       </section>
 
@@ -1,21 +1,32 @@
 import os
 import json
+import io
 import re
-import pandas as pd
+import argparse
+from module_catalog import DEFAULT_EDR_PATH, load_module_catalog, module_has_colon
+from json_store import ShardedDataset, read_manifest, write_json_atomic, write_sharded_dataset
+from module_graph import save_module_graph, write_module_graph
+from spec_sources import DEFAULT_PREFETCH_BUDGET, Prefetcher, add_prefetch_arguments, read_text
+from stage_profiler import NULL_PROFILER, add_profile_arguments, finish_profile, profiler_from_args
 
 # -------- helpers reused/added --------
 
+def read_spec_text(path, prof=NULL_PROFILER, sources=None):
+    """Spec file text (utf-8, undecodable bytes dropped), or None if the file is missing."""
+    return read_text(path, prof, encoding='utf-8', errors='ignore', sources=sources)
+
 def parse_waf_coords(wafer_file_path):
     """
     Read wafer file and return wafer die grid coordinates like ['2,4', '3,4', ...].
     Coordinates are taken from lines that start with a number and treat the first
     whitespace-separated token as 'Column,Row'.
     """
-    if not os.path.isfile(wafer_file_path):
+    return parse_waf_coords_text(read_spec_text(wafer_file_path))
+
+def parse_waf_coords_text(text):
+    if text is None:
         return []
     coords = []
-    with open(wafer_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        text = f.read()
     # typical files have multiple "(table end)"; the die map often appears after the 2nd one
     parts = text.split('(table end)')
     lines = parts[2].splitlines() if len(parts) >= 3 else text.splitlines()
@@ -44,12 +55,14 @@ def parse_mod_coords_from_die(die_file_path):
     Strategy: for each data line, take the first token as module name
     and the LAST TWO numeric tokens on the line as X and Y.
     """
+    return parse_mod_coords_from_die_text(read_spec_text(die_file_path))
+
+def parse_mod_coords_from_die_text(text):
     mods = {}
-    if not os.path.isfile(die_file_path):
+    if text is None:
         return mods
 
-    with open(die_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        lines = [ln.rstrip("\n") for ln in f if "table end" not in ln]
+    lines = [ln.rstrip("\n") for ln in io.StringIO(text) if "table end" not in ln]
 
     # find the '*' header marker; data starts 2 lines after (fallback to 0 if not found)
     start_idx = None
@@ -82,38 +95,40 @@ def parse_mod_coords_from_dietest(dietest_file_path):
     1) Prefer labeled values (X: <num>, Y: <num>) if present on the line.
     2) Else, use the last two numeric tokens.
     """
+    return parse_mod_coords_from_dietest_text(read_spec_text(dietest_file_path) or "")
+
+def parse_mod_coords_from_dietest_text(text):
     mods = {}
     start_extracting = False
     rx_x = re.compile(r'\bX\s*[:=]\s*(-?\d+(?:\.\d+)?)', re.IGNORECASE)
     rx_y = re.compile(r'\bY\s*[:=]\s*(-?\d+(?:\.\d+)?)', re.IGNORECASE)
 
-    with open(dietest_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        for raw in f:
-            line = raw.strip()
-            if "-" in line and "B" in line:  # heuristic for table start
-                start_extracting = True
-                continue
-            if "table end" in line and start_extracting:
-                start_extracting = False
-                continue
-            if not start_extracting or not line:
-                continue
+    for raw in io.StringIO(text):
+        line = raw.strip()
+        if "-" in line and "B" in line:  # heuristic for table start
+            start_extracting = True
+            continue
+        if "table end" in line and start_extracting:
+            start_extracting = False
+            continue
+        if not start_extracting or not line:
+            continue
 
-            name = line.split(":")[0].strip()
-            x_match = rx_x.search(line)
-            y_match = rx_y.search(line)
-            if x_match and y_match:
-                x = _to_num(x_match.group(1))
-                y = _to_num(y_match.group(1))
-                if x is not None and y is not None:
-                    mods[name] = (x, y)
-                    continue
-            nums = re.findall(r'-?\d+(?:\.\d+)?', line)
-            if len(nums) >= 2:
-                x = _to_num(nums[-2])
-                y = _to_num(nums[-1])
-                if x is not None and y is not None:
-                    mods[name] = (x, y)
+        name = line.split(":")[0].strip()
+        x_match = rx_x.search(line)
+        y_match = rx_y.search(line)
+        if x_match and y_match:
+            x = _to_num(x_match.group(1))
+            y = _to_num(y_match.group(1))
+            if x is not None and y is not None:
+                mods[name] = (x, y)
+                continue
+        nums = re.findall(r'-?\d+(?:\.\d+)?', line)
+        if len(nums) >= 2:
+            x = _to_num(nums[-2])
+            y = _to_num(nums[-1])
+            if x is not None and y is not None:
+                mods[name] = (x, y)
     return mods
 
 # ---------- Wafer/WaferTest/DIE metadata ----------
@@ -122,15 +137,15 @@ def parse_wafer_header_and_info(wafer_file_path):
     Returns header_info (desc, created, revised) and wafer_info
     (stepX_um, stepY_um, flatLocation, flatAngle_deg).
     """
+    return parse_wafer_header_and_info_text(read_spec_text(wafer_file_path))
+
+def parse_wafer_header_and_info_text(text):
     header_info = {"desc": "", "created": "", "revised": ""}
     wafer_info  = {"stepX_um": None, "stepY_um": None, "flatLocation": "", "flatAngle_deg": 0}
 
-    if not os.path.isfile(wafer_file_path):
+    if text is None:
         return header_info, wafer_info
 
-    with open(wafer_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        text = f.read()
-
     header_info["desc"]    = extract_data(r'Desc:\s+(.*)', text, "")
     header_info["created"] = extract_data(r'Creation Date:\s+(.*)', text, "")
     header_info["revised"] = extract_data(r'Revision Date:\s+(.*)', text, "")
@@ -150,18 +165,18 @@ def parse_wafertest_info(wafertest_file_path):
     """
     Returns wafer test info including align die and align module name.
     """
+    return parse_wafertest_info_text(read_spec_text(wafertest_file_path))
+
+def parse_wafertest_info_text(text):
     wt = {
         "waferType": "",
         "probeCard": "",
         "alignDie": {"x": 0, "y": 0},
         "alignModule": ""
     }
-    if not os.path.isfile(wafertest_file_path):
+    if text is None:
         return wt
 
-    with open(wafertest_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        text = f.read()
-
     wt["waferType"] = extract_data(r'WaferType:\s+(.*)', text, "")
     wt["probeCard"] = extract_data(r'ProbeCard:\s+(.*)', text, "")
     align_die = extract_data(r'Align Die:\s+(\d+,\d+)', text, "")
@@ -178,18 +193,22 @@ def parse_align_module_xy_from_die(die_file_path, align_module_name):
     """
     Find the align module row in DIE and return its X,Y (µm) using the last two numbers on that line.
     """
-    if not align_module_name or not os.path.isfile(die_file_path):
+    if not align_module_name:
+        return {"x": None, "y": None}
+    return parse_align_module_xy_from_die_text(read_spec_text(die_file_path), align_module_name)
+
+def parse_align_module_xy_from_die_text(text, align_module_name):
+    if not align_module_name or text is None:
         return {"x": None, "y": None}
 
     pat = re.compile(rf'^\s*`?{re.escape(align_module_name)}`?\b', re.IGNORECASE)
-    with open(die_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        for line in f:
-            if pat.search(line):
-                nums = re.findall(r'-?\d+(?:\.\d+)?', line)
-                if len(nums) >= 2:
-                    x = _to_num(nums[-2])
-                    y = _to_num(nums[-1])
-                    return {"x": x, "y": y}
+    for line in io.StringIO(text):
+        if pat.search(line):
+            nums = re.findall(r'-?\d+(?:\.\d+)?', line)
+            if len(nums) >= 2:
+                x = _to_num(nums[-2])
+                y = _to_num(nums[-1])
+                return {"x": x, "y": y}
     return {"x": None, "y": None}
 
 def find_center_die_and_offsets(waf_coords, step_x, step_y):
@@ -227,19 +246,20 @@ def find_center_die_and_offsets(waf_coords, step_x, step_y):
 
 # -------- your main parsing, now producing mod objects + wafer metadata --------
 
-def parse_file(file_path, wafer_root, die_root, wafertest_root, df_modules):
+def parse_file(file_path, wafer_root, die_root, wafertest_root, catalog, prof=NULL_PROFILER, sources=None):
     """
     Builds per device:
       result['prb']  -> kept as None (unless you later parse it)
       result['mod']  -> list of {'name': str, 'x': num|None, 'y': num|None} in dependency order
       result['waf']  -> list of wafer grid strings like '2,4'
       result['wafer'] -> dict with desc/created/revised, steps, flat, align info, center die + offsets
+    Each of the four spec files is read once (or taken from sources, prefetched
+    {path: bytes}); prof records per-stage timings.
     """
     result = {}
     prb = None
     no_colon = []
     yes_colon = []
-    mod_order = []
     start_extracting = False
 
     filename = os.path.basename(file_path)
@@ -247,9 +267,16 @@ def parse_file(file_path, wafer_root, die_root, wafertest_root, df_modules):
     die_file_path       = os.path.join(die_root, filename)
     wafertest_file_path = os.path.join(wafertest_root, filename)
 
-    # 1) read DIETEST to collect module names (for ordering)
-    with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-        for raw in file:
+    with prof.stage("read"):
+        dietest_text   = read_spec_text(file_path, prof, sources) or ""
+        wafer_text     = read_spec_text(wafer_file_path, prof, sources)
+        die_text       = read_spec_text(die_file_path, prof, sources)
+        wafertest_text = read_spec_text(wafertest_file_path, prof, sources)
+
+    # 1) scan DIETEST to collect module names (for ordering)
+    scanned = []
+    with prof.stage("dietest_scan"):
+        for raw in io.StringIO(dietest_text):
             line = raw.strip()
             if "-" in line and "B" in line:
                 start_extracting = True
@@ -257,14 +284,32 @@ def parse_file(file_path, wafer_root, die_root, wafertest_root, df_modules):
                 start_extracting = False
                 continue
             if start_extracting and line:
-                mod_name = line.split(":")[0].strip()
-                # classify with your Excel rules
-                rows = df_modules[df_modules['MODULE_NAME'] == mod_name]
-                if not rows.empty:
-                    has_colon = any(':' in ' '.join(r.astype(str).values) for _, r in rows.iterrows())
-                    (yes_colon if has_colon else no_colon).append(mod_name)
+                scanned.append(line.split(":")[0].strip())
+
+    # classify with your Excel rules
+    with prof.stage("catalog_lookup"):
+        for mod_name in scanned:
+            has_colon = module_has_colon(catalog, mod_name)
+            if has_colon is not None:
+                (yes_colon if has_colon else no_colon).append(mod_name)
 
     # 2) dependency-ordered module name list (same logic as before)
+    with prof.stage("dependency_order"):
+        mod_order = order_modules(no_colon, yes_colon, catalog)
+
+    with prof.stage("coords"):
+        mod_objects, waf_coords, wafer = build_coords(
+            mod_order, dietest_text, wafer_text, die_text, wafertest_text)
+
+    result["prb"] = prb
+    result["mod"] = mod_objects
+    result["waf"] = waf_coords
+    result["wafer"] = wafer
+    return result
+
+def order_modules(no_colon, yes_colon, catalog):
+    """Modules without ':' rows first, then the ':' ones so that dependencies come before dependents."""
+    mod_order = []
     for m in no_colon:
         if m not in mod_order:
             mod_order.append(m)
@@ -274,10 +319,8 @@ def parse_file(file_path, wafer_root, die_root, wafertest_root, df_modules):
     while temp_yes:
         added = False
         for m in temp_yes[:]:
-            rows = df_modules[df_modules['MODULE_NAME'] == m]
             depends = False
-            for _, r in rows.iterrows():
-                content = ' '.join(r.astype(str).values)
+            for content in catalog.get(m, ()):
                 for other in yes_colon:
                     if other != m and other in content and other not in processed:
                         depends = True
@@ -297,11 +340,14 @@ def parse_file(file_path, wafer_root, die_root, wafertest_root, df_modules):
                         mod_order.append(m)
                     processed.add(m)
             break
+    return mod_order
 
+def build_coords(mod_order, dietest_text, wafer_text, die_text, wafertest_text):
+    """Steps 3-6 of parse_file: mod objects with XY, waf grid list and the 'wafer' metadata dict."""
     # 3) get module coordinates: DIE first (robust), DIETEST as fallback
-    mod_coords = parse_mod_coords_from_die(die_file_path)
+    mod_coords = parse_mod_coords_from_die_text(die_text)
     if not mod_coords:
-        mod_coords = parse_mod_coords_from_dietest(file_path)
+        mod_coords = parse_mod_coords_from_dietest_text(dietest_text)
 
     # 4) build ordered mod objects with coords
     mod_objects = []
@@ -314,22 +360,19 @@ def parse_file(file_path, wafer_root, die_root, wafertest_root, df_modules):
         mod_objects.append({"name": name, "x": x, "y": y})
 
     # 5) wafer header + info, wafer test info, align module XY
-    header_info, wafer_info = parse_wafer_header_and_info(wafer_file_path)
-    wt_info = parse_wafertest_info(wafertest_file_path)
-    align_mod_xy = parse_align_module_xy_from_die(die_file_path, wt_info.get("alignModule"))
+    header_info, wafer_info = parse_wafer_header_and_info_text(wafer_text)
+    wt_info = parse_wafertest_info_text(wafertest_text)
+    align_mod_xy = parse_align_module_xy_from_die_text(die_text, wt_info.get("alignModule"))
 
     # 6) waf die grid list + center/offsets
-    waf_coords = parse_waf_coords(wafer_file_path)
+    waf_coords = parse_waf_coords_text(wafer_text)
     center = find_center_die_and_offsets(
         waf_coords,
         wafer_info.get("stepX_um") or 0,
         wafer_info.get("stepY_um") or 0
     )
 
-    result["prb"] = prb
-    result["mod"] = mod_objects
-    result["waf"] = waf_coords
-    result["wafer"] = {
+    wafer = {
         "desc": header_info["desc"],
         "created": header_info["created"],
         "revised": header_info["revised"],
@@ -347,32 +390,63 @@ def parse_file(file_path, wafer_root, die_root, wafertest_root, df_modules):
             "offsetY_um": center["offsetY_um"]
         }
     }
-    return result
+    return mod_objects, waf_coords, wafer
 
-def process_folder(dietest_folder, wafer_folder, die_folder, wafertest_folder, existing_data=None):
-    edr_path = r'E:\ufiles\CACH\Python_Script_Templates\C9_Master_TEST.xlsx'
-    df_modules = pd.read_excel(edr_path)
+def process_folder(dietest_folder, wafer_folder, die_folder, wafertest_folder, existing_data=None,
+                   prof=NULL_PROFILER, prefetch_workers=0, prefetch_budget=DEFAULT_PREFETCH_BUDGET):
+    """
+    With prefetch_workers > 0 the four spec files of upcoming devices are read
+    on background threads (at most prefetch_budget bytes ahead) while the
+    current device is parsed.
+    """
+    with prof.stage("catalog_load"):
+        catalog = load_module_catalog(DEFAULT_EDR_PATH)
+
+    filenames = os.listdir(dietest_folder)
+    if prefetch_workers > 0:
+        groups = (
+            (filename, [os.path.join(folder, filename)
+                        for folder in (dietest_folder, wafer_folder, die_folder, wafertest_folder)])
+            for filename in filenames
+        )
+        feed = Prefetcher(groups, prefetch_workers, prefetch_budget)
+    else:
+        feed = ((filename, None) for filename in filenames)
 
     data = existing_data if existing_data else {}
-    for filename in os.listdir(dietest_folder):
+    for filename, sources in feed:
         file_path = os.path.join(dietest_folder, filename)
-        if os.path.isfile(file_path):
+        if sources is not None:
+            is_file = sources[file_path] is not None
+        else:
+            is_file = os.path.isfile(file_path)
+        if is_file:
             print(f"Processing file: {filename}")
-            file_data = parse_file(file_path, wafer_folder, die_folder, wafertest_folder, df_modules)
-            if filename in data:
-                data[filename]["mod"] = file_data["mod"]
-                data[filename]["waf"] = file_data["waf"]
-                data[filename]["wafer"] = file_data["wafer"]
-                if data[filename].get("prb") is None:
-                    data[filename]["prb"] = file_data["prb"]
-            else:
-                data[filename] = file_data
+            with prof.device(filename):
+                file_data = parse_file(file_path, wafer_folder, die_folder, wafertest_folder, catalog, prof, sources)
+            data[filename] = merge_record(data.get(filename), file_data)
     return data
 
-def save_data_to_json(data, output_file):
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4)
-    print(f"Data saved to {output_file} in JSON format.")
+def merge_record(existing, file_data):
+    """Freshly parsed data over the previous record; a prb set earlier is kept."""
+    if existing is None:
+        return file_data
+    existing["mod"] = file_data["mod"]
+    existing["waf"] = file_data["waf"]
+    existing["wafer"] = file_data["wafer"]
+    if existing.get("prb") is None:
+        existing["prb"] = file_data["prb"]
+    return existing
+
+def save_data_to_json(data, output_file, compact=True, stamp=True):
+    """
+    Atomically replace output_file (temp file + fsync + rename), streaming one
+    device at a time. compact=True skips indentation, which is several times
+    smaller for the backend to read over NFS; stamp=True also writes
+    output_file + '.version'.
+    """
+    info = write_json_atomic(output_file, data, indent=4, compact=compact, stamp=stamp)
+    print(f"Data saved to {output_file} in JSON format ({info['bytes']} bytes, version {info['version']}).")
 
 def save_data_to_text(data, output_file):
     with open(output_file, 'w', encoding='utf-8') as f:
@@ -403,12 +477,44 @@ wafertest_folder = r"X:\etestonline\WAFERTEST"
 output_json = r"Y:\usr\aquq\etest_app\output.json"
 output_text = r"Y:\usr\aquq\etest_app\output.txt"
 
-if os.path.exists(output_json):
-    with open(output_json, 'r', encoding='utf-8') as f:
-        existing_data = json.load(f)
-else:
-    existing_data = {}
-
-data = process_folder(dietest_folder, wafer_folder, die_folder, wafertest_folder, existing_data)
-save_data_to_json(data, output_json)
-save_data_to_text(data, output_text)
+output_shards = None  # e.g. r"Y:\usr\aquq\etest_app\output.d" to also emit the sharded layout
+
+
+def load_existing_data(json_path, shards_folder=None):
+    """Previous run's data: from the shard manifest when available, else output.json."""
+    if shards_folder and read_manifest(shards_folder) is not None:
+        return dict(ShardedDataset(shards_folder))
+    if os.path.exists(json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build output.json from the DIETEST/WAFER/DIE/WAFERTEST specs.")
+    parser.add_argument("--sharded", metavar="DIR", default=output_shards,
+                        help="also write one JSON file per device plus manifest.json into DIR")
+    add_profile_arguments(parser)
+    add_prefetch_arguments(parser)
+    args = parser.parse_args(argv)
+    prof = profiler_from_args(args)
+
+    with prof.stage("existing_load"):
+        existing_data = load_existing_data(output_json, args.sharded)
+    data = process_folder(dietest_folder, wafer_folder, die_folder, wafertest_folder, existing_data, prof,
+                          prefetch_workers=args.prefetch_workers, prefetch_budget=args.prefetch_mb << 20)
+    with prof.stage("json_write"):
+        save_data_to_json(data, output_json)
+        if args.sharded:
+            manifest, written = write_sharded_dataset(args.sharded, data)
+            print(f"Sharded dataset in {args.sharded}: {len(manifest['devices'])} devices, {written} shard(s) rewritten.")
+    with prof.stage("module_graph"):
+        graph = save_module_graph(output_json, load_module_catalog(DEFAULT_EDR_PATH))
+        if args.sharded:
+            write_module_graph(args.sharded, graph)
+    save_data_to_text(data, output_text)
+    finish_profile(prof, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+
+
+class DirIndex:
+    """
+    In-memory index of one folder's listing, so per-device existence checks and
+    the c9fd "any last character" lookups don't each hit the file server.
+
+    The folder is listed once (and again on refresh()); names keep os.listdir
+    order, which is the order glob.glob returned them in.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.refresh()
+
+    def _signature(self):
+        try:
+            st = os.stat(self.folder)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_ino
+
+    def refresh(self):
+        """Re-list the folder; call after files were added or removed."""
+        self._sig = self._signature()
+        try:
+            self._order = os.listdir(self.folder)
+        except FileNotFoundError:
+            self._order = []
+        self._names = set(self._order)
+        self._families = {}  # suffix -> {stem_without_last_char: [name, ...]}
+
+    def refresh_if_changed(self):
+        """
+        Re-list only if the folder's mtime changed (one stat instead of a listing),
+        for long-running processes. Returns True if it re-listed.
+        """
+        if self._signature() == self._sig:
+            return False
+        self.refresh()
+        return True
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def exists(self, name):
+        return name in self._names
+
+    def path(self, name):
+        """Full path of name, or None if it is not in the folder."""
+        return os.path.join(self.folder, name) if name in self._names else None
+
+    @property
+    def signature(self):
+        """(mtime_ns, inode) of the folder when it was last listed, None if it did not exist."""
+        return self._sig
+
+    def families(self, suffix):
+        """
+        {stem_without_last_char: [name, ...]} over the names ending in suffix, in
+        listing order; built once per listing.
+        """
+        families = self._families.get(suffix)
+        if families is None:
+            families = {}
+            cut = len(suffix) + 1
+            for name in self._order:
+                # glob's '?' never matches a leading '.' (hidden files)
+                if name.endswith(suffix) and len(name) >= cut and not name.startswith('.'):
+                    families.setdefault(name[:-cut], []).append(name)
+            self._families[suffix] = families
+        return families
+
+    def any_last_char(self, stem, suffix):
+        """
+        Paths matching <stem[:-1]>?<suffix>, i.e. glob.glob(os.path.join(folder, f"{stem[:-1]}?{suffix}")).
+        """
+        names = self.families(suffix).get(stem[:-1], ())
+        return [os.path.join(self.folder, name) for name in names]
@@ -0,0 +1,417 @@
+import os
+import json
+import stat
+import hashlib
+import tempfile
+from collections.abc import Mapping
+from datetime import datetime
+from urllib.parse import quote
+
+# Companion file written next to the dataset, e.g. output.json.version
+VERSION_SUFFIX = '.version'
+
+
+def _current_umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# read once: os.umask can only be queried by setting it, which is not thread-safe later on
+_UMASK = _current_umask()
+
+
+def _fsync_dir(folder):
+    # make the rename itself durable; not supported on Windows, ignore there
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _publish_mode(tmp_path, path):
+    """
+    Give the temp file the mode a plain open(path, 'w') would have: the current
+    mode of the file it replaces, else 0666 minus the umask. mkstemp creates
+    0600, which would lock out readers running as another user (the backend).
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    os.chmod(tmp_path, mode)
+
+
+def _write_bytes_atomic(path, data):
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=folder)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        _publish_mode(tmp_path, path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class _HashingWriter:
+    """Text sink that encodes, hashes and counts everything written to it."""
+
+    def __init__(self, f, encoding='utf-8'):
+        self.f = f
+        self.encoding = encoding
+        self.sha = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, text):
+        b = text.encode(self.encoding)
+        self.sha.update(b)
+        self.bytes += len(b)
+        self.f.write(b)
+
+
+def iter_json_object(items, indent=4, compact=False, ensure_ascii=True):
+    """
+    Yield the text of a top-level JSON object one member at a time.
+    With compact=False the output is identical to json.dump(dict(items), f, indent=indent).
+    """
+    if compact:
+        dump_kw = {'separators': (',', ':'), 'ensure_ascii': ensure_ascii}
+        first = True
+        yield '{'
+        for key, value in items:
+            sep = '' if first else ','
+            first = False
+            yield f"{sep}{json.dumps(key, ensure_ascii=ensure_ascii)}:{json.dumps(value, **dump_kw)}"
+        yield '}'
+        return
+
+    pad = ' ' * indent
+    first = True
+    for key, value in items:
+        body = json.dumps(value, indent=indent, ensure_ascii=ensure_ascii).replace('\n', '\n' + pad)
+        lead = '{\n' if first else ',\n'
+        first = False
+        yield f"{lead}{pad}{json.dumps(key, ensure_ascii=ensure_ascii)}: {body}"
+    yield '{}' if first else '\n}'
+
+
+_WS = ' \t\n\r'
+_NUMBER_TAIL = '0123456789.eE+-'
+
+
+def iter_json_items(path, chunk_size=1 << 20):
+    """
+    Yield (key, value) pairs of a top-level JSON object file one member at a
+    time, so memory stays at one record plus one read chunk however large the
+    file is. Members are decoded with json's own raw_decode; when a member runs
+    past the buffered text, more of the file is read and the member is retried.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = ''
+        pos = 0
+        eof = False
+
+        def fill(need_more):
+            # drop what was consumed; read another chunk (bigger each time a member still does not fit)
+            nonlocal buf, pos, eof
+            buf = buf[pos:]
+            pos = 0
+            chunk = f.read(max(chunk_size, len(buf)) if need_more else chunk_size)
+            if not chunk:
+                eof = True
+            buf += chunk
+
+        def skip_ws():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in _WS:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill(False)
+
+        def expect(chars):
+            nonlocal pos
+            skip_ws()
+            if pos >= len(buf) or buf[pos] not in chars:
+                found = buf[pos:pos + 20] if pos < len(buf) else 'end of file'
+                raise ValueError(f"{path}: expected {' or '.join(repr(c) for c in chars)}, found {found!r}")
+            pos += 1
+            return buf[pos - 1]
+
+        def decode():
+            nonlocal pos
+            skip_ws()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    fill(True)
+                    continue
+                if not eof and (end == len(buf) or buf[end] in _NUMBER_TAIL):
+                    fill(True)  # a number cut at the chunk edge (12|34, 1.5|e3) continues in the next chunk
+                    continue
+                pos = end
+                return value
+
+        expect('{')
+        skip_ws()
+        if pos < len(buf) and buf[pos] == '}':
+            return
+        while True:
+            key = decode()
+            if not isinstance(key, str):
+                raise ValueError(f"{path}: object keys must be strings, found {key!r}")
+            expect(':')
+            yield key, decode()
+            if expect(',}') == '}':
+                return
+
+
+def iter_dataset(path):
+    """
+    Stream (device, record) pairs from output.json or a sharded dataset folder
+    without keeping earlier records (unlike load_dataset / ShardedDataset).
+    """
+    if os.path.basename(path) == MANIFEST_NAME:
+        path = os.path.dirname(path)
+    if not os.path.isdir(path):
+        yield from iter_json_items(path)
+        return
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise FileNotFoundError(f"No sharded dataset manifest in: {path}")
+    for name, entry in manifest.get('devices', {}).items():
+        with open(os.path.join(path, entry['file']), 'r', encoding='utf-8') as f:
+            yield name, json.load(f)
+
+
+def write_json_atomic(path, items, indent=4, compact=False, ensure_ascii=True, stamp=False):
+    """
+    Stream a {device: record} mapping to path without ever exposing a partial file.
+
+    items may be a dict or an iterable of (device, record) pairs; records are
+    serialized one at a time into a temp file in the same directory, which is
+    fsynced and then atomically renamed over path. compact=True drops the
+    indentation and uses short separators. With stamp=True a companion
+    <path>.version file records the content hash, device count and write time.
+
+    Returns {"version", "sha256", "bytes", "devices", "written_at"}.
+    """
+    if isinstance(items, dict):
+        items = items.items()
+
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+
+    count = 0
+
+    def counted():
+        nonlocal count
+        for pair in items:
+            count += 1
+            yield pair
+
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=folder)
+    try:
+        with os.fdopen(fd, 'wb', buffering=1 << 20) as f:
+            out = _HashingWriter(f)
+            for chunk in iter_json_object(counted(), indent=indent, compact=compact,
+                                          ensure_ascii=ensure_ascii):
+                out.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        _publish_mode(tmp_path, path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(folder)
+
+    digest = out.sha.hexdigest()
+    info = {
+        'version': digest[:16],
+        'sha256': digest,
+        'bytes': out.bytes,
+        'devices': count,
+        'written_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    if stamp:
+        write_version_stamp(path, info)
+    return info
+
+
+def write_json_document(path, obj):
+    """Atomically replace path with one small JSON document (companion/sidecar files)."""
+    _write_bytes_atomic(path, json.dumps(obj).encode('utf-8'))
+
+
+def write_version_stamp(path, info):
+    """Atomically write the <path>.version companion file."""
+    write_json_document(path + VERSION_SUFFIX, info)
+
+
+def read_version_stamp(path):
+    """Return the parsed <path>.version companion, or None if absent/unreadable."""
+    try:
+        with open(path + VERSION_SUFFIX, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ---------- sharded layout: <folder>/manifest.json + <folder>/devices/<device>.json ----------
+
+MANIFEST_NAME = 'manifest.json'
+SHARD_DIR = 'devices'
+SHARD_FORMAT = 1
+
+
+def shard_filename(device):
+    # device keys are source file names; quote anything that is not filename-safe
+    return quote(device, safe='') + '.json'
+
+
+def read_manifest(folder):
+    """Return the parsed manifest of a sharded dataset folder, or None."""
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get('format') != SHARD_FORMAT:
+        return None
+    return manifest
+
+
+def write_sharded_dataset(folder, items):
+    """
+    Write one compact JSON file per device plus a manifest.json listing every
+    device with its shard file, mod count, prb and content hash.
+
+    Shards whose content hash matches the existing manifest are left untouched,
+    so regenerating a single device rewrites a single small file (plus the
+    manifest). Shards of devices that disappeared are removed. Every shard and
+    the manifest are replaced atomically, the manifest last.
+
+    Returns (manifest, written_count).
+    """
+    if isinstance(items, dict):
+        items = items.items()
+
+    shard_root = os.path.join(folder, SHARD_DIR)
+    os.makedirs(shard_root, exist_ok=True)
+    previous = (read_manifest(folder) or {}).get('devices', {})
+
+    devices = {}
+    written = 0
+    for name, record in items:
+        body = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+        rel = SHARD_DIR + '/' + shard_filename(name)
+        shard_path = os.path.join(folder, rel)
+        old = previous.get(name)
+        if not (old and old.get('sha256') == digest and old.get('file') == rel
+                and os.path.isfile(shard_path)):
+            _write_bytes_atomic(shard_path, body)
+            written += 1
+        mods = record.get('mod') if isinstance(record, dict) else None
+        devices[name] = {
+            'file': rel,
+            'mod_count': len(mods) if isinstance(mods, list) else 0,
+            'prb': record.get('prb') if isinstance(record, dict) else None,
+            'sha256': digest,
+            'bytes': len(body),
+        }
+
+    for name, old in previous.items():
+        if name not in devices and old.get('file'):
+            try:
+                os.unlink(os.path.join(folder, old['file']))
+            except OSError:
+                pass
+
+    version = hashlib.sha256()
+    for name in sorted(devices):
+        version.update(name.encode('utf-8') + b'\0' + devices[name]['sha256'].encode('ascii') + b'\n')
+    manifest = {
+        'format': SHARD_FORMAT,
+        'version': version.hexdigest()[:16],
+        'written_at': datetime.now().isoformat(timespec='seconds'),
+        'devices': devices,
+    }
+    _write_bytes_atomic(os.path.join(folder, MANIFEST_NAME),
+                        json.dumps(manifest, separators=(',', ':')).encode('utf-8'))
+    _fsync_dir(folder)
+    return manifest, written
+
+
+class ShardedDataset(Mapping):
+    """
+    Read-only {device: record} mapping over a sharded dataset folder.
+    The manifest is read eagerly; device shards are read (and kept) on first access.
+    """
+
+    def __init__(self, folder):
+        manifest = read_manifest(folder)
+        if manifest is None:
+            raise FileNotFoundError(f"No sharded dataset manifest in: {folder}")
+        self.folder = folder
+        self.manifest = manifest
+        self.version = manifest.get('version')
+        self._entries = manifest.get('devices', {})
+        self._records = {}
+
+    def meta(self, name):
+        """Manifest entry (file, mod_count, prb, sha256, bytes) without reading the shard."""
+        return self._entries.get(name)
+
+    def __getitem__(self, name):
+        if name in self._records:
+            return self._records[name]
+        entry = self._entries[name]
+        with open(os.path.join(self.folder, entry['file']), 'r', encoding='utf-8') as f:
+            record = json.load(f)
+        self._records[name] = record
+        return record
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+
+def load_dataset(path):
+    """
+    Open a dataset for reading: a sharded folder (or its manifest.json) gives a
+    lazy ShardedDataset, anything else is parsed as a monolithic output.json.
+    """
+    if os.path.basename(path) == MANIFEST_NAME:
+        path = os.path.dirname(path)
+    if os.path.isdir(path):
+        return ShardedDataset(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
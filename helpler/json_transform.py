@@ -0,0 +1,191 @@
+"""
+Bulk edits of output.json (or a sharded dataset folder) in constant memory.
+
+The input is read one device at a time (json_store.iter_dataset), each record
+goes through the operations in the order they were given on the command line,
+and the result is streamed to the output through write_json_atomic, so only
+one record is ever held in memory and readers never see a half-written file.
+
+Operations (repeatable, applied in command-line order):
+    --reset FIELD[=JSON]     set FIELD to JSON where the record has it
+                             (default: the empty value of the field's current type)
+    --drop PATTERN           drop devices whose name matches the glob PATTERN
+    --rename OLD=NEW         rename record key OLD to NEW
+    --keep-mods PATTERN      keep only the mods whose name matches PATTERN
+    --drop-mods PATTERN      remove the mods whose name matches PATTERN
+
+Examples:
+    python json_transform.py output.json -o output_new.json --reset mod={}
+    python json_transform.py output.json --in-place --drop 'TEST*' --drop-mods 'c9fd_99*'
+"""
+import os
+import argparse
+import fnmatch
+import json
+from collections import Counter
+
+from json_store import MANIFEST_NAME, iter_dataset, write_json_atomic
+
+_EMPTY = {dict: dict, list: list, str: str, int: int, float: float, bool: bool}
+_NO_VALUE = object()  # --reset FIELD without =JSON (null is a value)
+
+
+def _mod_name(mod):
+    return mod.get('name') if isinstance(mod, dict) else mod
+
+
+def reset_field(field, value=_NO_VALUE):
+    """Set field (where present) to a copy of value, or to the empty value of its current type if no value is given."""
+    encoded = json.dumps(value) if value is not _NO_VALUE else None
+
+    def op(name, record):
+        if field not in record:
+            return record, False
+        if encoded is not None:
+            record[field] = json.loads(encoded)
+        else:
+            current = record[field]
+            record[field] = _EMPTY[type(current)]() if type(current) in _EMPTY else None
+        return record, True
+    return op
+
+
+def drop_devices(pattern):
+    def op(name, record):
+        if fnmatch.fnmatchcase(name, pattern):
+            return None, True
+        return record, False
+    return op
+
+
+def rename_key(old, new):
+    def op(name, record):
+        if old not in record:
+            return record, False
+        # rebuild so NEW takes OLD's position instead of moving to the end
+        return {new if k == old else k: v for k, v in record.items() if k != new or k == old}, True
+    return op
+
+
+def filter_mods(pattern, keep):
+    def op(name, record):
+        mods = record.get('mod')
+        if not isinstance(mods, list):
+            return record, False
+        kept = [m for m in mods if isinstance(_mod_name(m), str)
+                and fnmatch.fnmatchcase(_mod_name(m), pattern) == keep]
+        if len(kept) == len(mods):
+            return record, False
+        record['mod'] = kept
+        return record, True
+    return op
+
+
+def transform(items, ops, stats):
+    """
+    Apply ops to a stream of (device, record) pairs, yielding the results.
+    ops is [(label, op)]; stats counts, per label, the devices it changed.
+    """
+    for name, record in items:
+        stats['read'] += 1
+        for label, op in ops:
+            if not isinstance(record, dict):
+                break
+            record, changed = op(name, record)
+            if changed:
+                stats[label] += 1
+            if record is None:
+                break
+        if record is None:
+            continue
+        stats['written'] += 1
+        yield name, record
+
+
+class _OpAction(argparse.Action):
+    """Collects every operation flag into one ordered list."""
+
+    def __call__(self, parser, namespace, value, option_string=None):
+        ops = getattr(namespace, 'ops', None) or []
+        try:
+            op = self.const(value)
+        except ValueError as e:
+            parser.error(f"{option_string} {value}: {e}")
+        ops.append((f"{option_string} {value}", op))
+        namespace.ops = ops
+
+
+def _split(value, sep='='):
+    key, found, rest = value.partition(sep)
+    if not key:
+        raise ValueError('missing name before =')
+    return key, rest if found else None
+
+
+def _reset_op(value):
+    field, raw = _split(value)
+    return reset_field(field, json.loads(raw) if raw is not None else _NO_VALUE)
+
+
+def _rename_op(value):
+    old, new = _split(value)
+    if not new:
+        raise ValueError('expected OLD=NEW')
+    return rename_key(old, new)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Stream output.json through per-device edits in constant memory.')
+    parser.add_argument('input', help='output.json or a sharded dataset folder')
+    out = parser.add_mutually_exclusive_group(required=True)
+    out.add_argument('-o', '--output', help='file to write (replaced atomically)')
+    out.add_argument('--in-place', action='store_true', help='replace the input file')
+    out.add_argument('--dry-run', action='store_true', help='only report what would change')
+    parser.add_argument('--reset', metavar='FIELD[=JSON]', action=_OpAction, const=_reset_op, dest='ops')
+    parser.add_argument('--drop', metavar='PATTERN', action=_OpAction, const=drop_devices, dest='ops')
+    parser.add_argument('--rename', metavar='OLD=NEW', action=_OpAction, const=_rename_op, dest='ops')
+    parser.add_argument('--keep-mods', metavar='PATTERN', action=_OpAction,
+                        const=lambda p: filter_mods(p, True), dest='ops')
+    parser.add_argument('--drop-mods', metavar='PATTERN', action=_OpAction,
+                        const=lambda p: filter_mods(p, False), dest='ops')
+    parser.add_argument('--indent', type=int, default=4, help='indentation when not --compact (default: %(default)s)')
+    parser.add_argument('--compact', action='store_true', help='no indentation, short separators')
+    parser.add_argument('--no-ascii', dest='ensure_ascii', action='store_false',
+                        help='write non-ASCII characters as-is instead of \\u escapes')
+    parser.add_argument('--stamp', action='store_true', help='also write the <output>.version companion')
+    return parser
+
+
+def run(input_path, ops, output=None, indent=4, compact=False, ensure_ascii=True, stamp=False):
+    """Stream input_path through ops into output (None: dry run). Returns the stats Counter."""
+    stats = Counter()
+    items = transform(iter_dataset(input_path), ops, stats)
+    if output is None:
+        for _ in items:
+            pass
+        return stats
+    info = write_json_atomic(output, items, indent=indent, compact=compact, ensure_ascii=ensure_ascii, stamp=stamp)
+    stats['bytes'] = info['bytes']
+    return stats
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    ops = args.ops or []
+    if not ops:
+        parser.error('no operation given (--reset, --drop, --rename, --keep-mods, --drop-mods)')
+    if args.in_place and (os.path.isdir(args.input) or os.path.basename(args.input) == MANIFEST_NAME):
+        parser.error('--in-place needs a JSON file; write a sharded folder out with -o')
+    output = None if args.dry_run else (args.input if args.in_place else args.output)
+    stats = run(args.input, ops, output, indent=args.indent, compact=args.compact,
+                ensure_ascii=args.ensure_ascii, stamp=args.stamp)
+    for label, _ in ops:
+        print(f"  {stats[label]:>6}  {label}")
+    target = output if output is not None else '(dry run)'
+    print(f"Read {stats['read']} devices, wrote {stats['written']} to {target}.")
+    return stats
+
+
+if __name__ == '__main__':
+    main()
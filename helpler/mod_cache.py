@@ -0,0 +1,102 @@
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+# bodies kept in memory; a long-running caller (the API) would otherwise keep every edited version
+DEFAULT_MAX_BODIES = 2048
+
+
+class ModBodyCache:
+    """
+    Transformed .tst mod bodies, memoized across devices.
+
+    A body is keyed by the mod file's path, mtime and size plus the rewriter's
+    fingerprint (hash of the four mapping tables and rule version), so each
+    mod file is read and transformed once per run and every later device that
+    includes it just writes the cached text. With cache_dir set the bodies are
+    also kept on disk and survive between runs.
+
+    At most max_bodies bodies stay in memory (least recently used go first),
+    and a new version of a mod file replaces the body of its previous version.
+    """
+
+    def __init__(self, rewriter, cache_dir=None, max_bodies=DEFAULT_MAX_BODIES):
+        self.rewriter = rewriter
+        self.cache_dir = cache_dir
+        self.max_bodies = max_bodies
+        self._bodies = OrderedDict()  # key -> body, least recently used first
+        self._latest = {}  # abspath -> key of the version held in _bodies
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, path):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size, self.rewriter.fingerprint)
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256("\0".join(map(str, key)).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".body")
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key), "r", encoding="utf-8", newline="") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, body):
+        fd, tmp_path = tempfile.mkstemp(prefix=".body-", suffix=".tmp", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                f.write(body)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            print(f"Could not cache mod body on disk: {e}")
+
+    def transform(self, path):
+        """Read path and return its transformed body (no caching)."""
+        with open(path, "r") as mf:
+            return "".join(self.rewriter.rewrite_lines(mf))
+
+    def _remember(self, key, body):
+        stale = self._latest.get(key[0])
+        if stale is not None and stale != key:
+            self._bodies.pop(stale, None)  # the file was edited (or the mapping tables changed)
+        self._latest[key[0]] = key
+        self._bodies[key] = body
+        while len(self._bodies) > self.max_bodies:
+            old_key, _ = self._bodies.popitem(last=False)
+            if self._latest.get(old_key[0]) == old_key:
+                del self._latest[old_key[0]]
+
+    def get(self, path):
+        key = self._key(path)
+        body = self._bodies.get(key)
+        if body is not None:
+            self._bodies.move_to_end(key)
+            self.hits += 1
+            return body
+        if self.cache_dir:
+            body = self._read_disk(key)
+            if body is not None:
+                self.disk_hits += 1
+                self._remember(key, body)
+                return body
+        self.misses += 1
+        body = self.transform(path)
+        self._remember(key, body)
+        if self.cache_dir:
+            self._write_disk(key, body)
+        return body
+
+    def stats(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "entries": len(self._bodies)}
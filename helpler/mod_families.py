@@ -0,0 +1,116 @@
+import os
+from collections.abc import Mapping
+
+# c9fd mods come in variants that differ only in the last character (c9fd_4004a, c9fd_4004b, ...)
+FAMILY_PREFIX = "c9fd"
+TST_SUFFIX = ".tst"
+
+
+def family_base(mod):
+    """Name shared by a c9fd mod's variants (the mod minus its last character), None for other mods."""
+    if mod.startswith(FAMILY_PREFIX):
+        return mod[:-1]
+    return None
+
+
+class DeviceVariants:
+    """
+    Dataset side of the families: base -> variant -> [(device, x, y), ...] for
+    every device whose mod list names a c9fd variant. Built once per dataset
+    version; only this map is kept, not the records it was built from.
+    """
+
+    def __init__(self, devices, version=None):
+        self.version = version
+        self._by_base = {}
+        for device, record in devices.items():
+            if not isinstance(record, Mapping):
+                continue
+            for mod in record.get("mod") or ():
+                if isinstance(mod, Mapping):
+                    name, x, y = mod.get("name"), mod.get("x"), mod.get("y")
+                else:
+                    name, x, y = mod, None, None
+                if not isinstance(name, str):
+                    continue
+                base = family_base(name)
+                if base is not None:
+                    self._by_base.setdefault(base, {}).setdefault(name, []).append((device, x, y))
+
+    def get(self, base, default=None):
+        """{variant: [(device, x, y), ...]} of one family."""
+        return self._by_base.get(base, default)
+
+    def __contains__(self, base):
+        return base in self._by_base
+
+    def __iter__(self):
+        return iter(self._by_base)
+
+
+class ModFamilyIndex:
+    """
+    c9fd variant families:
+
+    - tst side: base -> the <base>?.tst files, the set check_mod_files() adds for
+      any mod of the family (what glob("<base>?.tst") used to return), taken
+      from the tst folder listing;
+    - dataset side: a DeviceVariants, built separately and shared, so a new
+      tst listing does not re-scan the device records.
+
+    Instances are read-only; TplGenerator builds a new one when the tst folder
+    is re-listed or a different dataset version is attached.
+    """
+
+    def __init__(self, tst_index, variants=None):
+        self.tst_folder = tst_index.folder
+        self.tst_signature = tst_index.signature
+        self.version = variants.version if variants is not None else None
+        self.has_devices = variants is not None
+        self._tst = tst_index.families(TST_SUFFIX)
+        self._variants = variants if variants is not None else {}
+
+    @property
+    def key(self):
+        """(dataset version, tst folder signature) this index was built from."""
+        return self.version, self.tst_signature
+
+    def tst_names(self, base):
+        return self._tst.get(base, ())
+
+    def tst_files(self, mod):
+        """Paths of every tst file in mod's family (<mod[:-1]>?.tst), in listing order."""
+        return [os.path.join(self.tst_folder, name) for name in self.tst_names(mod[:-1])]
+
+    def bases(self, include_unused=False):
+        """Sorted family bases used by the dataset, plus those only present as tst files if include_unused."""
+        bases = set(self._variants)
+        if include_unused:
+            bases.update(base for base in self._tst if base.startswith(FAMILY_PREFIX))
+        return sorted(bases)
+
+    def __contains__(self, base):
+        return base in self._variants or (base.startswith(FAMILY_PREFIX) and base in self._tst)
+
+    def family(self, base):
+        """
+        {"base", "tst_files": [name, ...], "devices": [device, ...],
+         "variants": [{"name", "tst": bool, "devices": [...], "sites": [{"device", "x", "y"}, ...]}, ...]}
+        """
+        tst_names = self.tst_names(base)
+        used = self._variants.get(base, {})
+        names = set(used)
+        names.update(name[:-len(TST_SUFFIX)] for name in tst_names)
+        variants = []
+        devices = set()
+        for name in sorted(names):
+            sites = used.get(name, ())
+            users = sorted({device for device, _, _ in sites})
+            devices.update(users)
+            variants.append({
+                "name": name,
+                "tst": name + TST_SUFFIX in tst_names,
+                "devices": users,
+                "sites": [{"device": device, "x": x, "y": y} for device, x, y in sites],
+            })
+        return {"base": base, "tst_files": list(tst_names), "devices": sorted(devices), "variants": variants}
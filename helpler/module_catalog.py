@@ -0,0 +1,130 @@
+import os
+import hashlib
+import pickle
+import tempfile
+
+# Bump when the sidecar layout changes so stale caches are rebuilt.
+CATALOG_FORMAT = 1
+
+DEFAULT_EDR_PATH = r'E:\ufiles\CACH\Python_Script_Templates\C9_Master_TEST.xlsx'
+
+
+def _file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def default_cache_path(edr_path):
+    """Sidecar lives next to the workbook, e.g. C9_Master_TEST.xlsx.catalog.pkl"""
+    return edr_path + '.catalog.pkl'
+
+
+def _fallback_cache_path(edr_path):
+    # used when the workbook folder is read-only for this user
+    tag = hashlib.sha1(os.path.abspath(edr_path).encode('utf-8')).hexdigest()[:12]
+    name = f"{os.path.basename(edr_path)}.{tag}.catalog.pkl"
+    return os.path.join(tempfile.gettempdir(), 'etest_catalog', name)
+
+
+def _read_sidecar(cache_path):
+    try:
+        with open(cache_path, 'rb') as f:
+            payload = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        return None
+    if not isinstance(payload, dict) or payload.get('format') != CATALOG_FORMAT:
+        return None
+    return payload
+
+
+def _write_sidecar(cache_path, payload):
+    folder = os.path.dirname(cache_path) or '.'
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.catalog-', suffix='.tmp', dir=folder)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def build_catalog_rows(edr_path):
+    """
+    Read the workbook and return {MODULE_NAME: (row_content, ...)}.
+    row_content is the row's cells joined by spaces (as ' '.join(row.astype(str).values)
+    did) -- exactly the string the colon / dependency checks look at.
+    """
+    import pandas as pd  # only needed when the sidecar is (re)built
+
+    df = pd.read_excel(edr_path)
+    rows = {}
+    for _, row in df.iterrows():
+        name = row['MODULE_NAME']
+        if not isinstance(name, str):
+            continue
+        rows.setdefault(name, []).append(' '.join(str(v) for v in row.values))
+    return {name: tuple(contents) for name, contents in rows.items()}
+
+
+def load_module_catalog(edr_path=DEFAULT_EDR_PATH, cache_path=None):
+    """
+    Return the module catalog {MODULE_NAME: (row_content, ...)} for edr_path.
+
+    The parsed workbook is cached in a pickle sidecar keyed by the workbook's
+    mtime/size and sha256. A matching mtime/size is trusted as-is; otherwise the
+    workbook is hashed and only re-parsed (with pandas) when the content really
+    changed.
+    """
+    if cache_path is None:
+        cache_path = default_cache_path(edr_path)
+
+    st = os.stat(edr_path)
+    candidates = [cache_path]
+    if cache_path == default_cache_path(edr_path):
+        candidates.append(_fallback_cache_path(edr_path))
+
+    payload = None
+    for path in candidates:
+        payload = _read_sidecar(path)
+        if payload is not None:
+            break
+
+    if payload is not None:
+        src = payload['source']
+        if src['mtime_ns'] == st.st_mtime_ns and src['size'] == st.st_size:
+            return payload['rows']
+
+    digest = _file_sha256(edr_path)
+    if payload is not None and payload['source']['sha256'] == digest:
+        rows = payload['rows']  # touched but unchanged: just refresh the stamp
+    else:
+        rows = build_catalog_rows(edr_path)
+
+    payload = {
+        'format': CATALOG_FORMAT,
+        'source': {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'sha256': digest},
+        'rows': rows,
+    }
+    for path in candidates:
+        try:
+            _write_sidecar(path, payload)
+            break
+        except OSError as e:
+            print(f"Could not write catalog cache {path}: {e}")
+    return rows
+
+
+def module_has_colon(catalog, module_name):
+    """None if the module is not in the catalog, else whether any row has ':'."""
+    contents = catalog.get(module_name)
+    if not contents:
+        return None
+    return any(':' in content for content in contents)
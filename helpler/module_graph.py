@@ -0,0 +1,110 @@
+"""
+Module dependency graph of the master test catalog, persisted next to the dataset.
+
+device_dic.order_modules() places a ':' module after every other ':' module
+whose name appears in one of its catalog rows. build_module_graph() computes
+those same edges once for the whole catalog, and write_module_graph() stores
+them beside output.json (output.json.modgraph.json, or module_graph.json
+inside a sharded dataset folder) so the backend can answer dependency
+questions without opening the workbook.
+
+    python module_graph.py [--edr C9_Master_TEST.xlsx] [--dataset output.json]
+"""
+import os
+import hashlib
+import argparse
+import json
+from datetime import datetime
+
+from json_store import MANIFEST_NAME, write_json_document
+from module_catalog import DEFAULT_EDR_PATH, load_module_catalog, module_has_colon
+
+# Bump when the file layout changes; the backend ignores other formats.
+GRAPH_FORMAT = 1
+GRAPH_SUFFIX = '.modgraph.json'   # output.json -> output.json.modgraph.json
+GRAPH_NAME = 'module_graph.json'  # inside a sharded dataset folder
+
+
+def graph_path(dataset_path):
+    """Where the graph for the dataset at dataset_path lives."""
+    if os.path.basename(dataset_path) == MANIFEST_NAME:
+        dataset_path = os.path.dirname(dataset_path)
+    if os.path.isdir(dataset_path):
+        return os.path.join(dataset_path, GRAPH_NAME)
+    return dataset_path + GRAPH_SUFFIX
+
+
+def dependency_edges(catalog):
+    """
+    {module: [dependency, ...]} for every ':' module of the catalog, using the
+    order_modules() rule: other is a dependency of m if other is another ':'
+    module and occurs as a substring of one of m's rows.
+
+    Instead of testing every name against every row, each row is cut into
+    windows of every distinct name length and the windows are looked up in
+    the name set, so the cost grows with the row text, not with names x rows.
+    """
+    colon = sorted(name for name in catalog if module_has_colon(catalog, name))
+    by_length = {}
+    for name in colon:
+        by_length.setdefault(len(name), set()).add(name)
+
+    edges = {}
+    for m in colon:
+        found = set()
+        for content in catalog[m]:
+            for length, names in by_length.items():
+                if length <= len(content):
+                    found.update(names.intersection(
+                        content[i:i + length] for i in range(len(content) - length + 1)))
+        found.discard(m)
+        edges[m] = sorted(found)
+    return edges
+
+
+def build_module_graph(catalog):
+    """
+    The persisted document:
+    {"format", "version", "built_at", "modules": {name: {"colon": bool, "depends": [name, ...]}}}
+    version is a content hash, so rebuilding from an unchanged catalog gives the same value.
+    """
+    edges = dependency_edges(catalog)
+    modules = {}
+    for name in sorted(catalog):
+        modules[name] = {'colon': name in edges, 'depends': edges.get(name, [])}
+    digest = hashlib.sha256(json.dumps(modules, sort_keys=True).encode('utf-8')).hexdigest()
+    return {
+        'format': GRAPH_FORMAT,
+        'version': digest[:16],
+        'built_at': datetime.now().isoformat(timespec='seconds'),
+        'modules': modules,
+    }
+
+
+def write_module_graph(dataset_path, graph):
+    """Atomically write graph next to the dataset; returns the file path."""
+    path = graph_path(dataset_path)
+    write_json_document(path, graph)
+    return path
+
+
+def save_module_graph(dataset_path, catalog):
+    graph = build_module_graph(catalog)
+    path = write_module_graph(dataset_path, graph)
+    edges = sum(len(m['depends']) for m in graph['modules'].values())
+    print(f"Module graph saved to {path} ({len(graph['modules'])} modules, {edges} dependencies, "
+          f"version {graph['version']}).")
+    return graph
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute the catalog module dependency graph for the backend.')
+    parser.add_argument('--edr', default=DEFAULT_EDR_PATH, help='master test workbook (C9_Master_TEST.xlsx)')
+    parser.add_argument('--dataset', required=True,
+                        help='output.json or sharded dataset folder the graph is stored next to')
+    args = parser.parse_args(argv)
+    save_module_graph(args.dataset, load_module_catalog(args.edr))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,432 @@
+"""
+Incremental runner for the three SPEC conversion scripts.
+
+Per device there are up to three targets:
+    wafdie:<dev>   .die/.waf            <- DIE/WAFER/WAFERTEST sources, catalog   (waf_die_trans)
+    record:<dev>   output.json record   <- DIETEST/WAFER/DIE/WAFERTEST, catalog   (device_dic)
+    tpl:<dev>      .tpl                 <- record, .die/.waf, tst mod files, maps (tpl)
+plus one dataset target that writes output.json from all records.
+
+A target is rebuilt only when the hash of its inputs (file contents, the code
+that builds it, upstream records) differs from the last successful run, or its
+outputs were changed/removed since. File hashes are memoized by mtime/size in
+the state file, so an unchanged tree costs one stat() per input. Independent
+devices run concurrently in worker processes.
+
+tpl targets read the .die/.waf files written by waf_die_trans (its waf_folder /
+die_folder), not tpl.py's own default folders.
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import device_dic
+import tpl
+import waf_die_trans
+from json_store import write_json_atomic
+from module_catalog import load_module_catalog
+from module_graph import save_module_graph
+
+
+STATE_FORMAT = 1
+DEFAULT_STATE_PATH = device_dic.output_json + '.pipeline.json'
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# changing the code that builds a target invalidates it
+CODE_FILES = {
+    'wafdie': ['waf_die_trans.py', 'spec_writer.py', 'module_catalog.py', 'spec_sources.py'],
+    'record': ['device_dic.py', 'module_catalog.py', 'spec_sources.py'],
+    'tpl': ['tpl.py', 'tst_rewrite.py', 'spec_writer.py', 'mod_cache.py', 'mod_families.py', 'dir_index.py'],
+    'dataset': ['json_store.py', 'module_graph.py'],
+}
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def record_sha256(record):
+    return hashlib.sha256(json.dumps(record, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class FileHashes:
+    """sha256 per file, reused while (mtime_ns, size) is unchanged; None for missing files."""
+
+    def __init__(self, known=None):
+        self.known = known or {}  # path -> [mtime_ns, size, sha256]
+        self.hashed = 0
+
+    def get(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        entry = self.known.get(path)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2]
+        digest = file_sha256(path)
+        self.known[path] = [st.st_mtime_ns, st.st_size, digest]
+        self.hashed += 1
+        return digest
+
+
+class Target:
+    def __init__(self, kind, device, deps=()):
+        self.kind = kind
+        self.device = device
+        self.name = f"{kind}:{device}" if device else kind
+        self.deps = list(deps)
+        self.status = 'pending'  # -> fresh | built | stale | skipped | failed | blocked
+        self.detail = ''
+        self.key = None
+        self.payload = None
+        self.outputs = {}
+        self.seconds = 0.0
+
+
+# ---------- worker side ----------
+
+_worker = {}
+
+
+def _init_worker(stamp):
+    _worker.clear()
+    _worker['stamp'] = stamp
+
+
+def _catalog():
+    if 'catalog' not in _worker:
+        _worker['catalog'] = load_module_catalog(waf_die_trans.EDR)
+    return _worker['catalog']
+
+
+def _tpl_generator():
+    if 'tpl' not in _worker:
+        _worker['tpl'] = tpl.TplGenerator(_worker.get('stamp'), die_dir=waf_die_trans.die_folder,
+                                          wafer_dir=waf_die_trans.waf_folder)
+    return _worker['tpl']
+
+
+def run_target(kind, device, payload):
+    """Build one target; returns (ok, result or error text, seconds)."""
+    t0 = time.perf_counter()
+    try:
+        if kind == 'wafdie':
+            waf_die_trans.translate_device(device, _catalog())
+            result = None
+        elif kind == 'record':
+            result = device_dic.parse_file(os.path.join(device_dic.dietest_folder, device), device_dic.wafer_folder,
+                                           device_dic.die_folder, device_dic.wafertest_folder, _catalog())
+        elif kind == 'tpl':
+            result = os.path.join(tpl.tpl_folder, f"{device}.tpl")
+            _tpl_generator().write(device, payload, result)
+        else:
+            raise ValueError(f"unknown target kind: {kind}")
+        return True, result, time.perf_counter() - t0
+    except Exception as e:
+        return False, f"{type(e).__name__}: {e}", time.perf_counter() - t0
+
+
+# ---------- planning / staleness ----------
+
+class Pipeline:
+    def __init__(self, state_path=DEFAULT_STATE_PATH, workers=1, devices=None, dry_run=False):
+        self.state_path = state_path
+        self.workers = workers
+        self.only = set(devices) if devices else None
+        self.dry_run = dry_run
+        state = self._read_state()
+        self.previous = state.get('targets', {})
+        self.hashes = FileHashes(state.get('files'))
+        self.new_state = {}
+        self.data = device_dic.load_existing_data(device_dic.output_json)
+        self.stamp = tpl.plan_stamp()
+        self.tpl_generator = None
+        self.targets = {}
+        self.stage_seconds = {}
+        self._code = {}
+
+    def _read_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return state if state.get('format') == STATE_FORMAT else {}
+
+    def _wanted(self, device):
+        return self.only is None or device in self.only
+
+    def _listdir(self, folder):
+        try:
+            return sorted(os.listdir(folder))
+        except FileNotFoundError:
+            return []
+
+    def plan(self):
+        wafdie = [d for d in self._listdir(waf_die_trans.die_source_folder)
+                  if self._wanted(d) and all(os.path.isfile(p) for p in waf_die_trans.source_paths(d))]
+        records = [d for d in self._listdir(device_dic.dietest_folder)
+                   if self._wanted(d) and os.path.isfile(os.path.join(device_dic.dietest_folder, d))]
+        for d in wafdie:
+            self._add(Target('wafdie', d))
+        for d in records:
+            self._add(Target('record', d))
+        self._add(Target('dataset', None, [f"record:{d}" for d in records]))
+        for d in sorted(set(records) | {d for d in self.data if self._wanted(d)}):
+            deps = [name for name in (f"record:{d}", f"wafdie:{d}") if name in self.targets]
+            self._add(Target('tpl', d, deps))
+        return self.targets
+
+    def _add(self, target):
+        self.targets[target.name] = target
+
+    def _code_hashes(self, kind):
+        if kind not in self._code:
+            self._code[kind] = [(name, self.hashes.get(os.path.join(HERE, name))) for name in CODE_FILES[kind]]
+        return self._code[kind]
+
+    def _key(self, kind, parts):
+        blob = json.dumps([STATE_FORMAT, kind, self._code_hashes(kind), parts], sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def _files_key(self, kind, paths, extra=None):
+        return self._key(kind, [[(p, self.hashes.get(p)) for p in paths], extra])
+
+    def _outputs_intact(self, target, previous):
+        for path, digest in previous.get('outputs', {}).items():
+            if path.startswith('record:'):
+                record = self.data.get(target.device)
+                if record is None or record_sha256(record) != digest:
+                    return False
+            elif self.hashes.get(path) != digest:
+                return False
+        return True
+
+    def _tpl_inputs(self, device):
+        if self.tpl_generator is None:
+            self.tpl_generator = tpl.TplGenerator(self.stamp, die_dir=waf_die_trans.die_folder,
+                                                  wafer_dir=waf_die_trans.waf_folder)
+        gen = self.tpl_generator
+        gen.refresh_if_changed()
+        inputs, reason = gen.resolve(device, self.data[device])
+        if inputs is None and reason.endswith('file is missing'):
+            gen.refresh()  # coarse directory mtimes can hide a file written moments ago
+            inputs, reason = gen.resolve(device, self.data[device])
+        return inputs, reason
+
+    def prepare(self, target):
+        """Compute target.key; returns False (with status/detail set) if it should not be built."""
+        d = target.device
+        if target.kind == 'wafdie':
+            target.key = self._files_key('wafdie', waf_die_trans.source_paths(d) + [waf_die_trans.EDR])
+        elif target.kind == 'record':
+            paths = [os.path.join(folder, d) for folder in (device_dic.dietest_folder, device_dic.wafer_folder,
+                                                            device_dic.die_folder, device_dic.wafertest_folder)]
+            target.key = self._files_key('record', paths + [device_dic.DEFAULT_EDR_PATH])
+        elif target.kind == 'dataset':
+            target.key = self._key('dataset', sorted((name, record_sha256(rec)) for name, rec in self.data.items()))
+        elif target.kind == 'tpl':
+            if d not in self.data:
+                target.status, target.detail = 'skipped', 'no record'
+                return False
+            inputs, reason = self._tpl_inputs(d)
+            if inputs is None:
+                target.status, target.detail = 'skipped', reason
+                return False
+            target.payload = inputs
+            files = inputs['mod_files'] + [inputs['die_path'], inputs['wafer_path']]
+            target.key = self._files_key('tpl', files, [record_sha256(self.data[d]), self.tpl_generator.rewriter.fingerprint])
+
+        previous = self.previous.get(target.name)
+        if previous and previous.get('key') == target.key and self._outputs_intact(target, previous):
+            target.status = 'fresh'
+            self.new_state[target.name] = previous
+            return False
+        if self.dry_run:
+            target.status = 'stale'
+            return False
+        return True
+
+    # ---------- completion ----------
+
+    def complete(self, target, ok, result, seconds):
+        target.seconds = seconds
+        if not ok:
+            target.status, target.detail = 'failed', result
+            return
+        d = target.device
+        if target.kind == 'wafdie':
+            outputs = [os.path.join(waf_die_trans.die_folder, f"{d}.die"),
+                       os.path.join(waf_die_trans.waf_folder, f"{d}.waf")]
+            target.outputs = {p: self.hashes.get(p) for p in outputs}
+        elif target.kind == 'record':
+            record = device_dic.merge_record(self.data.get(d), result)
+            self.data[d] = record
+            target.outputs = {f"record:{d}": record_sha256(record)}
+        elif target.kind == 'dataset':
+            target.outputs = {device_dic.output_json: self.hashes.get(device_dic.output_json)}
+        elif target.kind == 'tpl':
+            target.outputs = {result: self.hashes.get(result)}
+        target.status = 'built'
+        self.new_state[target.name] = {'key': target.key, 'outputs': target.outputs}
+
+    def write_dataset(self):
+        t0 = time.perf_counter()
+        device_dic.save_data_to_json(self.data, device_dic.output_json)
+        save_module_graph(device_dic.output_json, _catalog())
+        device_dic.save_data_to_text(self.data, device_dic.output_text)
+        return True, None, time.perf_counter() - t0
+
+    # ---------- scheduling ----------
+
+    def run(self):
+        t_start = time.perf_counter()
+        targets = self.plan()
+        waiting = {name: len(t.deps) for name, t in targets.items()}
+        dependents = {}
+        for t in targets.values():
+            for dep in t.deps:
+                dependents.setdefault(dep, []).append(t.name)
+        ready = deque(name for name, n in waiting.items() if n == 0)
+
+        if not self.dry_run:
+            for folder in (waf_die_trans.waf_folder, waf_die_trans.die_folder, tpl.tpl_folder):
+                os.makedirs(folder, exist_ok=True)
+
+        pool = None
+        if self.workers > 1 and not self.dry_run:
+            pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.stamp,))
+        else:
+            _init_worker(self.stamp)
+
+        running = {}
+
+        def finish(name):
+            for child in dependents.get(name, ()):
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    ready.append(child)
+
+        try:
+            while ready or running:
+                while ready:
+                    t = targets[ready.popleft()]
+                    bad = [dep for dep in t.deps if targets[dep].status in ('failed', 'blocked')]
+                    if bad and t.kind != 'dataset':
+                        t.status, t.detail = 'blocked', f"{bad[0]} {targets[bad[0]].status}"
+                    elif self.dry_run and any(targets[dep].status == 'stale' for dep in t.deps):
+                        t.status, t.detail = 'stale', 'after upstream rebuild'
+                    else:
+                        t0 = time.perf_counter()
+                        build = self.prepare(t)
+                        self.stage_seconds['check'] = self.stage_seconds.get('check', 0.0) + time.perf_counter() - t0
+                        if build:
+                            if t.kind == 'dataset':
+                                self.complete(t, *self.write_dataset())
+                            elif pool is not None:
+                                running[pool.submit(run_target, t.kind, t.device, t.payload)] = t.name
+                                continue
+                            else:
+                                self.complete(t, *run_target(t.kind, t.device, t.payload))
+                    finish(t.name)
+                if running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        self.complete(targets[name], *future.result())
+                        finish(name)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if not self.dry_run:
+            self._save_state()
+        self.wall = time.perf_counter() - t_start
+        return targets
+
+    def _save_state(self):
+        targets = dict(self.previous)
+        targets.update(self.new_state)
+        for name, t in self.targets.items():
+            if t.status in ('failed', 'skipped'):
+                targets.pop(name, None)
+        state = {'format': STATE_FORMAT, 'files': self.hashes.known, 'targets': targets}
+        write_json_atomic(self.state_path, state, compact=True)
+
+    # ---------- report ----------
+
+    def critical_path(self):
+        """Longest chain of dependent targets by measured build time: [(name, seconds)], total."""
+        best = {}
+
+        def cost(name):
+            if name not in best:
+                t = self.targets[name]
+                via = max(t.deps, key=cost, default=None)
+                best[name] = (t.seconds + (best[via][0] if via else 0.0), via)
+            return best[name][0]
+
+        end = max(self.targets, key=cost, default=None)
+        chain = []
+        while end is not None:
+            chain.append((end, self.targets[end].seconds))
+            end = best[end][1]
+        return chain[::-1], sum(s for _, s in chain)
+
+    def report(self, top=10):
+        counts = {}
+        for t in self.targets.values():
+            counts[t.status] = counts.get(t.status, 0) + 1
+        work = sum(t.seconds for t in self.targets.values())
+        lines = [
+            f"Pipeline: {len(self.targets)} targets, "
+            + ", ".join(f"{n} {status}" for status, n in sorted(counts.items())),
+            f"  wall {self.wall:.2f}s, build work {work:.2f}s across {self.workers} worker(s), "
+            f"staleness checks {self.stage_seconds.get('check', 0.0):.2f}s ({self.hashes.hashed} file(s) hashed)",
+        ]
+        chain, total = self.critical_path()
+        if total > 0:
+            lines.append(f"  critical path {total:.2f}s: " + " -> ".join(f"{n} ({s:.3f}s)" for n, s in chain if s > 0))
+        slowest = sorted((t for t in self.targets.values() if t.seconds > 0), key=lambda t: -t.seconds)[:top]
+        if slowest:
+            lines.append("  slowest: " + ", ".join(f"{t.name} {t.seconds:.3f}s" for t in slowest))
+        problems = {}
+        for t in self.targets.values():
+            if t.status in ('failed', 'blocked', 'skipped'):
+                problems.setdefault(f"{t.status}: {t.detail}", []).append(t.name)
+        for reason, names in sorted(problems.items(), key=lambda kv: -len(kv[1])):
+            lines.append(f"  {len(names):>4}  {reason}: {', '.join(names)}")
+        if self.dry_run:
+            stale = [t.name for t in self.targets.values() if t.status == 'stale']
+            lines.append(f"  would rebuild: {', '.join(stale) if stale else 'nothing'}")
+        return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild stale .waf/.die files, output.json records and .tpl plans.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, metavar="N",
+                        help="worker processes for independent devices (default: %(default)s)")
+    parser.add_argument("--devices", nargs="+", metavar="DEVICE", help="only consider these devices")
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH, metavar="PATH",
+                        help="input/output hashes of the last run (default: %(default)s)")
+    parser.add_argument("--dry-run", action="store_true", help="only report which targets are stale")
+    args = parser.parse_args(argv)
+
+    pipeline = Pipeline(args.state, args.workers, args.devices, args.dry_run)
+    pipeline.run()
+    print(pipeline.report())
+    return pipeline
+
+
+if __name__ == "__main__":
+    main()
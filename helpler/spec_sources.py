@@ -0,0 +1,125 @@
+import os
+import locale
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_PREFETCH_WORKERS = 4
+DEFAULT_PREFETCH_BUDGET = 64 << 20  # bytes held in memory ahead of the parser
+
+
+def read_bytes(path):
+    """Raw file contents, or None when path is not a regular file."""
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def decode_text(data, encoding=None, errors='strict'):
+    """
+    Decode like open(path, 'r', encoding=..., errors=...).read() would,
+    including universal-newline translation. None stays None.
+    """
+    if data is None:
+        return None
+    text = data.decode(encoding or locale.getpreferredencoding(False), errors)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def read_text(path, prof=None, encoding=None, errors='strict', sources=None):
+    """
+    read_bytes + decode_text, counting the bytes read on prof (a stage profiler).
+    sources is an optional {path: bytes|None|OSError} map already fetched by a
+    Prefetcher; a read error stored there is raised here, for this device only.
+    """
+    if sources is not None and path in sources:
+        data = sources[path]
+        if isinstance(data, OSError):
+            raise data
+    else:
+        data = read_bytes(path)
+    if data is not None and prof is not None:
+        prof.add_bytes(len(data))
+    return decode_text(data, encoding, errors)
+
+
+class Prefetcher:
+    """
+    Read the files of upcoming devices on a small thread pool while the caller
+    parses the current one, so network-share latency overlaps with CPU work.
+
+        for key, sources in Prefetcher((dev, [p1, p2, ...]) for dev in devices):
+            ...  # sources == {p1: bytes|None|OSError, p2: ...}
+
+    Groups come back in input order. New groups are only scheduled while the
+    bytes fetched but not yet consumed stay under byte_budget (the next group
+    in line is always allowed, so a single oversized device cannot stall it).
+    A file that cannot be read is stored as its OSError instead of aborting the
+    whole feed; read_text() raises it when that device is parsed, just as a
+    serial read would have.
+    """
+
+    def __init__(self, groups, workers=DEFAULT_PREFETCH_WORKERS, byte_budget=DEFAULT_PREFETCH_BUDGET):
+        self.groups = groups
+        self.workers = max(1, workers)
+        self.byte_budget = byte_budget
+        self.max_ahead = self.workers * 2
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    def _read_group(self, paths):
+        out = {}
+        size = 0
+        for path in paths:
+            try:
+                data = read_bytes(path)
+            except OSError as e:
+                out[path] = e
+                continue
+            out[path] = data
+            size += len(data) if data is not None else 0
+        with self._lock:
+            self._buffered += size
+        return out, size
+
+    def __iter__(self):
+        groups = iter(self.groups)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='prefetch') as pool:
+            def fill():
+                while len(pending) < self.max_ahead:
+                    with self._lock:
+                        over_budget = self._buffered >= self.byte_budget
+                    if pending and over_budget:
+                        return
+                    nxt = next(groups, None)
+                    if nxt is None:
+                        return
+                    key, paths = nxt
+                    pending.append((key, pool.submit(self._read_group, list(paths))))
+
+            try:
+                fill()
+                while pending:
+                    key, future = pending.popleft()
+                    sources, size = future.result()
+                    with self._lock:
+                        self._buffered -= size
+                    fill()
+                    yield key, sources
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+
+def add_prefetch_arguments(parser):
+    """--prefetch-workers / --prefetch-mb options shared by the SPEC conversion scripts."""
+    parser.add_argument("--prefetch-workers", type=int, default=DEFAULT_PREFETCH_WORKERS, metavar="N",
+                        help="threads reading upcoming devices' files ahead of the parser; 0 reads serially "
+                             "(default: %(default)s)")
+    parser.add_argument("--prefetch-mb", type=int, default=DEFAULT_PREFETCH_BUDGET >> 20, metavar="MB",
+                        help="max file bytes held in memory ahead of the parser (default: %(default)s)")
+
@@ -0,0 +1,204 @@
+import os
+import mmap
+import locale
+
+
+class SpecWriter:
+    """
+    Buffered writer for generated SPEC files (.tpl, ...).
+
+    Text is encoded into an in-memory buffer and written to the file descriptor
+    in large chunks, so a whole plan goes out in a handful of write() calls.
+
+    fix_line(line) -> line, if given, is applied while writing to every
+    complete line containing `trigger` (a cheap substring pre-check), which
+    replaces re-reading and rewriting the finished file. A partial line is held
+    back until its '\\n' arrives, so fixes always see whole lines.
+
+    copy_file() appends another file; when its bytes can go out unchanged they
+    are copied by the kernel (os.copy_file_range / os.sendfile), otherwise it is
+    read as text and written like everything else.
+    """
+
+    def __init__(self, path, encoding=None, fix_line=None, trigger=None, buffer_size=1 << 20):
+        # same default encoding as open(path, 'w')
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.fix_line = fix_line
+        self.trigger = trigger
+        self.buffer_size = buffer_size
+        self._chunks = []
+        self._buffered = 0
+        self._pending = ''
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # ---------- text path ----------
+
+    def _fix(self, text):
+        # text is whole lines
+        trigger = self.trigger
+        if trigger is not None and trigger not in text:
+            return text
+        return ''.join(self.fix_line(line) if trigger is None or trigger in line else line
+                       for line in _split_keepends(text))
+
+    def write(self, text):
+        if self.fix_line is None:
+            self._emit(text)
+            return
+        data = self._pending + text if self._pending else text
+        cut = data.rfind('\n') + 1
+        self._pending = data[cut:]
+        if cut:
+            self._emit(self._fix(data[:cut]))
+
+    def _emit(self, text):
+        if not text:
+            return
+        b = text.encode(self.encoding)
+        self._chunks.append(b)
+        self._buffered += len(b)
+        if self._buffered >= self.buffer_size:
+            self._drain()
+
+    def _drain(self):
+        if not self._chunks:
+            return
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self._buffered = 0
+        view = memoryview(data)
+        while view:
+            n = os.write(self.fd, view)
+            view = view[n:]
+
+    def flush(self):
+        """Write out everything buffered except a pending partial line."""
+        self._drain()
+
+    # ---------- verbatim copies ----------
+
+    def _verbatim_ok(self, src_fd, size):
+        # Reading the file as text would change nothing: no '\r' for universal
+        # newlines to translate, nothing for fix_line to touch, and it ends with
+        # '\n' so no partial line is left over.
+        if self._pending or size == 0:
+            return False
+        if self.fix_line is not None and self.trigger is None:
+            return False  # every line would have to go through fix_line
+        with mmap.mmap(src_fd, 0, access=mmap.ACCESS_READ) as m:
+            if m[-1:] != b'\n' or m.find(b'\r') != -1:
+                return False
+            if self.fix_line is not None and m.find(self.trigger.encode(self.encoding)) != -1:
+                return False
+        return True
+
+    def _kernel_copy(self, src_fd, size):
+        offset = 0
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while offset < size:
+                    n = os.copy_file_range(src_fd, self.fd, size - offset, offset_src=offset)
+                    if n == 0:
+                        break
+                    offset += n
+            except OSError:
+                pass  # e.g. EXDEV on older kernels, or a filesystem without support
+        if offset < size and hasattr(os, 'sendfile'):
+            try:
+                while offset < size:
+                    n = os.sendfile(self.fd, src_fd, offset, size - offset)
+                    if n == 0:
+                        break
+                    offset += n
+            except OSError:
+                pass
+        return offset
+
+    def copy_file(self, path):
+        """Append the file at path, as if it was read in text mode and written here."""
+        with open(path, 'rb') as src:
+            size = os.fstat(src.fileno()).st_size
+            if self._verbatim_ok(src.fileno(), size):
+                self._drain()
+                done = self._kernel_copy(src.fileno(), size)
+                if done < size:
+                    src.seek(done)
+                    self._chunks.append(src.read())
+                    self._buffered += size - done
+                return
+        with open(path, 'r', encoding=self.encoding) as src:
+            for block in iter(lambda: src.read(1 << 16), ''):
+                self.write(block)
+
+    def close(self):
+        if self.fd is None:
+            return
+        try:
+            if self._pending:
+                tail, self._pending = self._pending, ''
+                self._emit(self._fix(tail))
+            self._drain()
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _split_keepends(text):
+    # like str.splitlines(keepends=True), but only '\n' ends a line
+    lines = text.split('\n')
+    out = [line + '\n' for line in lines[:-1]]
+    if lines[-1]:
+        out.append(lines[-1])
+    return out
+
+
+class ColumnWidths:
+    """Running maximum width of each column, updated while the rows are collected."""
+
+    def __init__(self, count):
+        self.widths = [0] * count
+
+    def add(self, *cells):
+        widths = self.widths
+        for i, cell in enumerate(cells):
+            n = len(cell)
+            if n > widths[i]:
+                widths[i] = n
+
+    def __getitem__(self, i):
+        return self.widths[i]
+
+    def tolist(self):
+        return list(self.widths)
+
+
+class FixedWidthWriter:
+    """
+    Emits the fixed-width lines of a SPEC file (.waf/.die/.tpl sections) into
+    a text sink such as SpecWriter: line() left-justifies to the section width,
+    row() pads each (text, width) cell first, write() passes text through as is.
+    """
+
+    def __init__(self, out, width):
+        self.out = out
+        self.width = width
+
+    def write(self, text):
+        self.out.write(text)
+
+    def line(self, text=''):
+        self.out.write(text.ljust(self.width) + '\n')
+
+    def lines(self, texts):
+        width = self.width
+        self.out.write(''.join(text.ljust(width) + '\n' for text in texts))
+
+    def row(self, cells, sep=' '):
+        self.line(sep.join(text.ljust(w) for text, w in cells))
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import heapq
+import cProfile
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from urllib.parse import quote
+
+
+class NullProfiler:
+    """Drop-in for StageProfiler when --profile is off: every hook is a no-op."""
+
+    enabled = False
+
+    def device(self, name):
+        return nullcontext()
+
+    def stage(self, name):
+        return nullcontext()
+
+    def add_bytes(self, n):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class StageProfiler:
+    """
+    Per-device, per-stage wall-clock timings plus bytes read.
+
+        prof = StageProfiler(cprofile_top=5)
+        with prof.device("5CC9001ACET2"):
+            with prof.stage("read"):
+                ...
+                prof.add_bytes(len(data))
+
+    Stages entered outside a device block are recorded as run-level stages.
+    With cprofile_top=N each device also runs under cProfile and the stats of
+    the N slowest devices are kept for dump_cprofile().
+    """
+
+    enabled = True
+
+    def __init__(self, cprofile_top=0):
+        self.cprofile_top = cprofile_top
+        self.devices = {}     # name -> {"total": s, "bytes": n, "stages": {stage: s}}
+        self.run_stages = {}  # stage -> s, for work that is not per device
+        self._current = None
+        self._profiles = []   # min-heap of (seconds, seq, name, cProfile.Profile)
+        self._seq = 0
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def device(self, name):
+        entry = self.devices.setdefault(name, {"total": 0.0, "bytes": 0, "stages": {}})
+        prev, self._current = self._current, entry
+        prof = cProfile.Profile() if self.cprofile_top > 0 else None
+        t0 = time.perf_counter()
+        if prof is not None:
+            prof.enable()
+        try:
+            yield entry
+        finally:
+            if prof is not None:
+                prof.disable()
+            elapsed = time.perf_counter() - t0
+            entry["total"] += elapsed
+            self._current = prev
+            if prof is not None:
+                self._seq += 1
+                item = (elapsed, self._seq, name, prof)
+                if len(self._profiles) < self.cprofile_top:
+                    heapq.heappush(self._profiles, item)
+                elif elapsed > self._profiles[0][0]:
+                    heapq.heapreplace(self._profiles, item)
+
+    @contextmanager
+    def stage(self, name):
+        stages = self._current["stages"] if self._current is not None else self.run_stages
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages[name] = stages.get(name, 0.0) + (time.perf_counter() - t0)
+
+    def add_bytes(self, n):
+        if self._current is not None:
+            self._current["bytes"] += n
+
+    # ---------- reporting ----------
+
+    def stage_totals(self):
+        totals = dict(self.run_stages)
+        for entry in self.devices.values():
+            for stage, secs in entry["stages"].items():
+                totals[stage] = totals.get(stage, 0.0) + secs
+        return totals
+
+    def summary_table(self, top=10):
+        """Plain-text summary: stage totals, then the slowest devices with their worst stage."""
+        wall = time.perf_counter() - self.started
+        totals = self.stage_totals()
+        total_bytes = sum(e["bytes"] for e in self.devices.values())
+        lines = [
+            f"Profile: {len(self.devices)} devices, {wall:.2f}s wall, {total_bytes / 1e6:.1f} MB read",
+            "",
+            f"{'stage':<18} {'seconds':>10} {'share':>7}",
+        ]
+        stage_sum = sum(totals.values()) or 1.0
+        for stage, secs in sorted(totals.items(), key=lambda kv: -kv[1]):
+            lines.append(f"{stage:<18} {secs:>10.3f} {secs / stage_sum:>6.1%}")
+
+        lines += ["", f"{'slowest devices':<32} {'seconds':>9} {'KB read':>9}  slowest stage"]
+        slowest = sorted(self.devices.items(), key=lambda kv: -kv[1]["total"])[:top]
+        for name, entry in slowest:
+            worst = max(entry["stages"].items(), key=lambda kv: kv[1], default=("-", 0.0))
+            lines.append(
+                f"{name:<32} {entry['total']:>9.3f} {entry['bytes'] / 1024:>9.1f}  {worst[0]} ({worst[1]:.3f}s)"
+            )
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "wall_seconds": time.perf_counter() - self.started,
+            "stage_totals": self.stage_totals(),
+            "run_stages": self.run_stages,
+            "devices": self.devices,
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def dump_cprofile(self, folder):
+        """Write <device>.prof (pstats format) for the slowest profiled devices; returns the paths."""
+        os.makedirs(folder, exist_ok=True)
+        paths = []
+        for elapsed, _, name, prof in sorted(self._profiles, reverse=True):
+            path = os.path.join(folder, quote(name, safe="") + ".prof")
+            prof.dump_stats(path)
+            paths.append(path)
+        return paths
+
+
+def add_profile_arguments(parser):
+    """The --profile family of options shared by the SPEC conversion scripts."""
+    parser.add_argument("--profile", action="store_true",
+                        help="time each stage per device and print a summary")
+    parser.add_argument("--profile-json", metavar="PATH", default="profile_report.json",
+                        help="machine-readable report path (default: %(default)s)")
+    parser.add_argument("--profile-top", type=int, default=10, metavar="N",
+                        help="devices listed in the summary table (default: %(default)s)")
+    parser.add_argument("--cprofile-top", type=int, default=0, metavar="N",
+                        help="keep cProfile stats for the N slowest devices")
+    parser.add_argument("--cprofile-dir", metavar="DIR", default="profiles",
+                        help="where the .prof dumps go (default: %(default)s)")
+
+
+def profiler_from_args(args):
+    if not args.profile:
+        return NULL_PROFILER
+    return StageProfiler(cprofile_top=args.cprofile_top)
+
+
+def finish_profile(prof, args):
+    """Print the summary and write the JSON report / cProfile dumps requested on the command line."""
+    if not prof.enabled:
+        return
+    print(prof.summary_table(top=args.profile_top))
+    prof.write_json(args.profile_json)
+    print(f"Profile report written to {args.profile_json}")
+    if args.cprofile_top > 0:
+        for path in prof.dump_cprofile(args.cprofile_dir):
+            print(f"cProfile stats: {path}")
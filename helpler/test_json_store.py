@@ -0,0 +1,55 @@
+import os
+import stat
+import sys
+
+import pytest
+
+import json_store
+import json_transform
+from module_graph import write_module_graph
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='POSIX permission bits')
+
+RECORDS = {'DEV_A': {'prb': 'E12A', 'mod': ['c9fd_1a']}, 'DEV_B': {'prb': None, 'mod': []}}
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def _default_mode():
+    return 0o666 & ~json_store._UMASK
+
+
+def test_new_files_follow_the_umask(tmp_path):
+    out = str(tmp_path / 'output.json')
+    json_store.write_json_atomic(out, RECORDS, stamp=True)
+    assert _mode(out) == _default_mode()
+    assert _mode(out + json_store.VERSION_SUFFIX) == _default_mode()
+
+    assert _mode(write_module_graph(out, {'format': 1, 'modules': {}})) == _default_mode()
+
+
+def test_sharded_files_follow_the_umask(tmp_path):
+    folder = str(tmp_path / 'output.d')
+    json_store.write_sharded_dataset(folder, RECORDS)
+    assert _mode(os.path.join(folder, json_store.MANIFEST_NAME)) == _default_mode()
+    shards = os.path.join(folder, json_store.SHARD_DIR)
+    for name in os.listdir(shards):
+        assert _mode(os.path.join(shards, name)) == _default_mode()
+
+
+def test_replacing_keeps_the_existing_mode(tmp_path):
+    out = str(tmp_path / 'output.json')
+    json_store.write_json_atomic(out, RECORDS)
+    os.chmod(out, 0o664)
+    json_store.write_json_atomic(out, RECORDS)
+    assert _mode(out) == 0o664
+
+
+def test_transform_output_is_readable_by_others(tmp_path):
+    src = str(tmp_path / 'output.json')
+    out = str(tmp_path / 'out.json')
+    json_store.write_json_atomic(src, RECORDS)
+    json_transform.run(src, [('r', json_transform.reset_field('mod', {}))], out)
+    assert _mode(out) == _default_mode()
@@ -0,0 +1,50 @@
+import os
+
+import tst_rewrite
+from mod_cache import ModBodyCache
+
+
+class _Rewriter:
+    fingerprint = 'fp'
+
+    def rewrite_lines(self, lines):
+        return [line.upper() for line in lines]
+
+
+def _touch(path, text, bump):
+    path.write_text(text)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + bump * 10**9))
+
+
+def test_bodies_are_bounded(tmp_path):
+    cache = ModBodyCache(_Rewriter(), max_bodies=3)
+    paths = []
+    for i in range(5):
+        path = tmp_path / f'm{i}.tst'
+        path.write_text(f'mod {i}\n')
+        paths.append(str(path))
+        assert cache.get(str(path)) == f'MOD {i}\n'
+    assert cache.stats()['entries'] == 3
+
+    cache.get(paths[2])  # recently used: survives the next insert
+    extra = tmp_path / 'extra.tst'
+    extra.write_text('extra\n')
+    cache.get(str(extra))
+    hits = cache.hits
+    cache.get(paths[2])
+    assert cache.hits == hits + 1
+    assert cache.stats()['entries'] == 3
+
+
+def test_edited_file_replaces_its_old_body(tmp_path):
+    cache = ModBodyCache(_Rewriter())
+    path = tmp_path / 'm.tst'
+    for version in range(10):
+        _touch(path, f'version {version}\n', version)
+        assert cache.get(str(path)) == f'VERSION {version}\n'
+    assert cache.stats()['entries'] == 1
+
+
+def test_regex_cache_is_bounded():
+    assert tst_rewrite._rx.cache_info().maxsize is not None
@@ -0,0 +1,128 @@
+import gc
+import glob
+import os
+import weakref
+from collections.abc import Mapping
+
+import pytest
+
+from tpl import TplGenerator
+
+TST_FILES = ['c9fd_4004a.tst', 'c9fd_4004b.tst', 'c9fd_40041.tst', 'c9fd_4004ab.tst', 'c9fd_77x.tst',
+             '.c9fd_4004h.tst', 'm1.tst', 'm2.tst']
+
+
+class _Devices(Mapping):
+    """Dataset stand-in that counts full scans."""
+
+    def __init__(self, records):
+        self._records = records
+        self.scans = 0
+
+    def __getitem__(self, name):
+        return self._records[name]
+
+    def __iter__(self):
+        self.scans += 1
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+
+RECORDS = {
+    'DEV_A': {'mod': [{'name': 'c9fd_4004a', 'x': 1, 'y': 2}, 'm1']},
+    'DEV_B': {'mod': ['c9fd_4004z', 'c9fd_4004a']},
+    'DEV_C': {'mod': []},
+}
+
+
+def _bump(folder):
+    st = os.stat(folder)
+    os.utime(folder, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+
+@pytest.fixture
+def tst(tmp_path):
+    folder = tmp_path / 'tst'
+    folder.mkdir()
+    for name in TST_FILES:
+        (folder / name).write_text(name + '\n')
+    return folder
+
+
+@pytest.fixture
+def generator(tst, tmp_path):
+    return TplGenerator(stamp=('01/01/2026', '00:00:00'), cache_dir=str(tmp_path / 'cache'), tst_dir=str(tst),
+                        die_dir=str(tmp_path / 'die'), wafer_dir=str(tmp_path / 'waf'))
+
+
+def _glob(tst, mod):
+    if mod.startswith('c9fd'):
+        return glob.glob(os.path.join(str(tst), f'{mod[:-1]}?.tst'))
+    path = os.path.join(str(tst), f'{mod}.tst')
+    return [path] if os.path.exists(path) else []
+
+
+@pytest.mark.parametrize('mods', [['c9fd_4004a'], ['c9fd_4004z', 'm1'], ['m2', 'c9fd_77y'], []])
+def test_check_mod_files_matches_glob(generator, tst, mods):
+    ok, files = generator.check_mod_files(mods)
+    assert ok
+    assert files == [path for mod in mods for path in _glob(tst, mod)]
+
+
+@pytest.mark.parametrize('mods, missing', [(['m1', 'm3'], 'm3'), (['c9fd_999a'], 'c9fd_999a'),
+                                           (['c9fd_4004'], 'c9fd_4004')])
+def test_check_mod_files_reports_the_first_missing_mod(generator, mods, missing):
+    assert generator.check_mod_files(mods) == (False, missing)
+
+
+def test_new_tst_file_is_picked_up_after_refresh(generator, tst):
+    assert generator.check_mod_files(['c9fd_88a']) == (False, 'c9fd_88a')
+    (tst / 'c9fd_88q.tst').write_text('new\n')
+    _bump(str(tst))
+    generator.refresh_if_changed()
+    assert generator.check_mod_files(['c9fd_88a']) == (True, [str(tst / 'c9fd_88q.tst')])
+
+
+def test_family_joins_tst_files_and_devices(generator):
+    index = generator.index_devices(_Devices(RECORDS), 'v1')
+    family = index.family('c9fd_4004')
+    assert sorted(family['tst_files']) == ['c9fd_40041.tst', 'c9fd_4004a.tst', 'c9fd_4004b.tst']
+    assert family['devices'] == ['DEV_A', 'DEV_B']
+    variants = {v['name']: v for v in family['variants']}
+    assert sorted(variants) == ['c9fd_40041', 'c9fd_4004a', 'c9fd_4004b', 'c9fd_4004z']
+    assert variants['c9fd_4004a']['sites'] == [{'device': 'DEV_A', 'x': 1, 'y': 2},
+                                               {'device': 'DEV_B', 'x': None, 'y': None}]
+    assert variants['c9fd_4004z']['tst'] is False and variants['c9fd_4004z']['devices'] == ['DEV_B']
+    assert index.bases() == ['c9fd_4004']
+    assert index.bases(include_unused=True) == ['c9fd_4004', 'c9fd_4004a', 'c9fd_77']  # c9fd_4004ab.tst
+
+
+def test_tst_change_does_not_rescan_devices(generator, tst):
+    devices = _Devices(RECORDS)
+    generator.index_devices(devices, 'v1')
+    assert devices.scans == 1
+    assert generator.index_devices(devices, 'v1') is generator.families
+    assert devices.scans == 1
+
+    (tst / 'c9fd_4004c.tst').write_text('new\n')
+    _bump(str(tst))
+    generator.refresh_if_changed()
+    index = generator.index_devices(devices, 'v1')
+    assert devices.scans == 1
+    assert 'c9fd_4004c.tst' in index.family('c9fd_4004')['tst_files']
+    assert index.family('c9fd_4004')['devices'] == ['DEV_A', 'DEV_B']
+
+    generator.index_devices(devices, 'v2')
+    assert devices.scans == 2
+
+
+def test_generator_does_not_keep_the_dataset(generator):
+    devices = _Devices(RECORDS)
+    ref = weakref.ref(devices)
+    generator.index_devices(devices, 'v1')
+    del devices
+    gc.collect()
+    assert ref() is None
+    assert generator.families.family('c9fd_4004')['devices'] == ['DEV_A', 'DEV_B']
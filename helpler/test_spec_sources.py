@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+import spec_sources
+from spec_sources import Prefetcher, read_text
+
+
+@pytest.fixture
+def specs(tmp_path, monkeypatch):
+    """Three devices with one spec file each; DEV2's cannot be read."""
+    paths = {}
+    for device in ('DEV1', 'DEV2', 'DEV3'):
+        path = tmp_path / device
+        path.write_text(f'spec of {device}\n', encoding='utf-8')
+        paths[device] = str(path)
+
+    real_read_bytes = spec_sources.read_bytes
+
+    def read_bytes(path):
+        if path == paths['DEV2']:
+            raise PermissionError(13, 'Permission denied', path)
+        return real_read_bytes(path)
+
+    monkeypatch.setattr(spec_sources, 'read_bytes', read_bytes)
+    return paths
+
+
+def test_unreadable_file_fails_only_its_device(specs):
+    parsed, failed = {}, {}
+    feed = Prefetcher(((device, [path]) for device, path in specs.items()), workers=2)
+    for device, sources in feed:
+        try:
+            parsed[device] = read_text(specs[device], sources=sources)
+        except OSError as e:
+            failed[device] = e
+
+    assert parsed == {'DEV1': 'spec of DEV1\n', 'DEV3': 'spec of DEV3\n'}
+    assert list(failed) == ['DEV2']
+    assert isinstance(failed['DEV2'], PermissionError)
+
+
+def test_prefetched_error_matches_serial_read(specs):
+    with pytest.raises(PermissionError):
+        read_text(specs['DEV2'])
+    sources = dict(next(iter(Prefetcher([('DEV2', [specs['DEV2']])])))[1])
+    with pytest.raises(PermissionError):
+        read_text(specs['DEV2'], sources=sources)
+
+
+def test_missing_file_is_still_none(tmp_path):
+    missing = os.path.join(str(tmp_path), 'nope')
+    (_, sources), = list(Prefetcher([('DEV', [missing])]))
+    assert sources == {missing: None}
+    assert read_text(missing, sources=sources) is None
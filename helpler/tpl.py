@@ -1,9 +1,14 @@
 import os
-import json
-import shutil
-import glob
-from datetime import datetime
 import re
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from json_store import load_dataset
+from tst_rewrite import TstLineRewriter, load_mapping
+from mod_cache import ModBodyCache
+from dir_index import DirIndex
+from mod_families import DeviceVariants, ModFamilyIndex, family_base
+from spec_writer import FixedWidthWriter, SpecWriter
 
 # Define paths
 json_path = r"Y:\usr\aquq\SPEC_conv\s90\output.json"
@@ -16,117 +21,47 @@ type_typ_file = r"/etestnew/SPECS/tpprod/type_typ.txt"
 perimeter_perim_file = r"/etestnew/SPECS/tpprod/perimeter_perim.txt"
 vlimit_vlim_file = r"/etestnew/SPECS/tpprod/vlimit_vlim.txt"
 dtime_time_file = r"/etestnew/SPECS/tpprod/dtime_time.txt"
+mod_cache_dir = None  # e.g. r"/etestnew/SPECS/tpprod/.mod_cache" to keep transformed mod bodies between runs
 
-current_date = datetime.now().strftime('%m/%d/%Y')
-current_time = datetime.now().strftime('%H:%M:%S')
-
-# Load JSON data
-with open(json_path, 'r') as file:
-    devices = json.load(file)
-
-type_typ_map = {}
-if os.path.exists(type_typ_file):
-    with open(type_typ_file, "r") as f:
-        for line in f:
-            parts = line.strip().split(":")
-            if len(parts) == 2:
-                filename, typ_value = parts[0].strip(), parts[1].strip()
-                type_typ_map[filename] = typ_value
-
-perimeter_perim_map = {}
-if os.path.exists(perimeter_perim_file):
-    with open(perimeter_perim_file, "r") as f:
-        for line in f:
-            parts = line.strip().split(":")
-            if len(parts) == 2:
-                filename, typ_value = parts[0].strip(), parts[1].strip()
-                perimeter_perim_map[filename] = typ_value
-
-vlimit_vlim_map = {}
-if os.path.exists(vlimit_vlim_file):
-    with open(vlimit_vlim_file, "r") as f:
-        for line in f:
-            parts = line.strip().split(":")
-            if len(parts) == 2:
-                filename, typ_value = parts[0].strip(), parts[1].strip()
-                vlimit_vlim_map[filename] = typ_value
-
-dtime_time_map = {}
-if os.path.exists(dtime_time_file):
-    with open(dtime_time_file, "r") as f:
-        for line in f:
-            parts = line.strip().split(":")
-            if len(parts) == 2:
-                filename, typ_value = parts[0].strip(), parts[1].strip()
-                dtime_time_map[filename] = typ_value
-
-def fix_tpl_file(filepath):
-    with open(filepath, 'r') as f:
-        lines = f.readlines()
-
-    new_lines = []
-    for line in lines:
-        if "Z_RES4PT_CRE" in line and "RCDDLICONPK" in line and "Cts=" in line:
-            line = re.sub(r'\bCts\s*=', 'Sq =', line)
-        if "Z_LINEW4PT_CRE" in line and "RSCAP2MH_2p0" in line and "Length=" in line:
-            line = re.sub(r'\bLength\s*=', 'Sq    =', line)
-        if "Z_RES2PT_CRE" in line and "RSLNLI" in line and "Length=" in line:
-            line = re.sub(r'\bLength\s*=', 'Sq    =', line)
-        new_lines.append(line)
-
-    with open(filepath, 'w', newline='\n') as f:
-        f.writelines(new_lines)
-# Function to check mod files
-def check_mod_files(mod_list):
-    matched_files = []
-    for mod in mod_list:
-        # For mods starting with "c9fd", allow any last character
-        if mod.startswith("c9fd"):
-            search_pattern = os.path.join(tst_folder, f"{mod[:-1]}?.tst")
-            matched = glob.glob(search_pattern)
-            if matched:
-                matched_files.extend(matched)
-            else:
-                # print(mod)
-                return False, []
-        else:
-            mod_path = os.path.join(tst_folder, f"{mod}.tst")
-            if os.path.exists(mod_path):
-                matched_files.append(mod_path)
-            else:
-                print(mod)
-                return False, []
-    return True, matched_files
-
-# Iterate over each device in JSON
-for device_name, device_info in devices.items():
-    mods = device_info.get("mod", [])
-    prb = device_info.get("prb", "")
-
-    if not mods:
-        print(f"Skipping device {device_name}: mod list is empty.")
-        continue
-    
-    # Check for mod files
-    mods_exist, mod_files = check_mod_files(mods)
-    if not mods_exist:
-        print(f"Skipping device {device_name}: not all mods exist.")
-        continue
-
-    # Check for die and wafer files
-    die_path = os.path.join(die_folder, f"{device_name}.die")
-    wafer_path = os.path.join(wafer_folder, f"{device_name}.waf")
-
-    if not os.path.exists(die_path):
-        print(f"Skipping device {device_name}: die file is missing.")
-        continue
-    if not os.path.exists(wafer_path):
-        print(f"Skipping device {device_name}: wafer file is missing.")
-        continue
-
-    # Create output file in tpl folder
-    tpl_path = os.path.join(tpl_folder, f"{device_name}.tpl")
-    with open(tpl_path, 'w', newline='\n') as tpl_file:
+
+# Every line touched by fix_tpl_line contains this, so other lines skip the checks
+TPL_FIX_TRIGGER = "_CRE"
+
+def fix_tpl_line(line):
+    if "Z_RES4PT_CRE" in line and "RCDDLICONPK" in line and "Cts=" in line:
+        line = re.sub(r'\bCts\s*=', 'Sq =', line)
+    if "Z_LINEW4PT_CRE" in line and "RSCAP2MH_2p0" in line and "Length=" in line:
+        line = re.sub(r'\bLength\s*=', 'Sq    =', line)
+    if "Z_RES2PT_CRE" in line and "RSLNLI" in line and "Length=" in line:
+        line = re.sub(r'\bLength\s*=', 'Sq    =', line)
+    return line
+
+
+def mod_names(mods):
+    """Mod entries are names (s90 output.json) or {"name", "x", "y"} objects (device_dic.py output)."""
+    names = []
+    for mod in mods or []:
+        name = mod.get("name") if isinstance(mod, dict) else mod
+        if name:
+            names.append(name)
+    return names
+
+
+def load_rewriter():
+    return TstLineRewriter(load_mapping(type_typ_file), load_mapping(perimeter_perim_file),
+                           load_mapping(vlimit_vlim_file), load_mapping(dtime_time_file))
+
+
+def plan_stamp(now=None):
+    """(date, time) written into every plan header of one run."""
+    now = now or datetime.now()
+    return now.strftime('%m/%d/%Y'), now.strftime('%H:%M:%S')
+
+
+def write_tpl(tpl_path, device_name, prb, mods, mod_files, die_path, wafer_path, mod_bodies, current_date, current_time):
+    """Write one device's test plan to tpl_path (wafer, filtered die, probe, mod bodies, job section)."""
+    # the Cts=/Length= fixes are applied as lines are written
+    with SpecWriter(tpl_path, fix_line=fix_tpl_line, trigger=TPL_FIX_TRIGGER) as tpl_file:
         # Copy wafer file
 
         begin_section = f"""#Test Plan	{device_name}	1	{current_date}	{current_time} specs	
@@ -144,8 +79,7 @@ for device_name, device_info in devices.items():
         tpl_file.write(begin_section_justified)
         tpl_file.write("\n")
         tpl_file.write('\f\n')
-        with open(wafer_path, 'r') as wf:
-            shutil.copyfileobj(wf, tpl_file)
+        tpl_file.copy_file(wafer_path)
         tpl_file.write('\f\n')
         
         # Copy only relevant and **non-duplicate** lines from the die file
@@ -195,144 +129,9 @@ $---- --- ----- - - -----------------
         # Copy all mod files and add corresponding TEST line for each
         test_lines = []
         for mod_file in mod_files:
-            test_count = {}  # Track occurrences of each test
-
-            with open(mod_file, 'r') as mf:
-                for line in mf:
-                    if "::" in line:  # Check for test definition
-                        updated_line = ""
-                        parts = line.split("::")
-                        test_full = parts[1].split(":")[0]  # Extract full test section (e.g., "`RESN`")
-
-                        # Extract the actual test name without backticks
-                        test_name = test_full.strip("`")
-
-                        if test_name in test_count:
-                            test_count[test_name] += 1
-                            new_test_name = f"{len(test_name) * ' '}"  # Append _1, _2, etc.
-                            modified_line = re.sub(rf"`{test_name}`:", f"{new_test_name}   ", line, count=1)
-                        else:
-                            test_count[test_name] = 0  # First occurrence stays unchanged
-                            new_test_name = f"`{test_name}`"
-                            modified_line = line  # No changes needed
-                        modified_line = re.sub(r'"""(.*?)"""', r'"\1"    ', modified_line)
-                        modified_line = re.sub(r'"""', '"" ', modified_line)
-
-                        # pattern = r"(Time=\S+)(\s{1,})(\S+)"  # Capture spaces in Group 2
-
-                        # # Replace "Time=" with "Dtime=" and remove exactly 1 space
-                        # modified_line = re.sub(pattern, lambda m: f"Dtime={m.group(1)[5:]}{m.group(2)[:-1]}{m.group(3)}", modified_line)
-
-
-                        modified_line = re.sub(r"(\w+)=([^,]*)\"\"", r'\1="\2"', modified_line)
-                        modified_line = re.sub(r"Sq\([^\)]*\)=", lambda m: "Sq" + " " * (len(m.group(0)) - 3) + "=", modified_line)
-                        # modified_line = re.sub(r",\w+=-(?=\s|,|$)", lambda m: " " * (len(m.group(0)) - 1), modified_line)
-
-                        matches = re.findall(r",\w+=\"-\"(?=\s|,|$)", modified_line)
-
-                        # Step 2: Replace each match with an equivalent number of spaces
-                        for match in matches:
-                            modified_line = modified_line.replace(match, " " * len(match), 1)
-
-                        for key, replacement in type_typ_map.items():
-                            if key in modified_line:
-                                updated_line = re.sub(r"(Type|Typ)=", replacement + "=", modified_line)
-                                # if key == "Z_IDS1VAL_MOS":
-                                    # print(updated_line)
-
-                                spaces_needed = len(modified_line) - len(updated_line)
-                                if spaces_needed > 0:
-                                    # Ensure space after '=' if missing
-                                    updated_line = re.sub(rf"({replacement})=", r"\1 =", updated_line)
-                                    updated_line = re.sub(r" (=...)", r"\1 ", updated_line)
-
-                                elif spaces_needed < 0:
-                                    # Ensure no extra spaces before '='
-                                    updated_line = re.sub(rf"({replacement})\s*=", r"\1=", updated_line)
-
-                                    # Remove exactly one space after `group(1)`
-                                    updated_line = re.sub(rf"({replacement}\S*) ", r"\1", updated_line)
-                                modified_line = updated_line
-                                break
-                            
-                        for key, replacement in perimeter_perim_map.items():
-                            if key in modified_line:
-                                updated_line = re.sub(r"(Perimeter|Perim)=", replacement + "=", modified_line)
-                                # if key == "Z_IDS1VAL_MOS":
-                                    # print(updated_line)
-
-                                spaces_needed = len(modified_line) - len(updated_line)
-                                if spaces_needed > 0:
-                                    # Ensure space after '=' if missing
-                                    # updated_line = re.sub(rf"({replacement})=", rf"({replacement}) =", updated_line)
-                                    updated_line = re.sub(rf"({replacement})=([\d.]+)", rf"{replacement}=\2    ", updated_line)
-
-                                elif spaces_needed < 0:
-                                    # Ensure no extra spaces before '='
-                                    updated_line = re.sub(rf"({replacement})\s*=", r"\1=", updated_line)
-
-                                    # Remove exactly one space after `group(1)`
-                                    updated_line = re.sub(r"(=\S) ", r"\1", updated_line)
-                                modified_line = updated_line
-                                break
-                        
-                        for key, replacement in vlimit_vlim_map.items():
-                            if key in modified_line:
-                                updated_line = re.sub(r"(Vlimit|Vlim)=", replacement + "=", modified_line)
-
-                                spaces_needed = len(modified_line) - len(updated_line)
-                                if spaces_needed > 0:
-                                    # Ensure space after '=' if missing
-                                    # updated_line = re.sub(rf"({replacement})=", rf"({replacement}) =", updated_line)
-                                    updated_line = re.sub(rf"({replacement})=([\d.]+)", rf"{replacement}=\2 ", updated_line)
-
-                                elif spaces_needed < 0:
-                                    pattern = rf"({replacement}=\S+)(\s{{2,}})(\S+)"  # Capture spaces in Group 2
-
-                                    matches = re.findall(pattern, updated_line)
-                                    if matches:
-                                        print("Matches found:", matches)  # Should show spaces in Group 2
-
-                                    # Perform the replacement, reducing Group 2 by exactly 2 characters (spaces)
-                                    updated_line = re.sub(pattern, lambda m: f"{m.group(1)}{m.group(2)[:-2]}{m.group(3)}", updated_line)
-                                modified_line = updated_line
-                                break
-
-                        for key, replacement in dtime_time_map.items():
-                            if key in modified_line:
-                                updated_line = re.sub(r"(Dtime|Time)=", replacement + "=", modified_line)
-
-                                spaces_needed = len(modified_line) - len(updated_line)
-                                if spaces_needed > 0:
-                                    # Ensure space after '=' if missing
-                                    # updated_line = re.sub(rf"({replacement})=", rf"({replacement}) =", updated_line)
-                                    updated_line = re.sub(rf"({replacement})=([\d.]+)", rf"{replacement}=\2 ", updated_line)
-
-                                elif spaces_needed < 0:
-                                    pattern = rf"({replacement}=\S+)(\s{{1,}})(\S+)"  # Capture spaces in Group 2
-
-                                    matches = re.findall(pattern, updated_line)
-                                    if matches:
-                                        print("Matches found:", matches)  # Should show spaces in Group 2
-
-                                    # Perform the replacement, reducing Group 2 by exactly 2 characters (spaces)
-                                    updated_line = re.sub(pattern, lambda m: f"{m.group(1)}{m.group(2)[:-1]}{m.group(3)}", updated_line)
-                                modified_line = updated_line
-                                break
-
-                        if updated_line:
-                            updated_line = re.sub(r'(?i)\btype(?=\s*=\s*)', 'Type', updated_line)
-                            updated_line = re.sub(r'(?i)\bdivider\b', 'Devider', updated_line)
-                            tpl_file.write(updated_line)
-                        else:
-                            modified_line = re.sub(r'(?i)\btype(?=\s*=\s*)', 'Type', modified_line)
-                            modified_line = re.sub(r'(?i)\bdivider\b', 'Devider', modified_line)
-                            tpl_file.write(modified_line)
-                    else:
-                        tpl_file.write(line)  # Write unchanged lines
-
-                tpl_file.write("\f\n")  # Add form feed at end of each mod file
-            
+            tpl_file.write(mod_bodies.get(mod_file))
+            tpl_file.write("\f\n")  # Add form feed at end of each mod file
+
             # Extract filename for TEST line
             mod_file_name = os.path.basename(mod_file)
             test_line = f'      TEST         "{device_name}","{mod_file_name.split(".")[0]}"'
@@ -365,19 +164,13 @@ $---- ------------ ------------------------------------------------------------
 # Write the header, ensuring each line is 120 characters wide for alignment
         final_section_head_justified = "\n".join(line for line in final_section_head)
 
-        # Write the body, also ensuring each line is 120 characters wide for alignment
-        final_section_body_justified = "\n".join(line.ljust(93) for line in final_section_body)
-
-        final_section_test_justified = "\n".join(line.ljust(93) for line in test_lines)
-        # print(final_section_test_justified)
-
-        # Write the head and body sections to the tpl file
+        # Write the head, then the body and TEST lines padded to 93 characters
+        # (test_lines is never empty: resolve() only accepts devices with mod files)
         tpl_file.write(final_section_head_justified)
         tpl_file.write("\n")
-        tpl_file.write(final_section_body_justified)
-        tpl_file.write("\n")
-        tpl_file.write(final_section_test_justified)
-        tpl_file.write("\n")
+        job_section = FixedWidthWriter(tpl_file, 93)
+        job_section.lines(final_section_body)
+        job_section.lines(test_lines)
 
         # Write each generated TEST line for each mod file
         # for line in test_lines:
@@ -391,5 +184,189 @@ $---- ------------ ------------------------------------------------------------
 """.ljust(180))
 
 
-    print(f"Created {tpl_path} successfully.")
-    fix_tpl_file(tpl_path)
+class TplGenerator:
+    """
+    Everything needed to build plans, loaded once: the compiled mapping tables,
+    the transformed-mod-body cache and the tst/die/waf folder indexes.
+    """
+
+    def __init__(self, stamp=None, cache_dir=mod_cache_dir, tst_dir=None, die_dir=None, wafer_dir=None):
+        # Compiled once: key detection for all four tables + the ordered substitution rules
+        self.rewriter = load_rewriter()
+        # Each mod file is transformed once and reused by every device that includes it
+        self.mod_bodies = ModBodyCache(self.rewriter, cache_dir)
+        # One listing per folder; every existence / c9fd wildcard check is an in-memory lookup
+        self.tst_index = DirIndex(tst_dir or tst_folder)
+        self.die_index = DirIndex(die_dir or die_folder)
+        self.wafer_index = DirIndex(wafer_dir or wafer_folder)
+        # c9fd variant families over the tst listing (plus the devices using them, once attached);
+        # only the per-variant map of the attached dataset is kept, not its records
+        self._variants = None
+        self.families = ModFamilyIndex(self.tst_index)
+        self.stamp = stamp or plan_stamp()
+
+    def _rebuild_families(self):
+        # tst side only: the device side is reused as is
+        self.families = ModFamilyIndex(self.tst_index, self._variants)
+
+    def refresh(self):
+        """Re-list the tst/die/waf folders after files were added or removed."""
+        for index in (self.tst_index, self.die_index, self.wafer_index):
+            index.refresh()
+        self._rebuild_families()
+
+    def refresh_if_changed(self):
+        """Cheap variant for long-running callers: re-list only folders whose mtime changed."""
+        for index in (self.die_index, self.wafer_index):
+            index.refresh_if_changed()
+        if self.tst_index.refresh_if_changed():
+            self._rebuild_families()
+
+    def index_devices(self, devices, version=None):
+        """
+        Attach a dataset to the family index and return it. The device records
+        are only scanned when version changed (version=None always re-scans);
+        a changed tst listing only rebuilds the tst side.
+        """
+        if version is None or self._variants is None or self._variants.version != version:
+            self._variants = DeviceVariants(devices, version)
+            self._rebuild_families()
+        elif self.families.tst_signature != self.tst_index.signature:
+            self._rebuild_families()
+        return self.families
+
+    def check_mod_files(self, mod_list):
+        """(True, [tst paths]) or (False, missing mod name)."""
+        matched_files = []
+        for mod in mod_list:
+            # For mods starting with "c9fd", allow any last character
+            if family_base(mod) is not None:
+                matched = self.families.tst_files(mod)
+                if matched:
+                    matched_files.extend(matched)
+                else:
+                    return False, mod
+            else:
+                mod_path = self.tst_index.path(f"{mod}.tst")
+                if mod_path is not None:
+                    matched_files.append(mod_path)
+                else:
+                    return False, mod
+        return True, matched_files
+
+    def resolve(self, device_name, device_info):
+        """
+        Input files of one device's plan:
+        ({"mods", "mod_files", "die_path", "wafer_path", "prb"}, None) or (None, skip reason).
+        """
+        mods = mod_names(device_info.get("mod", []))
+        prb = device_info.get("prb", "")
+
+        if not mods:
+            return None, "mod list is empty"
+
+        mods_exist, mod_files = self.check_mod_files(mods)
+        if not mods_exist:
+            return None, f"not all mods exist (missing {mod_files})"
+
+        if not self.die_index.exists(f"{device_name}.die"):
+            return None, "die file is missing"
+        if not self.wafer_index.exists(f"{device_name}.waf"):
+            return None, "wafer file is missing"
+
+        return {
+            "mods": mods,
+            "mod_files": mod_files,
+            "die_path": os.path.join(self.die_index.folder, f"{device_name}.die"),
+            "wafer_path": os.path.join(self.wafer_index.folder, f"{device_name}.waf"),
+            "prb": prb,
+        }, None
+
+    def write(self, device_name, inputs, tpl_path):
+        current_date, current_time = self.stamp
+        write_tpl(tpl_path, device_name, inputs["prb"], inputs["mods"], inputs["mod_files"],
+                  inputs["die_path"], inputs["wafer_path"], self.mod_bodies, current_date, current_time)
+
+    def generate(self, device_name, device_info, out_folder=tpl_folder):
+        """("created", tpl path) or ("skipped", reason)."""
+        inputs, reason = self.resolve(device_name, device_info)
+        if inputs is None:
+            return "skipped", reason
+        tpl_path = os.path.join(out_folder, f"{device_name}.tpl")
+        self.write(device_name, inputs, tpl_path)
+        return "created", tpl_path
+
+
+# ---------- process pool: one TplGenerator per worker ----------
+
+_worker_generator = None
+
+
+def _init_worker(stamp, cache_dir):
+    global _worker_generator
+    _worker_generator = TplGenerator(stamp, cache_dir)
+
+
+def _generate_in_worker(task):
+    device_name, device_info, out_folder = task
+    try:
+        return _worker_generator.generate(device_name, device_info, out_folder)
+    except Exception as e:
+        return "failed", f"{type(e).__name__}: {e}"
+
+
+def generate_all(devices, out_folder=tpl_folder, workers=1, names=None):
+    """
+    Build the plans of every device (or just `names`) and return
+    [(device, status, detail), ...] in dataset order.
+    """
+    if names is not None:
+        wanted = set(names)
+        selected = [name for name in devices if name in wanted]
+        unknown = [(name, "skipped", "not in dataset") for name in names if name not in devices]
+    else:
+        selected = list(devices)
+        unknown = []
+
+    stamp = plan_stamp()
+    tasks = ((name, devices[name], out_folder) for name in selected)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(stamp, mod_cache_dir)) as pool:
+            outcomes = list(pool.map(_generate_in_worker, tasks, chunksize=8))
+    else:
+        _init_worker(stamp, mod_cache_dir)
+        outcomes = [_generate_in_worker(task) for task in tasks]
+
+    return [(name, status, detail) for name, (status, detail) in zip(selected, outcomes)] + unknown
+
+
+def print_summary(results):
+    """One line per skip/failure reason with the devices it hit, instead of per-device prints."""
+    created = sum(1 for _, status, _ in results if status == "created")
+    print(f"Created {created} of {len(results)} test plans.")
+    groups = {}
+    for name, status, detail in results:
+        if status != "created":
+            groups.setdefault(f"{status}: {detail}", []).append(name)
+    for reason, names in sorted(groups.items(), key=lambda kv: -len(kv[1])):
+        print(f"  {len(names):>4}  {reason}: {', '.join(names)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate .tpl test plans from output.json and the tst/die/waf specs.")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="generate plans in N worker processes (default: %(default)s)")
+    parser.add_argument("--devices", nargs="+", metavar="DEVICE",
+                        help="only regenerate these devices")
+    args = parser.parse_args(argv)
+
+    # Load JSON data (output.json, or a sharded dataset folder whose shards are read as they are reached)
+    devices = load_dataset(json_path)
+    results = generate_all(devices, tpl_folder, workers=args.workers, names=args.devices)
+    print_summary(results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import os
+import re
+import json
+import hashlib
+from collections import deque
+from functools import lru_cache
+
+
+def load_mapping(path):
+    """Read a 'key: value' mapping file (type_typ.txt, ...) into an ordered dict; {} if missing."""
+    mapping = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                parts = line.strip().split(":")
+                if len(parts) == 2:
+                    filename, typ_value = parts[0].strip(), parts[1].strip()
+                    mapping[filename] = typ_value
+    return mapping
+
+
+class AhoCorasick:
+    """
+    Multi-pattern substring matcher. Each pattern carries a payload; find()
+    returns the payloads of every pattern that occurs in the text, after one
+    left-to-right pass over it.
+    """
+
+    def __init__(self, patterns):
+        # patterns: iterable of (string, payload)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern, payload in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][ch] = nxt
+                state = nxt
+            self._out[state].append(payload)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        found = []
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.extend(out[state])
+        return found
+
+
+# ---------- fixed rules, applied in this order to every '::' test line ----------
+
+_RX_TRIPLE_QUOTED = re.compile(r'"""(.*?)"""')
+_RX_TRIPLE_QUOTE = re.compile(r'"""')
+_RX_TRAILING_EMPTY_QUOTE = re.compile(r"(\w+)=([^,]*)\"\"")
+_RX_SQ_ARGS = re.compile(r"Sq\([^\)]*\)=")
+_RX_DASH_VALUE = re.compile(r",\w+=\"-\"(?=\s|,|$)")
+_RX_TYPE_KEYWORD = re.compile(r'(?i)\btype(?=\s*=\s*)')
+_RX_DIVIDER = re.compile(r'(?i)\bdivider\b')
+
+# field aliases renamed by each mapping table, in the order the tables are applied
+_RX_TYPE_FIELD = re.compile(r"(Type|Typ)=")
+_RX_PERIMETER_FIELD = re.compile(r"(Perimeter|Perim)=")
+_RX_VLIMIT_FIELD = re.compile(r"(Vlimit|Vlim)=")
+_RX_DTIME_FIELD = re.compile(r"(Dtime|Time)=")
+_RX_SPACE_BEFORE_EQ = re.compile(r" (=...)")
+_RX_EQ_CHAR_SPACE = re.compile(r"(=\S) ")
+
+
+@lru_cache(maxsize=4096)
+def _rx(pattern):
+    # patterns built from mapping values / test names (used as regex, as before);
+    # bounded, since the API process keeps meeting new test names
+    return re.compile(pattern)
+
+
+def _sq_blank(m):
+    return "Sq" + " " * (len(m.group(0)) - 3) + "="
+
+
+def _apply_fixed_rules(line):
+    if '"""' in line:
+        line = _RX_TRIPLE_QUOTED.sub(r'"\1"    ', line)
+        line = _RX_TRIPLE_QUOTE.sub('"" ', line)
+    if '""' in line:
+        line = _RX_TRAILING_EMPTY_QUOTE.sub(r'\1="\2"', line)
+    if 'Sq(' in line:
+        line = _RX_SQ_ARGS.sub(_sq_blank, line)
+    if '"-"' in line:
+        # blank out ',Name="-"' fields; str.replace of the first occurrence, as before
+        for match in _RX_DASH_VALUE.findall(line):
+            line = line.replace(match, " " * len(match), 1)
+    return line
+
+
+def _apply_type(line, replacement):
+    updated = _RX_TYPE_FIELD.sub(replacement + "=", line)
+    spaces_needed = len(line) - len(updated)
+    if spaces_needed > 0:
+        # Ensure space after '=' if missing
+        updated = _rx(rf"({replacement})=").sub(r"\1 =", updated)
+        updated = _RX_SPACE_BEFORE_EQ.sub(r"\1 ", updated)
+    elif spaces_needed < 0:
+        # Ensure no extra spaces before '=', then remove exactly one space after the value
+        updated = _rx(rf"({replacement})\s*=").sub(r"\1=", updated)
+        updated = _rx(rf"({replacement}\S*) ").sub(r"\1", updated)
+    return updated
+
+
+def _apply_perimeter(line, replacement):
+    updated = _RX_PERIMETER_FIELD.sub(replacement + "=", line)
+    spaces_needed = len(line) - len(updated)
+    if spaces_needed > 0:
+        updated = _rx(rf"({replacement})=([\d.]+)").sub(rf"{replacement}=\2    ", updated)
+    elif spaces_needed < 0:
+        updated = _rx(rf"({replacement})\s*=").sub(r"\1=", updated)
+        updated = _RX_EQ_CHAR_SPACE.sub(r"\1", updated)
+    return updated
+
+
+def _shrink_gap(rx, updated, trim):
+    matches = rx.findall(updated)
+    if matches:
+        print("Matches found:", matches)  # Should show spaces in Group 2
+    return rx.sub(lambda m: f"{m.group(1)}{m.group(2)[:-trim]}{m.group(3)}", updated)
+
+
+def _apply_vlimit(line, replacement):
+    updated = _RX_VLIMIT_FIELD.sub(replacement + "=", line)
+    spaces_needed = len(line) - len(updated)
+    if spaces_needed > 0:
+        updated = _rx(rf"({replacement})=([\d.]+)").sub(rf"{replacement}=\2 ", updated)
+    elif spaces_needed < 0:
+        # reduce the gap after the value by exactly 2 spaces
+        updated = _shrink_gap(_rx(rf"({replacement}=\S+)(\s{{2,}})(\S+)"), updated, 2)
+    return updated
+
+
+def _apply_dtime(line, replacement):
+    updated = _RX_DTIME_FIELD.sub(replacement + "=", line)
+    spaces_needed = len(line) - len(updated)
+    if spaces_needed > 0:
+        updated = _rx(rf"({replacement})=([\d.]+)").sub(rf"{replacement}=\2 ", updated)
+    elif spaces_needed < 0:
+        # reduce the gap after the value by exactly 1 space
+        updated = _shrink_gap(_rx(rf"({replacement}=\S+)(\s{{1,}})(\S+)"), updated, 1)
+    return updated
+
+
+_MAP_RULES = (_apply_type, _apply_perimeter, _apply_vlimit, _apply_dtime)
+
+
+class TstLineRewriter:
+    """
+    Rewrites the '::' test-definition lines of .tst mod files for a .tpl.
+
+    The four mapping tables (type_typ, perimeter_perim, vlimit_vlim,
+    dtime_time) are compiled once into a single Aho-Corasick automaton; for
+    each table the first key (in file order) present in the line selects the
+    replacement, exactly as the former per-key `key in line` loops did. All
+    other substitutions are precompiled and applied in their original order,
+    so the output is byte-identical to the previous chain of re.sub calls.
+    """
+
+    # bump when the rewrite rules change so cached bodies (mod_cache) are invalidated
+    RULES_VERSION = 1
+
+    def __init__(self, type_map, perimeter_map, vlimit_map, dtime_map):
+        self.tables = (type_map, perimeter_map, vlimit_map, dtime_map)
+        # identifies the mapping tables + rules, for caches of transformed mod bodies
+        self.fingerprint = hashlib.sha256(
+            json.dumps([self.RULES_VERSION, [list(t.items()) for t in self.tables]]).encode("utf-8")
+        ).hexdigest()
+        self._values = tuple(tuple(table.values()) for table in self.tables)
+        patterns = []
+        for table_idx, table in enumerate(self.tables):
+            for order, key in enumerate(table):
+                patterns.append((key, (table_idx, order)))
+        self._matcher = AhoCorasick(patterns)
+        # '' is "in" every line, so an empty key always wins from its position on
+        self._empty_key = tuple(
+            next((order for order, key in enumerate(table) if key == ""), None) for table in self.tables
+        )
+
+    def _first_keys(self, line, start):
+        """{table_idx: order of first key present} for tables >= start."""
+        best = {}
+        for idx in range(start, 4):
+            if self._empty_key[idx] is not None:
+                best[idx] = self._empty_key[idx]
+        for table_idx, order in self._matcher.find(line):
+            if table_idx >= start and (table_idx not in best or order < best[table_idx]):
+                best[table_idx] = order
+        return best
+
+    def rewrite(self, line, test_count):
+        """Rewrite one line containing '::'; test_count tracks repeated test names within one mod file."""
+        parts = line.split("::")
+        test_name = parts[1].split(":")[0].strip("`")
+
+        if test_name in test_count:
+            test_count[test_name] += 1
+            blank = len(test_name) * ' '
+            line = _rx(rf"`{test_name}`:").sub(f"{blank}   ", line, count=1)
+        else:
+            test_count[test_name] = 0  # First occurrence stays unchanged
+
+        line = _apply_fixed_rules(line)
+
+        best = self._first_keys(line, 0)
+        for table_idx in range(4):
+            order = best.get(table_idx)
+            if order is None:
+                continue
+            updated = _MAP_RULES[table_idx](line, self._values[table_idx][order])
+            if updated != line and table_idx < 3:
+                # later tables must see the rewritten text
+                line = updated
+                best = self._first_keys(line, table_idx + 1)
+            else:
+                line = updated
+
+        line = _RX_TYPE_KEYWORD.sub('Type', line)
+        return _RX_DIVIDER.sub('Devider', line)
+
+    def rewrite_lines(self, lines):
+        """Yield the transformed lines of one mod file."""
+        test_count = {}
+        for line in lines:
+            if "::" in line:
+                yield self.rewrite(line, test_count)
+            else:
+                yield line
@@ -1,7 +1,12 @@
 import os
+import io
 import re
+import argparse
 from datetime import datetime
-import pandas as pd
+from module_catalog import load_module_catalog, module_has_colon
+from spec_sources import DEFAULT_PREFETCH_BUDGET, Prefetcher, add_prefetch_arguments, read_text
+from stage_profiler import NULL_PROFILER, add_profile_arguments, finish_profile, profiler_from_args
+from spec_writer import ColumnWidths, FixedWidthWriter, SpecWriter
 
 die_source_folder = r'X:\etestonline\DIE'
 wafer_source_folder = r'X:\etestonline\WAFER'
@@ -14,9 +19,6 @@ EDR = r'E:\ufiles\CACH\Python_Script_Templates\C9_Master_TEST.xlsx'
 waf_folder = r'Y:\usr\aquq\SPEC_conv\s90\waf'
 die_folder = r'Y:\usr\aquq\SPEC_conv\s90\die'
 
-os.makedirs(waf_folder, exist_ok=True)
-os.makedirs(die_folder, exist_ok=True)
-
 def extract_data(pattern, text, default_value=""):
     match = re.search(pattern, text)
     return match.group(1).strip() if match else default_value
@@ -95,6 +97,9 @@ def parse_wafer_data(wafer_file, wafertest_file, die_file):
         wafertest_content = f.read()
     with open(die_file, 'r') as f:
         die_content = f.read()
+    return parse_wafer_data_text(wafer_content, wafertest_content, die_content)
+
+def parse_wafer_data_text(wafer_content, wafertest_content, die_content):
     wafer_info, reticle_step_size = parse_wafer_info(wafer_content)
     wafertest_info = parse_wafertest_info(wafertest_content)
     align_module = wafertest_info['Align Module']
@@ -114,9 +119,8 @@ def parse_wafer_data(wafer_file, wafertest_file, die_file):
         'center_die': (center_die_x, center_die_y, offset_x, offset_y),
     }
 
-def calculate_max_lengths_waf(parsed_data):
-    max_lengths = [0, 0, 0]
-    attributes = [
+def waf_attribute_cells(parsed_data):
+    return [
         "SIZE=REAL,\"mm\"",
         f"STEPX=REAL,\"um\"     {parsed_data['wafer_info']['Die X Step']}.000000",
         f"STEPY=REAL,\"um\"     {parsed_data['wafer_info']['Die Y Step']}.000000",
@@ -132,28 +136,29 @@ def calculate_max_lengths_waf(parsed_data):
         f"COORDINATE=INTEGER  1",
         f"WAFERSHAPE=INTEGER  1"
     ]
-    for attr in attributes:
+
+def waf_rows_and_widths(parsed_data):
+    """(body rows [(die type, 'c,r')], column widths) from one pass over the dies."""
+    widths = ColumnWidths(3)
+    for attr in waf_attribute_cells(parsed_data):
         parts = attr.split(maxsplit=2)
         if len(parts) >= 2:
-            max_lengths[0] = max(max_lengths[0], len(parts[0]))
-            max_lengths[1] = max(max_lengths[1], len(parts[1]))
-        if len(parts) == 3:
-            max_lengths[2] = max(max_lengths[2], len(parts[2]))
+            widths.add(*parts)
+    rows = []
     for die in parsed_data['reticle_step_size']:
-        column_row = die['Column,Row']
-        die_type = die['Die Type']
-        max_lengths[0] = max(max_lengths[0], len(die_type))
-        max_lengths[1] = max(max_lengths[1], len(column_row))
-    return max_lengths
+        row = (die['Die Type'], die['Column,Row'])
+        widths.add(*row)
+        rows.append(row)
+    return rows, widths.tolist()
+
+def calculate_max_lengths_waf(parsed_data):
+    return waf_rows_and_widths(parsed_data)[1]
 
 def calculate_max_lengths_die(die_body_data):
-    max_lengths = [0, 0]
+    widths = ColumnWidths(2)
     for entry in die_body_data:
-        mod_name = entry[0]
-        coordinates = entry[1] + ',' + entry[2]
-        max_lengths[0] = max(max_lengths[0], len(mod_name))
-        max_lengths[1] = max(max_lengths[1], len(coordinates))
-    return max_lengths
+        widths.add(entry[0], entry[1] + ',' + entry[2])
+    return widths.tolist()
 
 def generate_waf_file(parsed_data, output_filename):
     current_date = datetime.now().strftime("%m/%d/%Y")
@@ -167,55 +172,60 @@ def generate_waf_file(parsed_data, output_filename):
     offset_y = parsed_data['center_die'][3]
     align_die_x = parsed_data['wafertest_info'].get('Align Die X', 0)
     align_die_y = parsed_data['wafertest_info'].get('Align Die Y', 0)
-    max_lengths = calculate_max_lengths_waf(parsed_data)
+    rows, max_lengths = waf_rows_and_widths(parsed_data)
     separator_line = create_dynamic_separator_line_waf(max_lengths)
     separator_length = len(separator_line.strip())
-    waf_content = (
-        f"$Type: Wafer\n"
-        f"$Name: {output_filename}\n"
-        f"$Vers: 1\n"
-        f"$Desc: {output_filename}\n"
-        f"$Date: {current_date}\n"
-        f"$Time: {current_time}\n"
-        f"$User: specs\n"
-        f"{separator_line.strip()}\n"
-        + " ATTRIBUTE".ljust(separator_length) + "\n"
-        + "           SIZE=REAL,\"mm\"      200.000000".ljust(separator_length) + "\n"
-        + ("           STEPX=REAL,\"um\"     " + f"{parsed_data['wafer_info']['Die X Step']}.000000").ljust(separator_length) + "\n"
-        + ("           STEPY=REAL,\"um\"     " + f"{parsed_data['wafer_info']['Die Y Step']}.000000").ljust(separator_length) + "\n"
-        + ("           FLAT=INTEGER,\"deg\"  " + f"{flat_angle}").ljust(separator_length) + "\n"
-        + ("           ALIGNDIEX=INTEGER   " + f"{align_die_x}").ljust(separator_length) + "\n"
-        + ("           ALIGNDIEY=INTEGER   " + f"{align_die_y}").ljust(separator_length) + "\n"
-        + ("           ALIGNMODX=REAL,\"um\" " + f"{align_mod_x}").ljust(separator_length) + "\n"
-        + ("           ALIGNMODY=REAL,\"um\" " + f"{align_mod_y}").ljust(separator_length) + "\n"
-        + ("           CENTERDIEX=INTEGER  " + f"{int(center_die_x)}").ljust(separator_length) + "\n"
-        + ("           CENTERDIEY=INTEGER  " + f"{int(center_die_y)}").ljust(separator_length) + "\n"
-        + ("           OFFSETDIEX=REAL     " + f"{offset_x}").ljust(separator_length) + "\n"
-        + ("           OFFSETDIEY=REAL     " + f"{offset_y}").ljust(separator_length) + "\n"
-        + "           COORDINATE=INTEGER  1".ljust(separator_length) + "\n"
-        + "           WAFERSHAPE=INTEGER  1".ljust(separator_length) + "\n"
-        + " BODY".ljust(separator_length) + "\n"
-    )
-    for die in parsed_data['reticle_step_size']:
-        waf_content += (
-            f"           `{die['Die Type']}`".ljust(10 + max_lengths[0] - 1) +
-            f"   {die['Column,Row']}".ljust(separator_length - (10 + max_lengths[0]) + 1) + "\n"
-        )
-    waf_content += separator_line.strip() + "\n"
+    type_width = 10 + max_lengths[0] - 1
+    coord_width = separator_length - (10 + max_lengths[0]) + 1
     waf_file_path = os.path.join(waf_folder, f"{output_filename}.waf")
-    with open(waf_file_path, 'w', newline='\n') as waf_file:
-        waf_file.write(waf_content)
+    with SpecWriter(waf_file_path) as out:
+        waf = FixedWidthWriter(out, separator_length)
+        waf.write(
+            f"$Type: Wafer\n"
+            f"$Name: {output_filename}\n"
+            f"$Vers: 1\n"
+            f"$Desc: {output_filename}\n"
+            f"$Date: {current_date}\n"
+            f"$Time: {current_time}\n"
+            f"$User: specs\n"
+            f"{separator_line.strip()}\n"
+        )
+        waf.lines([
+            " ATTRIBUTE",
+            "           SIZE=REAL,\"mm\"      200.000000",
+            "           STEPX=REAL,\"um\"     " + f"{parsed_data['wafer_info']['Die X Step']}.000000",
+            "           STEPY=REAL,\"um\"     " + f"{parsed_data['wafer_info']['Die Y Step']}.000000",
+            "           FLAT=INTEGER,\"deg\"  " + f"{flat_angle}",
+            "           ALIGNDIEX=INTEGER   " + f"{align_die_x}",
+            "           ALIGNDIEY=INTEGER   " + f"{align_die_y}",
+            "           ALIGNMODX=REAL,\"um\" " + f"{align_mod_x}",
+            "           ALIGNMODY=REAL,\"um\" " + f"{align_mod_y}",
+            "           CENTERDIEX=INTEGER  " + f"{int(center_die_x)}",
+            "           CENTERDIEY=INTEGER  " + f"{int(center_die_y)}",
+            "           OFFSETDIEX=REAL     " + f"{offset_x}",
+            "           OFFSETDIEY=REAL     " + f"{offset_y}",
+            "           COORDINATE=INTEGER  1",
+            "           WAFERSHAPE=INTEGER  1",
+            " BODY",
+        ])
+        for die_type, column_row in rows:
+            waf.row(((f"           `{die_type}`", type_width), (f"   {column_row}", coord_width)), sep="")
+        waf.write(separator_line.strip() + "\n")
 
-def generate_die_file(die_file_path, output_filename):
-    edr_path = r'E:\ufiles\CACH\Python_Script_Templates\C9_Master_TEST.xlsx'
-    df = pd.read_excel(edr_path)
+def generate_die_file(die_file_path, output_filename, catalog=None, prof=NULL_PROFILER, source_text=None):
+    if catalog is None:
+        catalog = load_module_catalog(EDR)
     current_date = datetime.now().strftime("%m/%d/%Y")
     current_time = datetime.now().strftime("%H:%M:%S")
-    with open(die_file_path, 'r') as f:
-        lines = f.readlines()
+    if source_text is None:
+        with open(die_file_path, 'r') as f:
+            lines = f.readlines()
+    else:
+        lines = io.StringIO(source_text).readlines()
     lines = [line for line in lines if "table end" not in line and line.strip()]
     desc = lines[0].split(":")[1].strip()
     die_body_data = []
+    widths = ColumnWidths(2)  # sized while the rows are collected
     start_index = None
     for i, line in enumerate(lines):
         if line.startswith("*"):
@@ -228,109 +238,137 @@ def generate_die_file(die_file_path, output_filename):
             parts = line.split()
             if len(parts) >= 5:
                 die_body_data.append((parts[0], parts[3], parts[4]))
-    max_lengths = calculate_max_lengths_die(die_body_data)
+                widths.add(parts[0], parts[3] + ',' + parts[4])
+    max_lengths = widths.tolist()
     max_lengths[0] += 2
     separator_line = create_dynamic_separator_line_die(max_lengths)
     separator_length = len(separator_line.strip())
-    die_content = (
-        f"$Type: Die\n"
-        f"$Name: {output_filename}\n"
-        f"$Vers: 1\n"
-        f"$Desc: {output_filename}\n"
-        f"$Date: {current_date}\n"
-        f"$Time: {current_time}\n"
-        f"$User: specs\n"
-        f"{separator_line.strip()}\n"
-        f"{' BODY'.ljust(separator_length)}\n"
-    )
+    ordered = []  # body rows in output order
 
     no_colon = []
     yes_colon = []
     
     # Categorize entries into no_colon and yes_colon
-    for entry in die_body_data:
-        module_name = entry[0]
-        matching_rows = df[df['MODULE_NAME'] == module_name]
-        if not matching_rows.empty:
-            has_colon = False
-            for _, row in matching_rows.iterrows():
-                row_content = ' '.join(row.astype(str).values)
-                if ':' in row_content:
-                    has_colon = True
-                    break
-            if has_colon:
+    with prof.stage("catalog_lookup"):
+        for entry in die_body_data:
+            if module_has_colon(catalog, entry[0]):
                 yes_colon.append(entry)
             else:
                 no_colon.append(entry)
-        else:
-            no_colon.append(entry)
-    
-    # Write no_colon entries first
-    for entry in no_colon:
-        mod_name = f"`{entry[0]}`".ljust(max_lengths[0])
-        coordinates = f"{entry[1]},{entry[2]}".ljust(max_lengths[1] + 1)
-        die_content += f"      {mod_name} {coordinates}".ljust(separator_length) + "\n"
-    
-    # Process yes_colon with dependency ordering
-    temp_yes_colon = yes_colon.copy()
-    processed = set()  # Track modules already added to avoid duplicates
-    
-    while temp_yes_colon:
-        added_something = False
-        for mod in temp_yes_colon[:]:  # Copy to allow modification during iteration
-            # Get all rows for this mod
-            matching_rows = df[df['MODULE_NAME'] == mod[0]]  # mod is a tuple (name, x, y)
-            depends_on_other_mod = False
-            
-            # Check if this mod depends on any other mod in yes_colon
-            for _, row in matching_rows.iterrows():
-                row_content = ' '.join(row.astype(str).values)
-                for other_mod in yes_colon:
-                    if other_mod[0] != mod[0] and other_mod[0] in row_content:  # Compare module names
-                        if other_mod not in processed:
-                            depends_on_other_mod = True
-                            break
-                if depends_on_other_mod:
-                    break
-            
-            # If no dependency or all dependencies are already processed, add it
-            if not depends_on_other_mod and mod not in processed:
-                mod_name = f"`{mod[0]}`".ljust(max_lengths[0])  # Use mod instead of entry
-                coordinates = f"{mod[1]},{mod[2]}".ljust(max_lengths[1] + 1)
-                die_content += f"      {mod_name} {coordinates}".ljust(separator_length) + "\n"
-                processed.add(mod)
-                temp_yes_colon.remove(mod)
-                added_something = True
-        
-        # If no progress is made, handle remaining mods
-        if not added_something:
-            for mod in temp_yes_colon:
-                if mod not in processed:
-                    mod_name = f"`{mod[0]}`".ljust(max_lengths[0])  # Use mod instead of entry
-                    coordinates = f"{mod[1]},{mod[2]}".ljust(max_lengths[1] + 1)
-                    die_content += f"      {mod_name} {coordinates}".ljust(separator_length) + "\n"
+
+    with prof.stage("dependency_order"):
+        # Write no_colon entries first
+        ordered.extend(no_colon)
+
+        # Process yes_colon with dependency ordering
+        temp_yes_colon = yes_colon.copy()
+        processed = set()  # Track modules already added to avoid duplicates
+
+        while temp_yes_colon:
+            added_something = False
+            for mod in temp_yes_colon[:]:  # Copy to allow modification during iteration
+                depends_on_other_mod = False
+
+                # Check if this mod depends on any other mod in yes_colon (mod is a tuple (name, x, y))
+                for row_content in catalog.get(mod[0], ()):
+                    for other_mod in yes_colon:
+                        if other_mod[0] != mod[0] and other_mod[0] in row_content:  # Compare module names
+                            if other_mod not in processed:
+                                depends_on_other_mod = True
+                                break
+                    if depends_on_other_mod:
+                        break
+
+                # If no dependency or all dependencies are already processed, add it
+                if not depends_on_other_mod and mod not in processed:
+                    ordered.append(mod)
                     processed.add(mod)
-            break
+                    temp_yes_colon.remove(mod)
+                    added_something = True
+
+            # If no progress is made, handle remaining mods
+            if not added_something:
+                for mod in temp_yes_colon:
+                    if mod not in processed:
+                        ordered.append(mod)
+                        processed.add(mod)
+                break
 
-    die_content += separator_line.strip() + "\n"
-    
     die_file_path = os.path.join(die_folder, f"{output_filename}.die")
-    with open(die_file_path, 'w', newline='\n') as die_file:
-        die_file.write(die_content)
+    with prof.stage("write"):
+        with SpecWriter(die_file_path) as out:
+            die = FixedWidthWriter(out, separator_length)
+            die.write(
+                f"$Type: Die\n"
+                f"$Name: {output_filename}\n"
+                f"$Vers: 1\n"
+                f"$Desc: {output_filename}\n"
+                f"$Date: {current_date}\n"
+                f"$Time: {current_time}\n"
+                f"$User: specs\n"
+                f"{separator_line.strip()}\n"
+            )
+            die.line(" BODY")
+            name_width = max_lengths[0] + 6  # "      `name`" padded to the name column
+            coord_width = max_lengths[1] + 1
+            for mod in ordered:
+                die.row(((f"      `{mod[0]}`", name_width), (f"{mod[1]},{mod[2]}", coord_width)))
+            die.write(separator_line.strip() + "\n")
+
+def source_paths(die_file):
+    """DIE, WAFER and WAFERTEST source paths of one device."""
+    return [os.path.join(die_source_folder, die_file),
+            os.path.join(wafer_source_folder, die_file),
+            os.path.join(wafertest_source_folder, die_file)]
 
-def process_files():
+def translate_device(die_file, catalog, prof=NULL_PROFILER, sources=None):
+    """Write <die_file>.die and <die_file>.waf for one device (sources: prefetched {path: bytes})."""
+    die_file_path, wafer_file_path, wafertest_file_path = source_paths(die_file)
+    with prof.stage("read"):
+        wafer_content = read_text(wafer_file_path, prof, sources=sources)
+        wafertest_content = read_text(wafertest_file_path, prof, sources=sources)
+        die_content = read_text(die_file_path, prof, sources=sources)
+    with prof.stage("coords"):
+        parsed_data = parse_wafer_data_text(wafer_content, wafertest_content, die_content)
+    generate_die_file(die_file_path, die_file, catalog, prof, die_content)
+    with prof.stage("write"):
+        generate_waf_file(parsed_data, die_file)
+
+def process_files(prof=NULL_PROFILER, prefetch_workers=0, prefetch_budget=DEFAULT_PREFETCH_BUDGET):
+    os.makedirs(waf_folder, exist_ok=True)
+    os.makedirs(die_folder, exist_ok=True)
+    # Workbook is parsed once per run (and normally served from its cached sidecar)
+    with prof.stage("catalog_load"):
+        catalog = load_module_catalog(EDR)
     die_files = os.listdir(die_source_folder)
-    for die_file in die_files:
-        die_file_path = os.path.join(die_source_folder, die_file)
-        wafer_file_path = os.path.join(wafer_source_folder, die_file)
-        wafertest_file_path = os.path.join(wafertest_source_folder, die_file)
-        if os.path.isfile(die_file_path) and os.path.isfile(wafer_file_path) and os.path.isfile(wafertest_file_path):
+
+    # optionally read upcoming devices' files on background threads while this one is processed
+    if prefetch_workers > 0:
+        feed = Prefetcher(((f, source_paths(f)) for f in die_files), prefetch_workers, prefetch_budget)
+    else:
+        feed = ((f, None) for f in die_files)
+
+    for die_file, sources in feed:
+        if sources is not None:
+            all_present = all(data is not None for data in sources.values())
+        else:
+            all_present = all(os.path.isfile(path) for path in source_paths(die_file))
+        if all_present:
             print(f"Processing device: {die_file}")
             try:
-                parsed_data = parse_wafer_data(wafer_file_path, wafertest_file_path, die_file_path)
-                generate_die_file(die_file_path, die_file)
-                generate_waf_file(parsed_data, die_file)
+                with prof.device(die_file):
+                    translate_device(die_file, catalog, prof, sources)
             except Exception as e:
                 print(f"Error processing device {die_file}: {e}")
 
-process_files()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Translate DIE/WAFER/WAFERTEST specs into .die/.waf files.")
+    add_profile_arguments(parser)
+    add_prefetch_arguments(parser)
+    args = parser.parse_args(argv)
+    prof = profiler_from_args(args)
+    process_files(prof, args.prefetch_workers, args.prefetch_mb << 20)
+    finish_profile(prof, args)
+
+if __name__ == "__main__":
+    main()